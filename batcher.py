@@ -0,0 +1,181 @@
+import threading
+from config import *
+
+# ==============================
+# ADAPTIVE DETAIL BATCHER
+# ==============================
+
+class AdaptiveBatcher:
+    """
+    Membagi line item 1..total_row menjadi window (first_index, last_index)
+    yang ukurannya menyesuaikan estimasi token output per row dari batch
+    sebelumnya dalam job yang sama.
+
+    Window yang terpotong (MAX_TOKENS) atau gagal di-parse dipecah dua
+    dan dikerjakan ulang lebih dulu. Thread-safe (dipakai dari executor).
+
+    done_windows = window yang sudah selesai (resume dari checkpoint),
+    index di dalamnya tidak akan dibagikan lagi.
+
+    Ukuran window bergantung pada urutan batch selesai (tidak deterministik),
+    padahal prompt detail (first..last) adalah bagian dari cache key Gemini.
+    Karena itu window yang dibagikan dicatat di "planned"; run berikutnya
+    untuk PDF yang sama memberikan planned_windows tersebut sehingga
+    window & prompt persis sama (semua cache hit). Split / tail tetap
+    dihasilkan ulang dari response (cache) yang sama.
+    """
+
+    def __init__(
+        self,
+        total_row,
+        initial_size=DETAIL_BATCH_INITIAL_SIZE,
+        min_size=DETAIL_BATCH_MIN_SIZE,
+        max_size=DETAIL_BATCH_MAX_SIZE,
+        target_output_tokens=DETAIL_BATCH_TARGET_OUTPUT_TOKENS,
+        done_windows=None,
+        planned_windows=None,
+    ):
+        self.total_row = total_row
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.target_output_tokens = target_output_tokens
+
+        self.size = min(max(initial_size, self.min_size), self.max_size)
+        self.tokens_per_row = None
+
+        self._next_index = 1
+        self._retry = []
+        self._done = sorted((int(f), int(l)) for f, l in (done_windows or []))
+        self._plan = sorted((int(f), int(l)) for f, l in (planned_windows or []))
+        self._lock = threading.Lock()
+
+        # window top-level (bukan split / tail) yang sudah dibagikan, urut
+        self.planned = []
+
+        # (first_index, last_index, status, output_tokens) untuk log tuning
+        self.history = []
+
+    def next_window(self):
+        with self._lock:
+            if self._retry:
+                return self._retry.pop(0)
+
+            while self._plan:
+                window = self._next_planned_window()
+                if window is not None:
+                    return window
+
+            first_index = self._skip_done(self._next_index)
+
+            if first_index > self.total_row:
+                self._next_index = first_index
+                return None
+
+            last_index = min(first_index + self.size - 1, self.total_row)
+
+            # jangan melewati window yang sudah selesai
+            for done_first, _ in self._done:
+                if done_first > first_index:
+                    last_index = min(last_index, done_first - 1)
+                    break
+
+            self._next_index = last_index + 1
+            self.planned.append((first_index, last_index))
+
+            return first_index, last_index
+
+    def _next_planned_window(self):
+        """
+        Window berikutnya dari rencana run sebelumnya, dipotong kalau
+        sebagian sudah selesai (resume). None kalau window ini habis.
+        """
+        plan_first, plan_last = self._plan.pop(0)
+
+        first_index = self._skip_done(plan_first)
+        if first_index > plan_last:
+            return None
+
+        last_index = plan_last
+        for done_first, _ in self._done:
+            if done_first > first_index:
+                last_index = min(last_index, done_first - 1)
+                break
+
+        if last_index < plan_last:
+            # sisa window setelah bagian yang sudah selesai
+            self._plan.insert(0, (last_index + 1, plan_last))
+
+        self._next_index = max(self._next_index, last_index + 1)
+        self.planned.append((first_index, last_index))
+
+        return first_index, last_index
+
+    def _skip_done(self, index):
+        for done_first, done_last in self._done:
+            if done_first <= index <= done_last:
+                index = done_last + 1
+        return index
+
+    def record(self, first_index, last_index, output_tokens):
+        """
+        Update estimasi token/row (moving average) lalu hitung ulang ukuran window.
+        """
+        rows = last_index - first_index + 1
+
+        with self._lock:
+            self.history.append((first_index, last_index, "ok", output_tokens))
+
+            if not output_tokens or rows <= 0:
+                return
+
+            observed = output_tokens / rows
+
+            if self.tokens_per_row is None:
+                self.tokens_per_row = observed
+            else:
+                self.tokens_per_row = 0.7 * self.tokens_per_row + 0.3 * observed
+
+            size = int(self.target_output_tokens / self.tokens_per_row)
+            self.size = min(max(size, self.min_size), self.max_size)
+
+    def split(self, first_index, last_index, reason):
+        """
+        Pecah window jadi 2 dan antrikan ulang. Ukuran window berikutnya
+        juga diperkecil supaya window baru tidak mengulang masalah yang sama.
+        """
+        if last_index <= first_index:
+            raise Exception(
+                f"Batch {first_index}-{last_index} tidak bisa dipecah lagi ({reason})"
+            )
+
+        mid = (first_index + last_index) // 2
+
+        with self._lock:
+            self.history.append((first_index, last_index, reason, None))
+            self._retry[:0] = [(first_index, mid), (mid + 1, last_index)]
+            self.size = max(self.min_size, min(self.size, mid - first_index + 1))
+
+    def requeue(self, first_index, last_index):
+        """
+        Antrikan ulang sisa window (tail) tanpa dipecah, misal setelah
+        output streaming terpotong di tengah.
+        """
+        with self._lock:
+            self._retry.insert(0, (first_index, last_index))
+
+    def summary(self):
+        with self._lock:
+            return {
+                "total_row": self.total_row,
+                "tokens_per_row": round(self.tokens_per_row, 1) if self.tokens_per_row else None,
+                "windows": [
+                    {
+                        "first_index": f,
+                        "last_index": l,
+                        "size": l - f + 1,
+                        "status": status,
+                        "output_tokens": tokens,
+                    }
+                    for f, l, status, tokens in self.history
+                ],
+            }
@@ -0,0 +1,536 @@
+"""
+Benchmark validation engine vs rantai _validate_* lama.
+
+    python bench_validation.py [jumlah_row]
+
+Data sintetis (default 10.000 row) dengan null, angka ber-koma,
+selisih total, BL/COO sebagian, dsb. Hasil kedua versi dicek identik.
+"""
+
+import sys
+import copy
+import time
+import random
+
+from validation import validate_detail_rows, _init_match_fields, _add_error, _to_float
+
+# ==============================
+# LEGACY VALIDATION (REFERENSI)
+# ==============================
+#
+# Rantai validasi lama (sebelum rule table), tidak dipakai pipeline.
+# Disimpan di sini sebagai referensi perilaku untuk membandingkan output.
+
+# ==============================
+# INVOICE VALIDATION 
+# ==============================
+
+def _validate_invoice(detail_rows): #aman
+
+    mandatory_fields = [
+        "inv_invoice_no",
+        "inv_invoice_date",
+        "inv_customer_po_no",
+        "inv_vendor_name",
+        "inv_vendor_address",
+        "inv_spart_item_no",
+        "inv_description",
+        "inv_quantity",
+        "inv_quantity_unit",
+        "inv_unit_price",
+        "inv_price_unit",
+        "inv_amount",
+        "inv_amount_unit",
+    ]
+
+    for row in detail_rows:
+
+        for f in mandatory_fields:
+            if row.get(f) in (None, "", "null"):
+                _add_error(row, f"{f} tidak boleh null")
+
+        qty = _to_float(row.get("inv_quantity"))
+        price = _to_float(row.get("inv_unit_price"))
+        amount = _to_float(row.get("inv_amount"))
+
+        if qty is not None and price is not None and amount is not None:
+            calc = round(qty * price, 2)
+            if round(amount, 2) != calc:
+                _add_error(
+                    row,
+                    f"inv_amount ({amount}) tidak sesuai dengan perhitungan ({qty} x {price} = {calc})"
+                )
+
+    return detail_rows
+
+def _validate_invoice_totals(detail_rows): #stengah aman
+
+    invoice_total_map = {
+        "inv_total_quantity": "inv_quantity",
+        "inv_total_amount": "inv_amount",
+    }
+
+    cross_doc_total_map = {
+        "inv_total_nw": "pl_nw",
+        "inv_total_gw": "pl_gw",
+        "inv_total_volume": "pl_volume",
+        "inv_total_package": "pl_package_count",
+    }
+
+    # HITUNG TOTAL INTERNAL INVOICE
+    calculated = {}
+
+    for total_field, detail_field in invoice_total_map.items():
+        total = 0.0
+        for row in detail_rows:
+            val = _to_float(row.get(detail_field))
+            if val is not None:
+                total += val
+        calculated[total_field] = round(total, 2)
+
+    # HITUNG TOTAL CROSS DOC (PL)
+    pl_available = any(
+        row.get("pl_invoice_no") not in (None, "", "null")
+        for row in detail_rows
+    )
+
+    if pl_available:
+        for total_field, detail_field in cross_doc_total_map.items():
+            total = 0.0
+            for row in detail_rows:
+                val = _to_float(row.get(detail_field))
+                if val is not None:
+                    total += val
+            calculated[total_field] = round(total, 2)
+
+    # VALIDASI PER LINE
+    for row in detail_rows:
+
+        for total_field, calc_value in calculated.items():
+
+            extracted = _to_float(row.get(total_field))
+            if extracted is None:
+                continue
+
+            if round(extracted, 2) != calc_value:
+                _add_error(
+                    row,
+                    f"{total_field} ({extracted}) tidak sesuai dengan total hasil perhitungan ({calc_value})"
+                )
+
+    return detail_rows
+
+# ==============================
+# PACKING LIST VALIDATION (aman)
+# ==============================
+
+def _validate_pl(detail_rows): #aman
+
+    mandatory = [
+        "pl_invoice_no",
+        "pl_invoice_date",
+        "pl_messrs",
+        "pl_messrs_address",
+        "pl_item_no",
+        "pl_description",
+        "pl_quantity",
+        "pl_package_unit",
+        "pl_package_count",
+        "pl_weight_unit",
+        "pl_nw",
+        "pl_gw",
+        "pl_volume_unit",
+        "pl_volume",
+    ]
+
+    for row in detail_rows:
+
+        for f in mandatory:
+            if row.get(f) in (None, "", "null"):
+                _add_error(row, f"{f} tidak boleh null")
+
+        if row.get("pl_invoice_no") != row.get("inv_invoice_no"):
+            _add_error(row, "pl_invoice_no tidak sama dengan inv_invoice_no")
+
+        if row.get("pl_invoice_date") != row.get("inv_invoice_date"):
+            _add_error(row, "pl_invoice_date tidak sama dengan inv_invoice_date")
+
+        if row.get("pl_messrs") != row.get("inv_messrs"):
+            _add_error(row, "pl_messrs tidak sama dengan inv_messrs")
+
+        if row.get("pl_messrs_address") != row.get("inv_messrs_address"):
+            _add_error(row, "pl_messrs_address tidak sama dengan inv_messrs_address")
+
+    return detail_rows
+
+def _validate_pl_totals(detail_rows):
+
+    total_map = {
+        "pl_total_quantity": "pl_quantity",
+        "pl_total_amount": "pl_amount",
+        "pl_total_nw": "pl_nw",
+        "pl_total_gw": "pl_gw",
+        "pl_total_volume": "pl_volume",
+        "pl_total_package": "pl_package_count",
+    }
+
+    calculated = {}
+
+    for total_field, detail_field in total_map.items():
+        total = 0.0
+        for row in detail_rows:
+            val = _to_float(row.get(detail_field))
+            if val is not None:
+                total += val
+        calculated[total_field] = round(total, 2)
+
+    for row in detail_rows:
+        for total_field in total_map.keys():
+            extracted = _to_float(row.get(total_field))
+            if extracted is None:
+                continue
+
+            if round(extracted, 2) != calculated[total_field]:
+                _add_error(
+                    row,
+                    f"{total_field} ({extracted}) tidak sesuai dengan total hasil perhitungan ({calculated[total_field]})"
+                )
+
+    return detail_rows
+
+# ==============================
+# BILL OF LADING VALIDATION (aman)
+# ==============================
+def _validate_bl(detail_rows):
+
+    for row in detail_rows:
+
+        if row.get("bl_no") in (None, "", "null"):
+            continue
+
+        if row.get("bl_seller_name") in (None, "", "null"):
+            row["bl_seller_name"] = row.get("bl_shipper_name")
+
+        if row.get("bl_seller_address") in (None, "", "null"):
+            row["bl_seller_address"] = row.get("bl_shipper_address")
+
+        mandatory = [
+            "bl_shipper_name",
+            "bl_shipper_address",
+            "bl_no",
+            "bl_date",
+            "bl_consignee_name",
+            "bl_consignee_address",
+            "bl_vessel",
+            "bl_voyage_no",
+            "bl_port_of_loading",
+            "bl_port_of_destination",
+        ]
+
+        for f in mandatory:
+            if row.get(f) in (None, "", "null"):
+                _add_error(row, f"{f} tidak boleh null (BL tersedia)")
+
+        if str(row.get("bl_seller_name","")).strip().lower() != \
+            str(row.get("inv_vendor_name","")).strip().lower():
+            _add_error(row, "bl_seller_name tidak sama dengan inv_vendor_name")
+
+    return detail_rows
+
+# ==============================
+# COO VALIDATION
+# ==============================
+
+def _validate_coo(detail_rows):
+
+    for row in detail_rows:
+
+        if row.get("coo_no") in (None, "", "null"):
+            continue
+        
+        # FIELD WAJIB
+        mandatory = [
+            "coo_no",
+            "coo_form_type",
+            "coo_invoice_no",
+            "coo_invoice_date",
+            "coo_shipper_name",
+            "coo_shipper_address",
+            "coo_consignee_name",
+            "coo_consignee_address",
+            "coo_seq",
+            "coo_description",
+            "coo_hs_code",
+            "coo_quantity",
+            "coo_unit",
+            "coo_criteria",
+            "coo_origin_country",
+        ]
+
+        for f in mandatory:
+            if row.get(f) in (None, "", "null"):
+                _add_error(row, f"{f} tidak boleh null (COO tersedia)")
+
+        # CONDITIONAL WAJIB
+        criteria = str(row.get("coo_criteria", "")).strip().upper()
+
+        if criteria == "RVC":
+            if row.get("coo_amount") in (None, "", "null"):
+                _add_error(row, "coo_amount wajib jika criteria = RVC")
+            if row.get("coo_amount_unit") in (None, "", "null"):
+                _add_error(row, "coo_amount_unit wajib jika criteria = RVC")
+
+        if criteria == "PE":
+            if row.get("coo_gw") in (None, "", "null"):
+                _add_error(row, "coo_gw wajib jika criteria = PE")
+            if row.get("coo_gw_unit") in (None, "", "null"):
+                _add_error(row, "coo_gw_unit wajib jika criteria = PE")
+
+        # VALIDASI TERHADAP INVOICE
+        # -------- numeric compare --------
+        coo_qty = _to_float(row.get("coo_quantity"))
+        inv_qty = _to_float(row.get("inv_quantity"))
+
+        if coo_qty is not None and inv_qty is not None:
+            if round(coo_qty, 2) != round(inv_qty, 2):
+                _add_error(
+                    row,
+                    f"coo_quantity ({coo_qty}) tidak sama dengan inv_quantity ({inv_qty})"
+                )
+
+        coo_amount = _to_float(row.get("coo_amount"))
+        inv_amount = _to_float(row.get("inv_amount"))
+
+        if coo_amount is not None and inv_amount is not None:
+            if round(coo_amount, 2) != round(inv_amount, 2):
+                _add_error(
+                    row,
+                    f"coo_amount ({coo_amount}) tidak sama dengan inv_amount ({inv_amount})"
+                )
+
+        coo_gw = _to_float(row.get("coo_gw"))
+        inv_gw = _to_float(row.get("inv_gw"))
+
+        if coo_gw is not None and inv_gw is not None:
+            if round(coo_gw, 2) != round(inv_gw, 2):
+                _add_error(
+                    row,
+                    f"coo_gw ({coo_gw}) tidak sama dengan inv_gw ({inv_gw})"
+                )
+
+        # -------- string compare --------
+        coo_amount_unit = str(row.get("coo_amount_unit") or "").strip()
+        inv_amount_unit = str(row.get("inv_amount_unit") or "").strip()
+
+        if coo_amount_unit and inv_amount_unit:
+            if coo_amount_unit != inv_amount_unit:
+                _add_error(
+                    row,
+                    f"coo_amount_unit ({coo_amount_unit}) tidak sama dengan inv_amount_unit ({inv_amount_unit})"
+                )
+
+        coo_gw_unit = str(row.get("coo_gw_unit") or "").strip()
+        inv_gw_unit = str(row.get("inv_gw_unit") or "").strip()
+
+        if coo_gw_unit and inv_gw_unit:
+            if coo_gw_unit != inv_gw_unit:
+                _add_error(
+                    row,
+                    f"coo_gw_unit ({coo_gw_unit}) tidak sama dengan inv_gw_unit ({inv_gw_unit})"
+                )
+
+    return detail_rows
+
+
+
+def _maybe(rng, value, p_null=0.03):
+    r = rng.random()
+    if r < p_null:
+        return rng.choice(["null", "", None])
+    return value
+
+
+def _synthetic_rows(n, seed=42):
+    rng = random.Random(seed)
+    rows = []
+
+    for i in range(1, n + 1):
+        qty = rng.randint(1, 500)
+        price = round(rng.uniform(0.5, 2000), 2)
+        amount = round(qty * price, 2) if rng.random() > 0.05 else round(qty * price + 1, 2)
+        nw = round(rng.uniform(0.1, 50), 3)
+        gw = round(nw + rng.uniform(0, 5), 3)
+        has_bl = rng.random() > 0.3
+        has_coo = rng.random() > 0.5
+        criteria = rng.choice(["RVC", "PE", "WO", None])
+
+        row = {
+            "inv_invoice_no": _maybe(rng, "INV-001"),
+            "inv_invoice_date": _maybe(rng, "2025-01-02"),
+            "inv_customer_po_no": _maybe(rng, f"PO{rng.randint(1, 20)}"),
+            "inv_vendor_name": _maybe(rng, "ACME CO LTD"),
+            "inv_vendor_address": _maybe(rng, "1 ROAD"),
+            "inv_messrs": "PT INSERA SENA",
+            "inv_messrs_address": "SIDOARJO",
+            "inv_spart_item_no": _maybe(rng, f"SP{i}"),
+            "inv_description": _maybe(rng, f"ITEM {i}"),
+            "inv_quantity": _maybe(rng, qty if rng.random() > 0.2 else f"{qty:,}"),
+            "inv_quantity_unit": _maybe(rng, "PCS"),
+            "inv_unit_price": _maybe(rng, price),
+            "inv_price_unit": _maybe(rng, "USD"),
+            "inv_amount": _maybe(rng, amount if rng.random() > 0.2 else f"{amount:,.2f}"),
+            "inv_amount_unit": _maybe(rng, "USD"),
+            "inv_gw": _maybe(rng, gw),
+            "inv_gw_unit": _maybe(rng, "KG"),
+            "inv_total_quantity": _maybe(rng, 123456),
+            "inv_total_amount": _maybe(rng, 9999999.99),
+            "inv_total_nw": _maybe(rng, "null", 0),
+            "inv_total_gw": _maybe(rng, 5000.5),
+            "inv_total_volume": _maybe(rng, 12.5),
+            "inv_total_package": _maybe(rng, 100),
+            "pl_invoice_no": _maybe(rng, "INV-001" if rng.random() > 0.02 else "INV-002"),
+            "pl_invoice_date": _maybe(rng, "2025-01-02"),
+            "pl_messrs": _maybe(rng, "PT INSERA SENA"),
+            "pl_messrs_address": _maybe(rng, "SIDOARJO"),
+            "pl_item_no": _maybe(rng, i),
+            "pl_description": _maybe(rng, f"ITEM {i}"),
+            "pl_quantity": _maybe(rng, qty),
+            "pl_package_unit": _maybe(rng, "CT"),
+            "pl_package_count": _maybe(rng, rng.randint(1, 5)),
+            "pl_weight_unit": _maybe(rng, "KG"),
+            "pl_nw": _maybe(rng, nw),
+            "pl_gw": _maybe(rng, gw),
+            "pl_volume_unit": _maybe(rng, "CBM"),
+            "pl_volume": _maybe(rng, round(rng.uniform(0.01, 1), 3)),
+            "pl_amount": _maybe(rng, amount),
+            "pl_total_quantity": _maybe(rng, 123456),
+            "pl_total_amount": _maybe(rng, "null", 0),
+            "pl_total_nw": _maybe(rng, 2500.25),
+            "pl_total_gw": _maybe(rng, 5000.5),
+            "pl_total_volume": _maybe(rng, 12.5),
+            "pl_total_package": _maybe(rng, 100),
+        }
+
+        if has_bl:
+            row.update({
+                "bl_shipper_name": _maybe(rng, "ACME CO LTD"),
+                "bl_shipper_address": _maybe(rng, "1 ROAD"),
+                "bl_no": f"BL{i % 3}",
+                "bl_date": _maybe(rng, "2025-01-05"),
+                "bl_consignee_name": _maybe(rng, "PT INSERA SENA"),
+                "bl_consignee_address": _maybe(rng, "SIDOARJO"),
+                "bl_seller_name": _maybe(rng, "acme co ltd ", 0.3),
+                "bl_seller_address": _maybe(rng, "1 ROAD", 0.3),
+                "bl_vessel": _maybe(rng, "VESSEL"),
+                "bl_voyage_no": _maybe(rng, "V1"),
+                "bl_port_of_loading": _maybe(rng, "SHANGHAI"),
+                "bl_port_of_destination": _maybe(rng, "SURABAYA"),
+            })
+        else:
+            row["bl_no"] = "null"
+
+        if has_coo:
+            row.update({
+                "coo_no": f"COO{i % 2}",
+                "coo_form_type": _maybe(rng, "E"),
+                "coo_invoice_no": _maybe(rng, "INV-001"),
+                "coo_invoice_date": _maybe(rng, "2025-01-02"),
+                "coo_shipper_name": _maybe(rng, "ACME CO LTD"),
+                "coo_shipper_address": _maybe(rng, "1 ROAD"),
+                "coo_consignee_name": _maybe(rng, "PT INSERA SENA"),
+                "coo_consignee_address": _maybe(rng, "SIDOARJO"),
+                "coo_seq": _maybe(rng, i),
+                "coo_description": _maybe(rng, f"ITEM {i}"),
+                "coo_hs_code": _maybe(rng, "8471"),
+                "coo_quantity": _maybe(rng, qty if rng.random() > 0.05 else qty + 1),
+                "coo_unit": _maybe(rng, "PCS"),
+                "coo_amount": _maybe(rng, amount, 0.2),
+                "coo_amount_unit": _maybe(rng, rng.choice(["USD", "USD", "EUR"]), 0.2),
+                "coo_gw": _maybe(rng, gw, 0.2),
+                "coo_gw_unit": _maybe(rng, "KG", 0.2),
+                "coo_criteria": _maybe(rng, criteria),
+                "coo_origin_country": _maybe(rng, "CHINA"),
+            })
+        else:
+            row["coo_no"] = "null"
+
+        rows.append(row)
+
+    # sebagian besar total sesuai penjumlahan (kasus normal), sisanya selisih
+    totals = {
+        "inv_total_quantity": "inv_quantity",
+        "inv_total_amount": "inv_amount",
+        "inv_total_gw": "pl_gw",
+        "inv_total_volume": "pl_volume",
+        "inv_total_package": "pl_package_count",
+        "pl_total_quantity": "pl_quantity",
+        "pl_total_nw": "pl_nw",
+        "pl_total_gw": "pl_gw",
+        "pl_total_volume": "pl_volume",
+        "pl_total_package": "pl_package_count",
+    }
+
+    for total_field, detail_field in totals.items():
+        total = 0.0
+        for row in rows:
+            try:
+                total += float(str(row[detail_field]).replace(",", ""))
+            except ValueError:
+                pass
+        total = round(total, 2)
+        for row in rows:
+            if row[total_field] not in (None, "", "null") and rng.random() > 0.01:
+                row[total_field] = total
+
+    return rows
+
+
+def _legacy(rows):
+    rows = _init_match_fields(rows)
+    rows = _validate_invoice(rows)
+    rows = _validate_invoice_totals(rows)
+    rows = _validate_pl(rows)
+    rows = _validate_pl_totals(rows)
+    rows = _validate_bl(rows)
+    rows = _validate_coo(rows)
+    return rows
+
+
+def _best_of(fn, rows, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        data = copy.deepcopy(rows)
+        start = time.perf_counter()
+        result = fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    repeat = 5
+    rows = _synthetic_rows(n)
+
+    legacy_sec, legacy_rows = _best_of(_legacy, rows, repeat)
+    engine_sec, engine_rows = _best_of(validate_detail_rows, rows, repeat)
+
+    # bandingkan termasuk urutan key (urutan kolom CSV)
+    if [list(r.items()) for r in legacy_rows] != [list(r.items()) for r in engine_rows]:
+        for i, (a, b) in enumerate(zip(legacy_rows, engine_rows)):
+            if list(a.items()) != list(b.items()):
+                raise SystemExit(f"HASIL BERBEDA di row {i}:\n{a}\n{b}")
+        raise SystemExit("HASIL BERBEDA")
+
+    failed = sum(1 for r in engine_rows if r["match_score"] == "false")
+
+    print(f"rows              : {n} ({failed} gagal validasi)")
+    print(f"legacy (best of {repeat}): {legacy_sec * 1000:.1f} ms")
+    print(f"engine (best of {repeat}): {engine_sec * 1000:.1f} ms")
+    print(f"speedup           : {legacy_sec / engine_sec:.2f}x")
+    print("output identik    : ya")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import re
+import uuid
+import zipfile
+import posixpath
+from google.cloud import storage
+from config import *
+from function import job_input_uri, upload_job_inputs
+from jobs import enqueue_job, new_job_id
+
+storage_client = storage.Client()
+
+DOC_TYPES = list(BULK_DOC_KEYWORDS)
+
+# kata yang sering ikut di nama dokumen, bukan bagian nama shipment
+FILLER_TOKENS = {"list", "bill", "of", "certificate", "commercial", "document", "doc", "copy"}
+
+# ==============================
+# PAIRING DOKUMEN PER SHIPMENT
+# ==============================
+#
+# Konvensi nama file:
+# - folder per shipment: SHP001/invoice.pdf, SHP001/packing list.pdf, SHP001/BL.pdf
+# - atau flat: SHP001_invoice.pdf, SHP001_packing_list.pdf, SHP001_bl.pdf, SHP001_coo.pdf
+# Jenis dokumen ditentukan dari token keyword BULK_DOC_KEYWORDS di akhir
+# nama file, nama shipment (flat) = semua sebelum token tersebut, jadi
+# nama shipment yang mengandung keyword (INV-001_invoice.pdf) tetap benar.
+
+def _tokens(stem):
+    return [(m.group(0).lower(), m.start()) for m in re.finditer(r"[A-Za-z0-9]+", stem)]
+
+
+def _match_doc_types(tokens):
+    compact = "".join(tokens)
+    return [
+        doc_type for doc_type, keywords in BULK_DOC_KEYWORDS.items()
+        if any(k in tokens or (len(k) > 3 and k in compact) for k in keywords)
+    ]
+
+
+def _split_doc_suffix(stem):
+    """
+    Pisahkan token jenis dokumen di akhir stem (keyword / filler berurutan).
+    Return (sisa stem di depannya, jenis dokumen); jenis None kalau
+    suffix tidak ada / ambigu.
+    """
+    keywords = {k for values in BULK_DOC_KEYWORDS.values() for k in values}
+    tokens = _tokens(stem)
+
+    start = len(tokens)
+    while start > 0 and (tokens[start - 1][0] in keywords or tokens[start - 1][0] in FILLER_TOKENS):
+        start -= 1
+
+    suffix = [t for t, _ in tokens[start:]]
+    matches = _match_doc_types(suffix) if suffix else []
+    head = stem[:tokens[start][1]] if start < len(tokens) else stem
+
+    return head.strip(" _-."), (matches[0] if len(matches) == 1 else None)
+
+
+def detect_doc_type(filename):
+    """
+    Jenis dokumen dari nama file (None kalau tidak dikenali / ambigu).
+    Dalam folder per shipment, nama file tanpa suffix jenis dokumen
+    (misal "Commercial Invoice SHP001.pdf") dicek dari semua token.
+    """
+    stem = posixpath.splitext(posixpath.basename(filename))[0]
+    _, doc_type = _split_doc_suffix(stem)
+
+    if doc_type is None and posixpath.dirname(filename).strip("/"):
+        matches = _match_doc_types([t for t, _ in _tokens(stem)])
+        doc_type = matches[0] if len(matches) == 1 else None
+
+    return doc_type
+
+
+def shipment_key(path):
+    """
+    Nama shipment: folder (relatif) kalau ada, kalau flat diambil dari
+    nama file sebelum token jenis dokumen di akhir.
+    """
+    folder = posixpath.dirname(path).strip("/")
+    if folder:
+        return folder
+
+    stem = posixpath.splitext(posixpath.basename(path))[0]
+    head, doc_type = _split_doc_suffix(stem)
+
+    return head if doc_type else None
+
+
+def pair_documents(items):
+    """
+    items = [(path relatif, source)], source = nama member ZIP atau gs:// URI.
+
+    Return (shipments, skipped):
+    - shipments: [{"name", "documents": {doc_type: source}, "error"}]
+      urut nama; error terisi kalau shipment tidak bisa diproses
+    - skipped: [(path, alasan)] file yang tidak bisa dipasangkan
+    """
+    grouped = {}
+    skipped = []
+
+    for path, source in items:
+        if not path.lower().endswith(".pdf"):
+            skipped.append((path, "bukan PDF"))
+            continue
+
+        doc_type = detect_doc_type(path)
+        if doc_type is None:
+            skipped.append((path, "jenis dokumen tidak dikenali"))
+            continue
+
+        key = shipment_key(path)
+        if not key:
+            skipped.append((path, "nama shipment tidak ditemukan"))
+            continue
+
+        shipment = grouped.setdefault(key, {"documents": {}, "errors": []})
+        if doc_type in shipment["documents"]:
+            shipment["errors"].append(f"{doc_type} lebih dari 1 file")
+            continue
+        shipment["documents"][doc_type] = source
+
+    shipments = []
+    for key in sorted(grouped):
+        shipment = grouped[key]
+        errors = shipment["errors"]
+
+        missing = [d for d in ("invoice", "packing_list") if d not in shipment["documents"]]
+        if missing:
+            errors.append("dokumen wajib tidak ada: " + ", ".join(missing))
+
+        shipments.append({
+            # nama dipakai juga sebagai nama file CSV → tanpa "/"
+            "name": key.replace("/", "_"),
+            "documents": {d: shipment["documents"][d] for d in DOC_TYPES if d in shipment["documents"]},
+            "error": "; ".join(errors) or None,
+        })
+
+    return shipments, skipped
+
+# ==============================
+# SUMBER: ZIP / GCS PREFIX
+# ==============================
+
+def scan_zip(zip_file):
+    """
+    zip_file: path / file-like ZIP. Member __MACOSX & folder diabaikan.
+    """
+    with zipfile.ZipFile(zip_file) as zf:
+        names = [
+            n for n in zf.namelist()
+            if not n.endswith("/") and not n.startswith("__MACOSX/")
+        ]
+
+    return pair_documents([(n, n) for n in names])
+
+
+def scan_gcs_prefix(gs_prefix):
+    """
+    gs://bucket/prefix/ → semua PDF di bawah prefix, path relatif
+    terhadap prefix dipakai untuk pairing.
+    """
+    if not gs_prefix.startswith("gs://"):
+        raise Exception("Prefix harus berupa gs://bucket/folder/")
+
+    bucket_name, _, prefix = gs_prefix[len("gs://"):].partition("/")
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+
+    items = [
+        (blob.name[len(prefix):], f"gs://{bucket_name}/{blob.name}")
+        for blob in storage_client.list_blobs(bucket_name, prefix=prefix)
+        if not blob.name.endswith("/")
+    ]
+
+    return pair_documents(items)
+
+# ==============================
+# SUBMIT KE ANTRIAN JOB
+# ==============================
+
+def submit_bulk(shipments, zip_file=None):
+    """
+    Masukkan semua shipment valid ke antrian job (worker pool & scheduler
+    Gemini yang sama dengan upload single, jadi limit concurrency global).
+
+    zip_file: kalau sumbernya ZIP, isi tiap shipment di-upload dulu ke
+    tmp/{job_id}/input/ (1 shipment di memory per waktu), job hanya
+    menyimpan gs:// URI. Sumber GCS prefix langsung dipakai tanpa copy.
+
+    Return (batch_id, outcomes) dengan outcomes per shipment:
+    {"name", "job_id", "error"}.
+    """
+    valid = [s for s in shipments if not s["error"]]
+    if len(valid) > BULK_MAX_SHIPMENTS:
+        raise Exception(f"Maksimal {BULK_MAX_SHIPMENTS} shipment per bulk ({len(valid)} ditemukan)")
+
+    batch_id = uuid.uuid4().hex
+    outcomes = []
+    zf = zipfile.ZipFile(zip_file) if zip_file is not None else None
+
+    try:
+        for shipment in shipments:
+            if shipment["error"]:
+                outcomes.append({"name": shipment["name"], "job_id": None, "error": shipment["error"]})
+                continue
+
+            job_id = new_job_id()
+            sources = list(shipment["documents"].values())
+
+            if zf is not None:
+                uris = [
+                    job_input_uri(job_id, i, posixpath.basename(member))
+                    for i, member in enumerate(sources, start=1)
+                ]
+                failed = upload_job_inputs([(uri, zf.read(member)) for uri, member in zip(uris, sources)])
+
+                if failed:
+                    outcomes.append({
+                        "name": shipment["name"],
+                        "job_id": None,
+                        "error": "upload gagal: " + ", ".join(posixpath.basename(u) for u in failed),
+                    })
+                    continue
+            else:
+                uris = sources
+
+            enqueue_job(
+                invoice_name=shipment["name"],
+                pdf_paths=uris,
+                with_total_container="bl" in shipment["documents"] and "coo" in shipment["documents"],
+                job_id=job_id,
+                batch_id=batch_id,
+            )
+            outcomes.append({"name": shipment["name"], "job_id": job_id, "error": None})
+    finally:
+        if zf is not None:
+            zf.close()
+
+    return batch_id, outcomes
@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import tempfile
+from google.cloud import storage
+from google.api_core.exceptions import NotFound
+from config import *
+
+storage_client = storage.Client()
+
+_evict_lock = threading.Lock()
+_last_evict = 0.0
+
+# ==============================
+# CACHE KEY
+# ==============================
+
+def make_cache_key(pdf_hash, prompt, model, generation_config):
+    """
+    Key = hash dari (isi PDF, prompt, model, generation config).
+    Prompt ikut di-hash supaya perubahan instruksi otomatis miss.
+    """
+    payload = {
+        "pdf": pdf_hash,
+        "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        "model": model,
+        "config": generation_config,
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_bypassed():
+    if not GEMINI_CACHE_ENABLED:
+        return True
+    return os.environ.get("GEMINI_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+# ==============================
+# LOCAL BACKEND
+# ==============================
+
+def _local_path(key):
+    return os.path.join(GEMINI_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _local_get(key):
+    path = _local_path(key)
+
+    if not os.path.exists(path):
+        return None
+
+    if time.time() - os.path.getmtime(path) > GEMINI_CACHE_MAX_AGE_DAYS * 86400:
+        os.remove(path)
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        entry = json.load(f)
+
+    # tandai baru dipakai (untuk eviction LRU)
+    os.utime(path, None)
+
+    return entry
+
+
+def _local_put(key, entry):
+    path = _local_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # tulis ke file sementara lalu rename supaya tidak ada entry setengah jadi
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(entry, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _local_entries():
+    entries = []
+    for root, _, files in os.walk(GEMINI_CACHE_DIR):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def _local_evict():
+    entries = _local_entries()
+    now = time.time()
+    max_age = GEMINI_CACHE_MAX_AGE_DAYS * 86400
+    max_bytes = GEMINI_CACHE_MAX_MB * 1024 * 1024
+
+    alive = []
+    for mtime, size, path in entries:
+        if now - mtime > max_age:
+            os.remove(path)
+        else:
+            alive.append((mtime, size, path))
+
+    total = sum(size for _, size, _ in alive)
+
+    # buang yang paling lama tidak dipakai sampai di bawah limit
+    for mtime, size, path in sorted(alive):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+# ==============================
+# GCS BACKEND
+# ==============================
+
+def _gcs_blob_path(key):
+    return f"{GEMINI_CACHE_PREFIX}/{key}.json"
+
+
+def _gcs_get(key):
+    bucket = storage_client.bucket(BUCKET_NAME)
+    blob = bucket.get_blob(_gcs_blob_path(key))
+
+    if blob is None:
+        return None
+
+    if time.time() - blob.updated.timestamp() > GEMINI_CACHE_MAX_AGE_DAYS * 86400:
+        try:
+            blob.delete()
+        except NotFound:
+            pass
+        return None
+
+    try:
+        return json.loads(blob.download_as_text())
+    except NotFound:
+        return None
+
+
+def _gcs_put(key, entry):
+    bucket = storage_client.bucket(BUCKET_NAME)
+    bucket.blob(_gcs_blob_path(key)).upload_from_string(
+        json.dumps(entry, separators=(",", ":")),
+        content_type="application/json"
+    )
+
+
+def _gcs_evict():
+    bucket = storage_client.bucket(BUCKET_NAME)
+    blobs = list(bucket.list_blobs(prefix=f"{GEMINI_CACHE_PREFIX}/"))
+
+    now = time.time()
+    max_age = GEMINI_CACHE_MAX_AGE_DAYS * 86400
+    max_bytes = GEMINI_CACHE_MAX_MB * 1024 * 1024
+
+    alive = []
+    for blob in blobs:
+        if now - blob.updated.timestamp() > max_age:
+            try:
+                blob.delete()
+            except NotFound:
+                pass
+        else:
+            alive.append(blob)
+
+    total = sum(blob.size or 0 for blob in alive)
+
+    for blob in sorted(alive, key=lambda b: b.updated):
+        if total <= max_bytes:
+            break
+        try:
+            blob.delete()
+        except NotFound:
+            pass
+        total -= blob.size or 0
+
+# ==============================
+# PUBLIC API
+# ==============================
+
+def cache_get(key):
+    """
+    Ambil raw response dari cache. Return None kalau miss / expired.
+    """
+    try:
+        if GEMINI_CACHE_BACKEND == "gcs":
+            return _gcs_get(key)
+        return _local_get(key)
+    except Exception as e:
+        # cache rusak tidak boleh menggagalkan job
+        print(f"Gemini cache read gagal ({key}): {e}")
+        return None
+
+
+def cache_put(key, response, model):
+    """
+    response = dict hasil Gemini (text, finish_reason, token count).
+    """
+    entry = dict(response)
+    entry["model"] = model
+    entry["created"] = time.time()
+
+    try:
+        if GEMINI_CACHE_BACKEND == "gcs":
+            _gcs_put(key, entry)
+        else:
+            _local_put(key, entry)
+    except Exception as e:
+        print(f"Gemini cache write gagal ({key}): {e}")
+        return
+
+    _maybe_evict()
+
+
+def evict_cache():
+    if GEMINI_CACHE_BACKEND == "gcs":
+        _gcs_evict()
+    else:
+        _local_evict()
+
+
+def _maybe_evict():
+    """
+    Eviction (listing seluruh cache) cukup sesekali, bukan setiap put.
+    """
+    global _last_evict
+
+    if not _evict_lock.acquire(blocking=False):
+        return
+
+    try:
+        if time.time() - _last_evict < GEMINI_CACHE_EVICT_INTERVAL_SEC:
+            return
+        _last_evict = time.time()
+        evict_cache()
+    except Exception as e:
+        print(f"Gemini cache eviction gagal: {e}")
+    finally:
+        _evict_lock.release()
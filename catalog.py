@@ -0,0 +1,293 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from config import *
+
+STATUS_QUEUED = "QUEUED"
+STATUS_RUNNING = "RUNNING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+STATUS_CANCELLED = "CANCELLED"
+
+SORT_ORDERS = {
+    # job yang belum selesai (finished_at NULL) selalu di atas
+    "newest": "finished_at IS NOT NULL, finished_at DESC, created_at DESC",
+    "oldest": "finished_at IS NOT NULL, finished_at ASC, created_at ASC",
+    "name_asc": "invoice_name COLLATE NOCASE ASC",
+    "name_desc": "invoice_name COLLATE NOCASE DESC",
+}
+
+_init_lock = threading.Lock()
+_initialized = False
+
+# ==============================
+# RESULT CATALOG (SQLITE)
+# ==============================
+#
+# 1 row per (job, report_type): status, jumlah row, path CSV, ukuran,
+# waktu mulai / selesai dan progress terakhir. Diisi oleh jobs.py
+# (antrian) dan run_ocr (mulai, progress, selesai / gagal), jadi halaman
+# Report cukup query tabel ini tanpa list bucket.
+
+def _connect():
+    conn = sqlite3.connect(CATALOG_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def init_catalog():
+    global _initialized
+
+    with _init_lock:
+        if _initialized:
+            return
+
+        conn = _connect()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    job_id TEXT NOT NULL,
+                    report_type TEXT NOT NULL,
+                    invoice_name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    rows INTEGER,
+                    path TEXT,
+                    size_bytes INTEGER,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    duration_sec REAL,
+                    progress TEXT,
+                    error TEXT,
+                    PRIMARY KEY (job_id, report_type)
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_type_status "
+                "ON results (report_type, status, finished_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_type_name "
+                "ON results (report_type, invoice_name COLLATE NOCASE)"
+            )
+        finally:
+            conn.close()
+
+        _initialized = True
+
+
+def _execute(sql, params=()):
+    init_catalog()
+    conn = _connect()
+    try:
+        return conn.execute(sql, params).rowcount
+    finally:
+        conn.close()
+
+
+def report_types_for(with_total_container):
+    return ["detail", "total", "container"] if with_total_container else ["detail"]
+
+# ==============================
+# UPDATE (DIPANGGIL JOBS / RUN_OCR)
+# ==============================
+
+def catalog_queued(job_id, invoice_name, report_types):
+    """
+    Job masuk antrian (baru atau retry): status QUEUED,
+    hasil / error run sebelumnya dikosongkan.
+    """
+    now = time.time()
+    for report_type in report_types:
+        _execute(
+            """
+            INSERT INTO results (job_id, report_type, invoice_name, status, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (job_id, report_type) DO UPDATE SET
+                status = excluded.status,
+                started_at = NULL,
+                finished_at = NULL,
+                duration_sec = NULL,
+                progress = NULL,
+                error = NULL
+            """,
+            (job_id, report_type, invoice_name, STATUS_QUEUED, now),
+        )
+
+
+def catalog_requeued(job_id):
+    """
+    Job dikembalikan ke antrian (retry / recovery setelah restart).
+    Report yang sudah DONE tidak disentuh.
+    """
+    _execute(
+        """
+        UPDATE results SET status = ?, started_at = NULL, finished_at = NULL,
+            duration_sec = NULL, progress = NULL, error = NULL
+        WHERE job_id = ? AND status != ?
+        """,
+        (STATUS_QUEUED, job_id, STATUS_DONE),
+    )
+
+
+def catalog_started(job_id, invoice_name, report_types):
+    now = time.time()
+    for report_type in report_types:
+        _execute(
+            """
+            INSERT INTO results (job_id, report_type, invoice_name, status, created_at, started_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (job_id, report_type) DO UPDATE SET
+                status = excluded.status,
+                started_at = excluded.started_at,
+                finished_at = NULL,
+                duration_sec = NULL,
+                error = NULL
+            """,
+            (job_id, report_type, invoice_name, STATUS_RUNNING, now, now),
+        )
+
+
+def catalog_progress(job_id, **progress):
+    """
+    Simpan progress terakhir job (misal stage, batch_done / batch_total).
+    """
+    _execute(
+        "UPDATE results SET progress = ? WHERE job_id = ? AND status = ?",
+        (json.dumps(progress, default=str), job_id, STATUS_RUNNING),
+    )
+
+
+def catalog_finished(job_id, report_type, path, rows, size_bytes):
+    """
+    1 report selesai ditulis (CSV sudah di GCS).
+    """
+    now = time.time()
+    _execute(
+        """
+        UPDATE results SET status = ?, path = ?, rows = ?, size_bytes = ?,
+            finished_at = ?, duration_sec = ? - COALESCE(started_at, ?), error = NULL
+        WHERE job_id = ? AND report_type = ?
+        """,
+        (STATUS_DONE, path, rows, size_bytes, now, now, now, job_id, report_type),
+    )
+
+    # CSV dengan path sama sudah ditimpa job ini → entry lama tidak berlaku
+    _execute(
+        "DELETE FROM results WHERE path = ? AND job_id != ? AND status = ?",
+        (path, job_id, STATUS_DONE),
+    )
+
+
+def catalog_failed(job_id, error):
+    now = time.time()
+    _execute(
+        """
+        UPDATE results SET status = ?, error = ?, finished_at = ?,
+            duration_sec = ? - COALESCE(started_at, ?)
+        WHERE job_id = ? AND status != ?
+        """,
+        (STATUS_FAILED, error, now, now, now, job_id, STATUS_DONE),
+    )
+
+def catalog_cancelled(job_id):
+    now = time.time()
+    _execute(
+        """
+        UPDATE results SET status = ?, error = NULL, finished_at = ?,
+            duration_sec = ? - COALESCE(started_at, ?)
+        WHERE job_id = ? AND status != ?
+        """,
+        (STATUS_CANCELLED, now, now, now, job_id, STATUS_DONE),
+    )
+
+# ==============================
+# QUERY (HALAMAN REPORT)
+# ==============================
+
+def query_results(report_type, statuses=None, name_filter=None, sort="newest", limit=20, offset=0):
+    """
+    Filter, sort & pagination di SQLite.
+    Return (list row dict, jumlah total yang cocok dengan filter).
+    """
+    init_catalog()
+
+    where = ["report_type = ?"]
+    params = [report_type]
+
+    if statuses:
+        where.append(f"status IN ({','.join('?' for _ in statuses)})")
+        params += list(statuses)
+
+    if name_filter:
+        where.append("invoice_name LIKE ? ESCAPE '\\'")
+        escaped = name_filter.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.append(f"%{escaped}%")
+
+    where_sql = " AND ".join(where)
+    order_sql = SORT_ORDERS.get(sort, SORT_ORDERS["newest"])
+
+    conn = _connect()
+    try:
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM results WHERE {where_sql}", params
+        ).fetchone()[0]
+
+        rows = conn.execute(
+            f"SELECT * FROM results WHERE {where_sql} ORDER BY {order_sql} LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+    finally:
+        conn.close()
+
+    results = []
+    for row in rows:
+        item = dict(row)
+        item["progress"] = json.loads(item["progress"]) if item["progress"] else None
+        results.append(item)
+
+    return results, total
+
+
+def catalog_is_empty():
+    init_catalog()
+    conn = _connect()
+    try:
+        return conn.execute("SELECT 1 FROM results LIMIT 1").fetchone() is None
+    finally:
+        conn.close()
+
+
+def backfill_from_bucket(storage_client):
+    """
+    Isi catalog dari output/ yang sudah ada sebelum catalog dipakai.
+    Hanya dijalankan sekali saat catalog masih kosong (bukan saat render Report).
+    """
+    count = 0
+
+    for report_type in ("detail", "total", "container"):
+        suffix = f"_{report_type}.csv"
+
+        for blob in storage_client.list_blobs(BUCKET_NAME, prefix=f"output/{report_type}/"):
+            name = os.path.basename(blob.name)
+            if not name:
+                continue
+
+            invoice_name = name[:-len(suffix)] if name.endswith(suffix) else name
+            finished_at = blob.updated.timestamp() if blob.updated else time.time()
+
+            _execute(
+                """
+                INSERT OR IGNORE INTO results
+                    (job_id, report_type, invoice_name, status, path, size_bytes, created_at, finished_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (f"legacy:{blob.name}", report_type, invoice_name, STATUS_DONE,
+                 blob.name, blob.size, finished_at, finished_at),
+            )
+            count += 1
+
+    return count
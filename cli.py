@@ -0,0 +1,190 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import *
+from function import run_ocr
+
+DOCUMENT_FIELDS = ["invoice", "packing_list", "bl", "coo"]
+
+# ==============================
+# INPUT (ARGUMEN / MANIFEST)
+# ==============================
+#
+# Manifest: CSV (header) atau JSON lines, 1 shipment per baris:
+#   name,invoice,packing_list,bl,coo,customer
+# Path dokumen boleh lokal atau gs://; bl, coo, customer opsional.
+
+def _shipment(name, invoice, packing_list, bl=None, coo=None, customer=None):
+    if not invoice or not packing_list:
+        raise Exception(f"Shipment {name or '-'}: invoice dan packing_list wajib")
+
+    for path in [invoice, packing_list, bl, coo]:
+        if path and not path.startswith("gs://") and not os.path.isfile(path):
+            raise Exception(f"Shipment {name or '-'}: file tidak ditemukan: {path}")
+
+    return {
+        "name": name or os.path.splitext(os.path.basename(invoice))[0],
+        "documents": [p for p in [invoice, packing_list, bl, coo] if p],
+        "with_total_container": bool(bl and coo),
+        "customer": customer or None,
+    }
+
+
+def load_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            records = list(csv.DictReader(f))
+        else:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    shipments = []
+    for record in records:
+        record = {k: (v.strip() if isinstance(v, str) else v) for k, v in record.items()}
+        shipments.append(_shipment(
+            record.get("name"),
+            *(record.get(field) for field in DOCUMENT_FIELDS),
+            customer=record.get("customer"),
+        ))
+
+    names = [s["name"] for s in shipments]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        # nama = nama file CSV, shipment dengan nama sama saling menimpa
+        raise Exception("Nama shipment duplikat di manifest: " + ", ".join(duplicates))
+
+    return shipments
+
+# ==============================
+# RUN
+# ==============================
+
+def _run_shipment(shipment, args):
+    started = time.time()
+
+    try:
+        result = run_ocr(
+            invoice_name=shipment["name"],
+            uploaded_pdf_paths=shipment["documents"],
+            with_total_container=shipment["with_total_container"],
+            detail_concurrency=args.detail_concurrency,
+            use_cache=not args.no_cache,
+            customer=shipment["customer"] or args.customer,
+            output=args.output,
+        )
+        return {
+            "name": shipment["name"],
+            "status": "DONE",
+            "wall_sec": round(time.time() - started, 1),
+            "job_id": result["job_id"],
+            "outputs": [result[k] for k in ("detail_csv", "total_csv", "container_csv") if result.get(k)],
+            "trace": result.get("trace"),
+            **result["stats"],
+        }
+    except Exception as e:
+        if args.verbose:
+            traceback.print_exc()
+        return {
+            "name": shipment["name"],
+            "status": "FAILED",
+            "wall_sec": round(time.time() - started, 1),
+            "error": str(e),
+        }
+
+
+def _print_report(results, elapsed):
+    print()
+    print(f"{'SHIPMENT':<30} {'STATUS':<7} {'SEC':>8} {'CALLS':>6} {'CACHE':>6} {'PROMPT TOK':>11} {'OUTPUT TOK':>11}")
+
+    for r in results:
+        print(
+            f"{r['name'][:30]:<30} {r['status']:<7} {r['wall_sec']:>8} "
+            f"{r.get('gemini_calls', '-'):>6} {r.get('cache_hits', '-'):>6} "
+            f"{r.get('prompt_tokens', '-'):>11} {r.get('output_tokens', '-'):>11}"
+        )
+        if r["status"] == "FAILED":
+            print(f"  error: {r['error']}")
+
+    done = [r for r in results if r["status"] == "DONE"]
+
+    print()
+    print(
+        f"{len(done)}/{len(results)} DONE dalam {round(elapsed, 1)} detik "
+        f"({round(len(done) / max(elapsed, 1e-9) * 3600, 1)} invoice/jam), "
+        f"prompt tokens {sum(r['prompt_tokens'] for r in done)}, "
+        f"output tokens {sum(r['output_tokens'] for r in done)}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Jalankan pipeline OCR tanpa Streamlit (1 shipment atau manifest)."
+    )
+    parser.add_argument("--invoice", help="PDF invoice (path lokal / gs://)")
+    parser.add_argument("--packing-list", help="PDF packing list (path lokal / gs://)")
+    parser.add_argument("--bl", help="PDF bill of lading (opsional)")
+    parser.add_argument("--coo", help="PDF COO (opsional)")
+    parser.add_argument("--name", help="Nama output (default nama file invoice)")
+    parser.add_argument("--manifest", help="CSV / JSON lines: name,invoice,packing_list,bl,coo,customer")
+    parser.add_argument(
+        "--output",
+        help=f"Folder lokal atau gs://bucket/prefix (default gs://{BUCKET_NAME}/output)",
+    )
+    parser.add_argument("--parallel", type=int, default=JOB_WORKERS, help="Jumlah shipment paralel")
+    parser.add_argument("--detail-concurrency", type=int, default=None, help="Batch detail paralel per shipment")
+    parser.add_argument("--customer", help="Customer untuk RULE_OVERRIDES (kalau tidak ada di manifest)")
+    parser.add_argument("--no-cache", action="store_true", help="Jangan pakai cache hasil Gemini")
+    parser.add_argument("--stats-json", help="Tulis hasil per job sebagai JSON ke file ini")
+    parser.add_argument("--verbose", action="store_true", help="Tampilkan traceback job yang gagal")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.manifest:
+            shipments = load_manifest(args.manifest)
+        elif args.invoice or args.packing_list:
+            shipments = [_shipment(args.name, args.invoice, args.packing_list, args.bl, args.coo)]
+        else:
+            parser.error("isi --manifest atau --invoice dan --packing-list")
+    except Exception as e:
+        print(f"Input tidak valid: {e}", file=sys.stderr)
+        return 2
+
+    if not shipments:
+        print("Manifest kosong", file=sys.stderr)
+        return 2
+
+    print(f"{len(shipments)} shipment, paralel {max(1, args.parallel)}")
+
+    started = time.time()
+    results = []
+
+    # scheduler Gemini global per proses: limit RPM / TPM berlaku lintas shipment
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+        futures = [executor.submit(_run_shipment, s, args) for s in shipments]
+
+        for future in as_completed(futures):
+            r = future.result()
+            results.append(r)
+            print(f"[{len(results)}/{len(shipments)}] {r['name']}: {r['status']} ({r['wall_sec']} detik)")
+
+    elapsed = time.time() - started
+
+    # urutan laporan = urutan manifest
+    order = {s["name"]: i for i, s in enumerate(shipments)}
+    results.sort(key=lambda r: order[r["name"]])
+
+    _print_report(results, elapsed)
+
+    if args.stats_json:
+        with open(args.stats_json, "w", encoding="utf-8") as f:
+            json.dump({"elapsed_sec": round(elapsed, 1), "jobs": results}, f, indent=2)
+
+    return 0 if all(r["status"] == "DONE" for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,4 +4,109 @@ BUCKET_NAME = "bkt-insera-sena-idp"
 TMP_PREFIX = "tmp"
 RESULT_PREFIX = "result"
 PO_PREFIX = "po"
-MODEL_NAME = "gemini-2.5-flash"
\ No newline at end of file
+MODEL_NAME = "gemini-2.5-flash"
+
+# DETAIL BATCH EXECUTOR
+DETAIL_CONCURRENCY = 4
+DETAIL_BATCH_MAX_RETRY = 3
+DETAIL_BATCH_RETRY_DELAY = 2
+
+# GEMINI RESULT CACHE
+GEMINI_CACHE_ENABLED = True
+GEMINI_CACHE_BACKEND = "local"  # "local" | "gcs"
+GEMINI_CACHE_DIR = "/tmp/gemini_cache"
+GEMINI_CACHE_PREFIX = "cache/gemini"
+GEMINI_CACHE_MAX_MB = 512
+GEMINI_CACHE_MAX_AGE_DAYS = 30
+GEMINI_CACHE_EVICT_INTERVAL_SEC = 600
+
+# BACKGROUND JOB QUEUE
+JOB_DB_PATH = "/tmp/insera_ocr_jobs.db"
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL_SEC = 2
+
+# PO MASTER INDEX
+PO_INDEX_PATH = "/tmp/insera_po_index.db"
+
+# PO MASTER IN-PROCESS CACHE
+PO_CACHE_REFRESH_SEC = 300
+PO_CACHE_MAX_LINES = 1_000_000
+
+# ADAPTIVE DETAIL BATCH
+DETAIL_BATCH_INITIAL_SIZE = 5
+DETAIL_BATCH_MIN_SIZE = 1
+DETAIL_BATCH_MAX_SIZE = 30
+DETAIL_BATCH_TARGET_OUTPUT_TOKENS = 24000
+
+# PAGE SLICING PER DETAIL BATCH
+PAGE_SLICING = True
+PAGE_SLICE_MIN_PAGES = 8
+PAGE_SLICE_SMALL_DOC_PAGES = 2
+PAGE_SLICE_MAX_RATIO = 0.8
+
+# TRACE / INSTRUMENTATION
+TRACE_DIR = "/tmp/ocr_traces"
+TRACE_PREFIX = "trace"
+
+# BATCH CHECKPOINT (CRASH RECOVERY)
+CHECKPOINT_WRITER_THREADS = 2
+
+# STREAMING GEMINI (DETAIL)
+GEMINI_STREAMING = True
+
+# GEMINI CALL SCHEDULER (RATE LIMIT + RETRY)
+GEMINI_MAX_CONCURRENCY = 8
+GEMINI_RATE_LIMITS = {
+    "gemini-2.5-flash": {"rpm": 300, "tpm": 2_000_000},
+}
+GEMINI_DEFAULT_RATE_LIMIT = {"rpm": 60, "tpm": 500_000}
+GEMINI_MAX_RETRY = 5
+GEMINI_BACKOFF_BASE_SEC = 2
+GEMINI_BACKOFF_MAX_SEC = 60
+GEMINI_RETRYABLE_CODES = (408, 429, 500, 502, 503, 504)
+GEMINI_TOKENS_PER_PAGE = 258
+GEMINI_EXPECTED_OUTPUT_TOKENS = 4000
+
+# STRUCTURED OUTPUT
+GEMINI_RESPONSE_SCHEMA = True
+
+# VALIDATION RULES PER CUSTOMER
+# {"NAMA CUSTOMER": {"disable": ["coo.equal_unit.coo_gw_unit"], "enable": [...]}}
+# id rule lihat rules.py
+RULE_OVERRIDES = {}
+
+# INPUT UPLOAD
+UPLOAD_CONCURRENCY = 4
+UPLOAD_RESUMABLE_THRESHOLD_MB = 8
+UPLOAD_CHUNK_SIZE_MB = 8  # kelipatan 256 KB (syarat resumable upload GCS)
+# job yang selesai lebih cepat dari upload input menunggu sebelum cleanup tmp
+UPLOAD_WAIT_BEFORE_CLEANUP_SEC = 600
+
+# PDF BUFFER (MERGE / COMPRESS / SLICE)
+PDF_SPOOL_MAX_MB = 64  # di atas ini buffer pindah ke file temp anonim
+PDF_COMPRESS_MAX_MB = 45
+
+# REPORT PAGE
+REPORT_SIGNED_URL = True
+SIGNED_URL_EXPIRE_MIN = 15
+
+# RESULT CATALOG
+CATALOG_DB_PATH = "/tmp/insera_ocr_catalog.db"
+
+# PROGRESS (UPLOAD / REPORT)
+PROGRESS_POLL_SEC = 2
+
+# BULK SUBMISSION (ZIP / GCS PREFIX)
+# keyword nama file per jenis dokumen; urutan = urutan merge (sama dengan upload single)
+BULK_DOC_KEYWORDS = {
+    "invoice": ["invoice", "inv", "ci"],
+    "packing_list": ["packing", "packinglist", "pl"],
+    "bl": ["bl", "bol", "lading", "billoflading"],
+    "coo": ["coo", "origin", "skao"],
+}
+BULK_MAX_SHIPMENTS = 500
+
+# GEMINI INPUT PDF (SHARED, CONTENT-ADDRESSED)
+GEMINI_INPUT_PREFIX = f"{TMP_PREFIX}/gemini_input"
+GEMINI_INPUT_TTL_HOURS = 24  # harus lebih lama dari job terlama
+GEMINI_INPUT_SWEEP_INTERVAL_SEC = 3600
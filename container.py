@@ -1,3 +1,5 @@
+from schema import object_schema, array_schema
+
 CONTAINER_SYSTEM_INSTRUCTION = """
 ROLE:
 Anda adalah AI IDP professional
@@ -177,4 +179,35 @@ OUTPUT RESTRICTION
   - Penjelasan tambahan
   - Komentar
   - Field di luar skema
-"""
\ No newline at end of file
+"""
+
+# field & urutan sama dengan CONTAINER OUTPUT SCHEMA di prompt
+CONTAINER_FIELDS = [
+    ("match_score", "string"),
+    ("match_description", "string"),
+    ("bl_shipper_name", "string"),
+    ("bl_shipper_address", "string"),
+    ("bl_no", "string"),
+    ("bl_date", "string"),
+    ("bl_consignee_name", "string"),
+    ("bl_consignee_address", "string"),
+    ("bl_consignee_tax_id", "string"),
+    ("bl_seller_name", "string"),
+    ("bl_seller_address", "string"),
+    ("bl_lc_number", "string"),
+    ("bl_notify_party", "string"),
+    ("bl_vessel", "string"),
+    ("bl_voyage_no", "string"),
+    ("bl_port_of_loading", "string"),
+    ("bl_port_of_destination", "string"),
+    ("bl_gw_unit", "string"),
+    ("bl_gw", "number"),
+    ("bl_volume_unit", "string"),
+    ("bl_volume", "number"),
+    ("bl_container_no", "string"),
+    ("bl_container_type", "string"),
+    ("bl_package_count", "number"),
+    ("bl_package_unit", "string"),
+]
+
+CONTAINER_RESPONSE_SCHEMA = array_schema(object_schema(CONTAINER_FIELDS))
@@ -1,4 +1,19 @@
-def build_detail_prompt(total_row, first_index, last_index):
+from schema import object_schema, array_schema
+
+
+def build_detail_prompt(total_row, first_index, last_index, page_hint=None):
+
+    # PDF hanya berisi potongan halaman (lihat _slice_input_for_window)
+    page_rule = ""
+    if page_hint:
+        page_order = ", ".join(
+            f"halaman {i} = halaman asli {p}"
+            for i, p in enumerate(page_hint["pages"], start=1)
+        )
+        page_rule = f"""11. PDF yang dikirim HANYA berisi sebagian halaman dari dokumen asli ({page_order}).
+    Penomoran index line item TETAP mengikuti dokumen asli yang lengkap.
+    Line item index {first_index} berada di halaman asli {page_hint["first_item_pages"]}.
+"""
 
     return f"""
 ROLE:
@@ -37,7 +52,7 @@ ATURAN UMUM EKSTRAKSI
 - Seluruh field dengan prefix dokumen tersebut WAJIB diisi dengan string "null".
 10. Jika pada dokumen terdapat value total seperti total net weight, gross weight, volume, amount, quantity, package yang berbentuk huruf,
     Maka ekstrak nilai numeriknya.
-
+{page_rule}
 ============================================
 ISOLASI SUMBER DATA PER DOKUMEN
 ============================================
@@ -237,4 +252,119 @@ DETAIL OUTPUT SCHEMA
   "coo_origin_country": "string",
   "coo_customer_po_no": "string"
 }}
-"""
\ No newline at end of file
+"""
+
+# field & urutan sama dengan DETAIL OUTPUT SCHEMA di prompt
+DETAIL_FIELDS = [
+    ("match_score", "string"),
+    ("match_description", "string"),
+    ("inv_invoice_no", "string"),
+    ("inv_invoice_date", "string"),
+    ("inv_customer_po_no", "string"),
+    ("inv_vendor_name", "string"),
+    ("inv_vendor_address", "string"),
+    ("inv_messrs", "string"),
+    ("inv_messrs_address", "string"),
+    ("inv_incoterms_terms", "string"),
+    ("inv_terms", "string"),
+    ("inv_coo_commodity_origin", "string"),
+    ("inv_seq", "string"),
+    ("inv_spart_item_no", "string"),
+    ("inv_description", "string"),
+    ("inv_quantity", "number"),
+    ("inv_quantity_unit", "string"),
+    ("inv_unit_price", "number"),
+    ("inv_price_unit", "string"),
+    ("inv_amount", "number"),
+    ("inv_amount_unit", "string"),
+    ("inv_gw", "number"),
+    ("inv_gw_unit", "string"),
+    ("inv_total_quantity", "number"),
+    ("inv_total_amount", "number"),
+    ("inv_total_nw", "number"),
+    ("inv_total_gw", "number"),
+    ("inv_total_volume", "number"),
+    ("inv_total_package", "number"),
+    ("pl_invoice_no", "string"),
+    ("pl_invoice_date", "string"),
+    ("pl_messrs", "string"),
+    ("pl_messrs_address", "string"),
+    ("pl_item_no", "number"),
+    ("pl_description", "string"),
+    ("pl_quantity", "number"),
+    ("pl_package_unit", "string"),
+    ("pl_package_count", "number"),
+    ("pl_weight_unit", "string"),
+    ("pl_nw", "number"),
+    ("pl_gw", "number"),
+    ("pl_volume_unit", "string"),
+    ("pl_volume", "number"),
+    ("pl_amount", "number"),
+    ("pl_total_quantity", "number"),
+    ("pl_total_amount", "number"),
+    ("pl_total_nw", "number"),
+    ("pl_total_gw", "number"),
+    ("pl_total_volume", "number"),
+    ("pl_total_package", "number"),
+    ("po_no", "string"),
+    ("po_vendor_article_no", "string"),
+    ("po_text", "string"),
+    ("po_sap_article_no", "string"),
+    ("po_line", "string"),
+    ("po_quantity", "string"),
+    ("po_unit", "string"),
+    ("po_price", "string"),
+    ("po_currency", "string"),
+    ("po_info_record_price", "string"),
+    ("po_info_record_currency", "string"),
+    ("bl_shipper_name", "string"),
+    ("bl_shipper_address", "string"),
+    ("bl_no", "string"),
+    ("bl_date", "string"),
+    ("bl_consignee_name", "string"),
+    ("bl_consignee_address", "string"),
+    ("bl_consignee_tax_id", "string"),
+    ("bl_seller_name", "string"),
+    ("bl_seller_address", "string"),
+    ("bl_lc_number", "string"),
+    ("bl_notify_party", "string"),
+    ("bl_vessel", "string"),
+    ("bl_voyage_no", "string"),
+    ("bl_port_of_loading", "string"),
+    ("bl_port_of_destination", "string"),
+    ("bl_description", "string"),
+    ("bl_hs_code", "string"),
+    ("bl_mark_number", "string"),
+    ("coo_no", "string"),
+    ("coo_form_type", "string"),
+    ("coo_invoice_no", "string"),
+    ("coo_invoice_date", "string"),
+    ("coo_shipper_name", "string"),
+    ("coo_shipper_address", "string"),
+    ("coo_consignee_name", "string"),
+    ("coo_consignee_address", "string"),
+    ("coo_consignee_tax_id", "string"),
+    ("coo_producer_name", "string"),
+    ("coo_producer_address", "string"),
+    ("coo_departure_date", "string"),
+    ("coo_vessel", "string"),
+    ("coo_voyage_no", "string"),
+    ("coo_port_of_discharge", "string"),
+    ("coo_seq", "number"),
+    ("coo_mark_number", "string"),
+    ("coo_description", "string"),
+    ("coo_hs_code", "string"),
+    ("coo_quantity", "number"),
+    ("coo_unit", "string"),
+    ("coo_package_count", "number"),
+    ("coo_package_unit", "string"),
+    ("coo_gw_unit", "string"),
+    ("coo_gw", "number"),
+    ("coo_amount_unit", "string"),
+    ("coo_amount", "number"),
+    ("coo_criteria", "string"),
+    ("coo_origin_country", "string"),
+    ("coo_customer_po_no", "string"),
+]
+
+DETAIL_RESPONSE_SCHEMA = array_schema(object_schema(DETAIL_FIELDS))
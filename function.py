@@ -1,23 +1,40 @@
 import io 
 import json 
+import hashlib 
 import re 
 import tempfile 
 import os 
 import csv 
 import subprocess 
+import shutil 
+import resource 
+import time 
+import threading 
+import uuid 
 import ijson 
-from urllib.parse import urlparse 
+from datetime import datetime, timezone, timedelta 
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED 
 from google.cloud import storage 
-from PyPDF2 import PdfMerger 
+from google.api_core.exceptions import NotFound, PreconditionFailed 
+from PyPDF2 import PdfMerger, PdfReader, PdfWriter 
 from google import genai 
 from google.genai import types 
 from config import * 
-from total import TOTAL_SYSTEM_INSTRUCTION 
-from container import CONTAINER_SYSTEM_INSTRUCTION 
-from detail import build_detail_prompt 
-from row import ROW_SYSTEM_INSTRUCTION 
+from total import TOTAL_SYSTEM_INSTRUCTION, TOTAL_RESPONSE_SCHEMA 
+from container import CONTAINER_SYSTEM_INSTRUCTION, CONTAINER_RESPONSE_SCHEMA 
+from detail import build_detail_prompt, DETAIL_RESPONSE_SCHEMA 
+from page import build_page_map_prompt, PAGE_MAP_RESPONSE_SCHEMA 
+from row import ROW_SYSTEM_INSTRUCTION, ROW_RESPONSE_SCHEMA 
+from schema import normalize_nulls 
+from batcher import AdaptiveBatcher 
+from scheduler import scheduler 
+from telemetry import job_trace, span, record_event, submit_with_context, trace_stats 
+from cache import make_cache_key, cache_get, cache_put, cache_bypassed 
+from po_store import get_po_lines, _norm_po_number, _norm_key 
+from validation import validate_detail_rows, _add_error 
+from catalog import report_types_for, catalog_started, catalog_progress, catalog_finished, catalog_failed, catalog_cancelled 
+from progress import job_progress, current_progress, report_progress, report_batch_done, report_item_streamed, report_window_dropped, JobCancelled 
 
-BATCH_SIZE = 5 
 storage_client = storage.Client() 
 genai_client = genai.Client( vertexai=True, project=PROJECT_ID, location=LOCATION, ) 
 
@@ -79,33 +96,172 @@ def _parse_json_safe(raw_text):
     raise Exception(f"Gemini output bukan JSON valid:\n{s[:1000]}")
 
 
+# jumlah response yang harus lewat jalur repair, per label prompt
+JSON_REPAIR_COUNT = {}
+_json_repair_lock = threading.Lock()
+
+
+def _parse_json(raw_text, label="gemini"):
+    """
+    Response structured output (response_schema) langsung valid → 1x json.loads.
+    _parse_json_safe hanya fallback; pemakaiannya dihitung di
+    JSON_REPAIR_COUNT dan dicatat sebagai event json_repair di trace.
+    """
+    try:
+        return normalize_nulls(json.loads(raw_text))
+    except (TypeError, ValueError):
+        pass
+
+    with _json_repair_lock:
+        JSON_REPAIR_COUNT[label] = JSON_REPAIR_COUNT.get(label, 0) + 1
+
+    record_event("json_repair", label=label)
+
+    return normalize_nulls(_parse_json_safe(raw_text))
+
+
 # ==============================
 # MERGE PDF
 # ==============================
 
-def _merge_pdfs(pdf_paths):
-    merger = PdfMerger()
+def _load_pdf_source(source):
+    """
+    Input PDF bisa berupa bytes (buffer upload), file-like,
+    URI gs://... (input job di GCS) atau path lokal.
+    Return sesuatu yang bisa dibaca PdfMerger / PdfReader.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+
+    if hasattr(source, "read"):
+        source.seek(0)
+        return source
+
+    if isinstance(source, str) and source.startswith("gs://"):
+        bucket_name, blob_path = source[len("gs://"):].split("/", 1)
+        with span("gcs_download_input", path=blob_path) as attrs:
+            data = storage_client.bucket(bucket_name).blob(blob_path).download_as_bytes()
+            attrs["bytes"] = len(data)
+        return io.BytesIO(data)
+
+    return source
+
+
+def _load_pdf_sources(sources):
+    # download dari GCS paralel; bytes / path lokal langsung kembali
+    with ThreadPoolExecutor(max_workers=max(1, min(len(sources), UPLOAD_CONCURRENCY))) as executor:
+        return list(executor.map(_load_pdf_source, sources))
+
+
+class _BufferPool:
+    """
+    Semua buffer PDF sementara milik 1 job (merge, compress, potongan halaman).
+
+    Buffer = SpooledTemporaryFile: di memory sampai PDF_SPOOL_MAX_MB,
+    di atas itu otomatis pindah ke file temp anonim (terhapus saat close).
+    close_all() dipanggil di akhir job (sukses / gagal), jadi tidak ada
+    file tertinggal di disk. Peak memory / disk dicatat untuk trace.
+    """
+
+    def __init__(self, spool_max_bytes=PDF_SPOOL_MAX_MB * 1024 * 1024):
+        self.spool_max_bytes = spool_max_bytes
+        self._lock = threading.Lock()
+        self._sizes = {}
+        self._buffers = {}
+        self.peak_memory_bytes = 0
+        self.peak_disk_bytes = 0
+        self.created = 0
+
+    def new(self):
+        buf = tempfile.SpooledTemporaryFile(max_size=self.spool_max_bytes)
+        self.track(buf)
+        return buf
+
+    def track(self, buf, size=0):
+        with self._lock:
+            self._buffers[id(buf)] = buf
+            self._sizes[id(buf)] = (size, not isinstance(buf, io.BytesIO))
+            self.created += 1
+            self._update_peak()
+
+    def written(self, buf):
+        """
+        Dipanggil setelah buffer selesai ditulis (posisi = ukuran).
+        """
+        size = buf.tell()
+        with self._lock:
+            self._sizes[id(buf)] = (size, not isinstance(buf, io.BytesIO))
+            self._update_peak()
+        return size
+
+    def close(self, buf):
+        with self._lock:
+            self._buffers.pop(id(buf), None)
+            self._sizes.pop(id(buf), None)
+        buf.close()
+
+    def close_all(self):
+        with self._lock:
+            buffers = list(self._buffers.values())
+            self._buffers.clear()
+            self._sizes.clear()
+        for buf in buffers:
+            buf.close()
+
+    def _update_peak(self):
+        memory = disk = 0
+        for size, spooled in self._sizes.values():
+            # SpooledTemporaryFile pindah ke disk begitu ukurannya > max_size
+            if spooled and size > self.spool_max_bytes:
+                disk += size
+            else:
+                memory += size
+        self.peak_memory_bytes = max(self.peak_memory_bytes, memory)
+        self.peak_disk_bytes = max(self.peak_disk_bytes, disk)
+
+    def stats(self):
+        return {
+            "buffers": self.created,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "peak_disk_bytes": self.peak_disk_bytes,
+        }
+
+
+def _buffer_size(buf):
+    pos = buf.tell()
+    size = buf.seek(0, os.SEEK_END)
+    buf.seek(pos)
+    return size
 
-    for p in pdf_paths:
-        merger.append(p)
 
-    out = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    merger.write(out.name)
-    merger.close()
+def _merge_pdfs(pdf_sources, buffers):
+    with span("merge_pdf", documents=len(pdf_sources)) as attrs:
+        merger = PdfMerger()
 
-    return out.name
+        for p in pdf_sources:
+            merger.append(p)
+
+        out = buffers.new()
+        merger.write(out)
+        merger.close()
+
+        attrs["bytes"] = buffers.written(out)
+
+    return out
 
 # ==============================
 # COMPRESS PDF
 # ==============================
 
-def _compress_pdf_if_needed(input_path, max_mb=45):
-    size_mb = os.path.getsize(input_path) / (1024 * 1024)
-
-    if size_mb <= max_mb:
-        return input_path
+def _compress_pdf_if_needed(input_buf, buffers, max_mb=PDF_COMPRESS_MAX_MB):
+    """
+    Ghostscript lewat pipe stdin → stdout, hasil langsung ke buffer baru
+    (tanpa file _compressed.pdf). Buffer input di-close setelah berhasil.
+    """
+    input_bytes = _buffer_size(input_buf)
 
-    compressed_path = input_path.replace(".pdf", "_compressed.pdf")
+    if input_bytes / (1024 * 1024) <= max_mb:
+        return input_buf
 
     cmd = [
         "gs",
@@ -115,35 +271,356 @@ def _compress_pdf_if_needed(input_path, max_mb=45):
         "-dNOPAUSE",
         "-dQUIET",
         "-dBATCH",
-        f"-sOutputFile={compressed_path}",
-        input_path,
+        "-sstdout=%stderr",
+        "-sOutputFile=-",
+        "-",
     ]
 
-    subprocess.run(cmd, check=True)
+    with span("compress_pdf", input_bytes=input_bytes) as attrs:
+        out = buffers.new()
+        stderr_chunks = []
+
+        proc = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+        def feed_stdin():
+            try:
+                input_buf.seek(0)
+                shutil.copyfileobj(input_buf, proc.stdin)
+            except BrokenPipeError:
+                pass
+            finally:
+                proc.stdin.close()
+
+        # stdin & stderr di thread terpisah supaya pipe tidak saling menunggu
+        writer = threading.Thread(target=feed_stdin, daemon=True)
+        reader = threading.Thread(
+            target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True
+        )
+        writer.start()
+        reader.start()
+
+        shutil.copyfileobj(proc.stdout, out)
+
+        writer.join()
+        reader.join()
+        returncode = proc.wait()
+
+        if returncode != 0:
+            buffers.close(out)
+            stderr = b"".join(stderr_chunks).decode("utf-8", "replace")[-1000:]
+            raise Exception(f"Ghostscript gagal ({returncode}): {stderr}")
+
+        attrs["bytes"] = buffers.written(out)
+
+    buffers.close(input_buf)
+
+    return out
+
+# ==============================
+# UPLOAD INPUT JOB (PARALEL)
+# ==============================
+
+def job_input_uri(job_id, index, filename):
+    """
+    Lokasi input asli job di GCS: tmp/{job_id}/input/{urutan}_{nama}.
+    Urutan dokumen ikut di nama supaya urutan merge tetap sama saat recovery.
+    """
+    return f"gs://{BUCKET_NAME}/{_job_tmp_prefix(job_id)}/input/{index}_{filename}"
+
+
+def _upload_input_buffer(uri, data):
+    blob_path = uri[len(f"gs://{BUCKET_NAME}/"):]
+    blob = storage_client.bucket(BUCKET_NAME).blob(blob_path)
+
+    # file besar: resumable upload per chunk (chunk gagal diulang, bukan seluruh file)
+    if len(data) > UPLOAD_RESUMABLE_THRESHOLD_MB * 1024 * 1024:
+        blob.chunk_size = UPLOAD_CHUNK_SIZE_MB * 1024 * 1024
+
+    blob.upload_from_file(
+        io.BytesIO(data),
+        size=len(data),
+        content_type="application/pdf",
+    )
+
+    return uri
 
-    return compressed_path
+
+def upload_job_inputs(uris_and_buffers):
+    """
+    Upload semua input job ke GCS secara paralel.
+    uris_and_buffers = [(uri hasil job_input_uri, bytes), ...]
+    Return list URI yang gagal (kosong kalau semua berhasil).
+    """
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(_upload_input_buffer, uri, data): uri
+            for uri, data in uris_and_buffers
+        }
+        for future, uri in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Upload input {uri} gagal: {e}")
+                failed.append(uri)
+
+    return failed
 
 # ==============================
-# UPLOAD PDF TO GCS
+# UPLOAD PDF TO GCS (SEKALI PER JOB)
 # ==============================
 
-def _upload_temp_pdf_to_gcs(local_path, invoice_name):
+def _sha256_buffer(buf, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    buf.seek(0)
+    for chunk in iter(lambda: buf.read(chunk_size), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def _job_tmp_prefix(job_id):
+    """
+    Namespace tmp per job: tmp/{job_id}. File sementara milik 1 job
+    (input asli, checkpoint batch, manifest) ada di sini, jadi cleanup
+    tidak menyentuh job lain. PDF input Gemini ada di GEMINI_INPUT_PREFIX
+    (dipakai bersama, lihat _upload_temp_pdf_to_gcs).
+    """
+    return f"{TMP_PREFIX}/{job_id}"
+
+
+def _upload_temp_pdf_to_gcs(pdf_buf, buffers, digest=None):
+    """
+    Upload merged PDF sekali per job dan kembalikan handle:
+    {"uri": gs://..., "sha256": ..., "source": pdf_buf, ...}
+
+    Blob content-addressed di GEMINI_INPUT_PREFIX/{digest}.pdf, dipakai
+    bersama semua job: kalau blob dengan hash yang sama sudah ada (job lain
+    / run ulang), upload dilewati dan custom_time di-refresh sebagai tanda
+    masih dipakai. Blob tidak dihapus oleh cleanup job, tapi oleh
+    _sweep_gemini_inputs setelah tidak dipakai GEMINI_INPUT_TTL_HOURS.
+
+    digest bisa diisi sendiri:
+    hash PDF sebelum kompresi (merged PDF) atau turunan (potongan halaman).
+    "sha256" di handle dipakai sebagai cache key Gemini.
+
+    source (buffer PDF) dipakai lagi untuk memotong halaman; karena
+    dibaca dari banyak thread detail, akses dijaga dengan "lock".
+    """
     bucket = storage_client.bucket(BUCKET_NAME)
 
-    blob_path = f"tmp/gemini_input/{invoice_name}_merged.pdf"
+    digest = digest or _sha256_buffer(pdf_buf)
+    blob_path = f"{GEMINI_INPUT_PREFIX}/{digest}.pdf"
     blob = bucket.blob(blob_path)
-    blob.upload_from_filename(local_path)
 
-    return f"gs://{BUCKET_NAME}/{blob_path}"
+    with span("gcs_upload_input") as attrs:
+        attrs["skipped"] = _touch_gemini_input(blob)
+
+        if not attrs["skipped"]:
+            size = _buffer_size(pdf_buf)
+            blob.custom_time = datetime.now(timezone.utc)
+            blob.upload_from_file(
+                pdf_buf, rewind=True, size=size, content_type="application/pdf"
+            )
+            attrs["bytes"] = size
+
+    return {
+        "uri": f"gs://{BUCKET_NAME}/{blob_path}",
+        "sha256": digest,
+        "source": pdf_buf,
+        "lock": threading.Lock(),
+        "buffers": buffers,
+        "pages": len(PdfReader(pdf_buf).pages),
+    }
+
+
+def _touch_gemini_input(blob):
+    """
+    True kalau blob sudah ada; custom_time di-update supaya sweep
+    tidak menghapusnya selama masih dipakai.
+    """
+    if not blob.exists():
+        return False
+
+    try:
+        blob.custom_time = datetime.now(timezone.utc)
+        blob.patch()
+    except NotFound:
+        # terhapus sweep di antara exists() dan patch()
+        return False
+
+    return True
+
+
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _sweep_gemini_inputs():
+    """
+    Hapus PDF input Gemini yang tidak dipakai > GEMINI_INPUT_TTL_HOURS
+    (maks 1x per GEMINI_INPUT_SWEEP_INTERVAL_SEC per proses).
+
+    Delete memakai if_metageneration_match: kalau job lain baru saja
+    refresh custom_time (metageneration naik), delete ditolak.
+    Return jumlah blob yang dihapus.
+    """
+    global _last_sweep
+
+    if not _sweep_lock.acquire(blocking=False):
+        return 0
+
+    try:
+        if time.time() - _last_sweep < GEMINI_INPUT_SWEEP_INTERVAL_SEC:
+            return 0
+        _last_sweep = time.time()
+
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=GEMINI_INPUT_TTL_HOURS)
+        deleted = 0
+
+        for blob in storage_client.list_blobs(BUCKET_NAME, prefix=f"{GEMINI_INPUT_PREFIX}/"):
+            last_used = blob.custom_time or blob.updated
+            if last_used is None or last_used >= cutoff:
+                continue
+
+            try:
+                blob.delete(if_metageneration_match=blob.metageneration)
+                deleted += 1
+            except (NotFound, PreconditionFailed):
+                pass
+
+        return deleted
+    finally:
+        _sweep_lock.release()
 
 # ==============================
 # GEMINI CALL
 # ==============================
 
-def _call_gemini(pdf_path, prompt, invoice_name):
+GENERATION_CONFIG = {
+    "temperature": 0.05,
+    "top_p": 1,
+    "max_output_tokens": 65535,
+}
+
+
+def _generation_config(response_schema=None):
+    """
+    GENERATION_CONFIG + structured output (application/json + schema)
+    kalau prompt punya response_schema.
+    """
+    config = dict(GENERATION_CONFIG)
+
+    if response_schema and GEMINI_RESPONSE_SCHEMA:
+        config["response_mime_type"] = "application/json"
+        config["response_schema"] = response_schema
+
+    return config
+
+
+def _call_gemini(pdf_input, prompt, use_cache=True, refresh=False, label="gemini", response_schema=None):
+    """
+    Wrapper _call_gemini_full yang hanya mengembalikan text.
+    """
+    return _call_gemini_full(
+        pdf_input, prompt, use_cache=use_cache, refresh=refresh, label=label,
+        response_schema=response_schema,
+    )["text"]
+
+
+def _call_gemini_full(pdf_input, prompt, use_cache=True, refresh=False, label="gemini", stream=False, on_item=None, response_schema=None):
+    """
+    pdf_input = handle hasil _upload_temp_pdf_to_gcs,
+    sehingga semua prompt dalam 1 job memakai URI yang sama.
+
+    Response disimpan di cache (key: hash PDF, prompt, model, config),
+    jadi re-run invoice yang sama tidak memanggil Gemini lagi.
+    use_cache=False untuk bypass, refresh=True untuk skip baca cache
+    tapi tetap menimpa entry lama (dipakai saat retry).
+
+    Return dict: text, finish_reason, prompt_tokens, output_tokens.
+    label dipakai sebagai nama span di trace (gemini.row, gemini.detail, ...).
 
-    file_uri = _upload_temp_pdf_to_gcs(pdf_path, invoice_name)
+    stream=True memakai generate_content_stream; setiap object JSON array
+    yang sudah lengkap dikirim ke on_item(index, item) dan dikumpulkan di "items".
 
+    response_schema: schema output prompt (lihat schema.py), ikut masuk cache key.
+    """
+
+    use_cache = use_cache and not cache_bypassed()
+    cache_key = None
+    config = _generation_config(response_schema)
+
+    with span(f"gemini.{label}", model=MODEL_NAME) as attrs:
+
+        if use_cache:
+            cache_key = make_cache_key(
+                pdf_input["sha256"], prompt, MODEL_NAME, config
+            )
+            cached = None if refresh else cache_get(cache_key)
+            if cached and cached.get("text"):
+                attrs["cache_hit"] = True
+                return cached
+
+        if stream:
+            call = lambda: _generate_content_stream(pdf_input["uri"], prompt, config, on_item=on_item)
+        else:
+            call = lambda: _generate_content(pdf_input["uri"], prompt, config)
+
+        # rate limit, concurrency cap global & retry 429/5xx (lihat scheduler.py)
+        result, attempts = scheduler.call(
+            MODEL_NAME, call, _estimate_tokens(pdf_input, prompt)
+        )
+
+        attrs["attempts"] = attempts
+        attrs["first_item_sec"] = result.get("first_item_sec")
+        attrs["cache_hit"] = False
+        attrs["prompt_tokens"] = result.get("prompt_tokens")
+        attrs["output_tokens"] = result.get("output_tokens")
+        attrs["finish_reason"] = result.get("finish_reason")
+
+        if use_cache:
+            # items bisa dibangun ulang dari text, tidak perlu disimpan
+            cache_put(
+                cache_key,
+                {k: v for k, v in result.items() if k != "items"},
+                MODEL_NAME,
+            )
+
+    return result
+
+
+def _estimate_tokens(pdf_input, prompt):
+    """
+    Estimasi kasar token 1 call (untuk token bucket), dikoreksi
+    dengan usage_metadata setelah response diterima.
+    """
+    pages = pdf_input.get("pages") or 1
+    return (
+        pages * GEMINI_TOKENS_PER_PAGE
+        + len(prompt) // 4
+        + GEMINI_EXPECTED_OUTPUT_TOKENS
+    )
+
+
+def _response_meta(response):
+    finish_reason = None
+    if response.candidates:
+        fr = response.candidates[0].finish_reason
+        finish_reason = getattr(fr, "name", None) or (str(fr) if fr else None)
+
+    usage = getattr(response, "usage_metadata", None)
+
+    return {
+        "finish_reason": finish_reason,
+        "prompt_tokens": getattr(usage, "prompt_token_count", None),
+        "output_tokens": getattr(usage, "candidates_token_count", None),
+    }
+
+
+def _build_contents(file_uri, prompt):
     parts = [
         types.Part.from_uri(
             file_uri=file_uri,
@@ -152,58 +629,180 @@ def _call_gemini(pdf_path, prompt, invoice_name):
     ]
     parts.append(types.Part.from_text(text=prompt))
 
+    return [
+        types.Content(
+            role="user",
+            parts=parts,
+        )
+    ]
+
+
+class _JsonArrayStream:
+    """
+    Parser JSON array incremental (ijson): feed(text) per chunk,
+    object yang sudah tertutup langsung tersedia di items.
+    Teks sebelum '[' (misal code fence) dilewati.
+
+    on_item(index, item): index = posisi item di stream ini (0-based),
+    supaya consumer bisa dedup item yang dikirim ulang saat retry.
+    """
+
+    def __init__(self, on_item=None):
+        self.items = []
+        self.on_item = on_item
+        self._events = ijson.sendable_list()
+        self._coro = ijson.items_coro(self._events, "item", use_float=True)
+        self._prefix = ""
+        self._started = False
+        self._broken = False
+
+    def feed(self, text):
+        if self._broken or not text:
+            return
+
+        if not self._started:
+            self._prefix += text
+            idx = self._prefix.find("[")
+            if idx == -1:
+                return
+            text = self._prefix[idx:]
+            self._started = True
+
+        try:
+            self._coro.send(text.encode("utf-8"))
+        except ijson.JSONError:
+            # trailing garbage / output terpotong: item yang sudah lengkap tetap dipakai
+            self._broken = True
+
+        self._drain()
+
+    def close(self):
+        if self._started and not self._broken:
+            try:
+                self._coro.close()
+            except ijson.JSONError:
+                pass
+            self._drain()
+        return self.items
+
+    def _drain(self):
+        for item in self._events:
+            self.items.append(item)
+            if self.on_item:
+                self.on_item(len(self.items) - 1, item)
+        del self._events[:]
+
+
+def _json_array_prefix(text):
+    """
+    Ambil semua object lengkap dari JSON array (boleh terpotong di tengah).
+    """
+    parser = _JsonArrayStream()
+    parser.feed(text or "")
+    return parser.close()
+
+
+def _generate_content_stream(file_uri, prompt, config, on_item=None):
+    """
+    Streaming generate_content: text dikumpulkan per chunk dan
+    di-parse incremental supaya row pertama tersedia lebih cepat.
+    """
+    parser = _JsonArrayStream(on_item=on_item)
+    chunks = []
+    last_chunk = None
+    finish_reason = None
+    first_item_sec = None
+    start = time.perf_counter()
+
+    try:
+        for chunk in genai_client.models.generate_content_stream(
+            model=MODEL_NAME,
+            contents=_build_contents(file_uri, prompt),
+            config=types.GenerateContentConfig(**config),
+        ):
+            last_chunk = chunk
+            text = chunk.text or ""
+            chunks.append(text)
+            parser.feed(text)
+
+            if first_item_sec is None and parser.items:
+                first_item_sec = round(time.perf_counter() - start, 3)
+
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = _response_meta(chunk)["finish_reason"]
+
+        items = parser.close()
+        text_output = "".join(chunks).strip()
+
+        if not text_output:
+            raise Exception("Gemini response tidak mengandung text")
+
+        result = _response_meta(last_chunk)
+        result["finish_reason"] = finish_reason or result["finish_reason"]
+        result["text"] = text_output
+        result["items"] = items
+        result["first_item_sec"] = first_item_sec
+
+        return result
+
+    except Exception as e:
+        raise Exception(f"Gemini call failed: {str(e)}") from e
+
+
+def _generate_content(file_uri, prompt, config):
+
     try:
         response = genai_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[
-                types.Content(
-                    role="user",
-                    parts=parts,
-                )
-            ],
-            config=types.GenerateContentConfig(
-                temperature=0.05,
-                top_p=1,
-                max_output_tokens=65535,
-            ),
+            model=MODEL_NAME,
+            contents=_build_contents(file_uri, prompt),
+            config=types.GenerateContentConfig(**config),
         )
 
         if not response:
             raise Exception("Empty response from Gemini")
 
+        text_output = None
+
         if hasattr(response, "text") and response.text:
-            return response.text.strip()
+            text_output = response.text.strip()
 
-        if response.candidates:
+        elif response.candidates:
             parts_resp = response.candidates[0].content.parts
             text_output = ""
             for p in parts_resp:
                 if hasattr(p, "text") and p.text:
                     text_output += p.text
-            if text_output:
-                return text_output.strip()
+            text_output = text_output.strip()
+
+        if not text_output:
+            raise Exception("Gemini response tidak mengandung text")
 
-        raise Exception("Gemini response tidak mengandung text")
+        result = _response_meta(response)
+        result["text"] = text_output
+
+        return result
 
     except Exception as e:
-        raise Exception(f"Gemini call failed: {str(e)}")
+        raise Exception(f"Gemini call failed: {str(e)}") from e
 
 # ==============================
 # GET TOTAL ROW
 # ==============================
 
-def _get_total_row(pdf_path, invoice_name):
+def _get_total_row(pdf_input, use_cache=True):
 
     raw = _call_gemini(
-        pdf_path,
+        pdf_input,
         ROW_SYSTEM_INSTRUCTION,
-        invoice_name,
+        use_cache=use_cache,
+        label="row",
+        response_schema=ROW_RESPONSE_SCHEMA,
     )
 
     print("=== RAW TOTAL ROW RESPONSE ===")
     print(raw)
 
-    data = _parse_json_safe(raw)
+    data = _parse_json(raw, label="row")
 
     if isinstance(data, dict) and "total_row" in data:
         return int(data["total_row"])
@@ -211,507 +810,709 @@ def _get_total_row(pdf_path, invoice_name):
     raise Exception(f"total_row tidak ditemukan di response: {data}")
 
 # ==============================
-# SAVE BATCH TMP
+# PAGE MAP (SLICE PDF PER BATCH)
 # ==============================
 
-def _save_batch_tmp(invoice_name, batch_no, json_array):
+def _document_page_ranges(pdf_sources):
+    """
+    Range halaman tiap dokumen di dalam merged PDF (1-based).
+    """
+    ranges = []
+    start = 1
 
-    if not isinstance(json_array, list):
-        raise Exception("Batch result bukan array")
+    for i, p in enumerate(pdf_sources, start=1):
+        n = len(PdfReader(p).pages)
+        ranges.append({"document": i, "first_page": start, "last_page": start + n - 1})
+        start += n
 
-    bucket = storage_client.bucket(BUCKET_NAME)
+    return ranges
 
-    blob_path = f"{TMP_PREFIX}/{invoice_name}_batch_{batch_no}.json"
 
-    bucket.blob(blob_path).upload_from_string(
-        json.dumps(json_array, indent=2),
-        content_type="application/json"
-    )
+def _get_page_map(pdf_input, documents, use_cache=True):
+    """
+    Pre-pass: petakan index line item → halaman di merged PDF.
+    Slicing hanya optimasi, jadi kalau gagal return None (pakai PDF penuh).
+    """
+    try:
+        raw = _call_gemini(
+            pdf_input, build_page_map_prompt(documents), use_cache=use_cache,
+            label="page_map", response_schema=PAGE_MAP_RESPONSE_SCHEMA,
+        )
+        data = _parse_json(raw, label="page_map")
+
+        total_pages = documents[-1]["last_page"]
+
+        def valid_pages(pages):
+            result = set()
+            for p in pages or []:
+                try:
+                    p = int(p)
+                except (TypeError, ValueError):
+                    continue
+                if 1 <= p <= total_pages:
+                    result.add(p)
+            return result
+
+        # halaman pertama tiap dokumen + dokumen pendek (BL/COO) selalu ikut
+        header_pages = set()
+        for d in documents:
+            header_pages.add(d["first_page"])
+            if d["last_page"] - d["first_page"] + 1 <= PAGE_SLICE_SMALL_DOC_PAGES:
+                header_pages |= set(range(d["first_page"], d["last_page"] + 1))
+
+        for d in data.get("documents", []):
+            header_pages |= valid_pages(d.get("header_pages"))
+
+        item_pages = {}
+        for item in data.get("items", []):
+            try:
+                idx = int(item.get("index"))
+            except (TypeError, ValueError):
+                continue
+            pages = valid_pages(item.get("pages"))
+            if pages:
+                item_pages[idx] = pages
 
-# ==============================
-# MERGE ALL BATCHES
-# ==============================
+        return {
+            "total_pages": total_pages,
+            "header_pages": header_pages,
+            "item_pages": item_pages,
+        }
 
-def _merge_all_batches(invoice_name):
+    except Exception as e:
+        print(f"Page map gagal, detail memakai PDF penuh: {e}")
+        return None
 
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blobs = list(bucket.list_blobs(prefix=f"{TMP_PREFIX}/{invoice_name}_batch_"))
 
-    all_rows = []
+def _build_sub_pdf(pdf_input, pages):
+    buffers = pdf_input["buffers"]
+    out = buffers.new()
 
-    for blob in blobs:
-        content = blob.download_as_text()
-        data = json.loads(content)
-        if isinstance(data, list):
-            all_rows.extend(data)
+    # PdfReader / PdfWriter membaca object secara lazy dari buffer yang sama
+    with pdf_input["lock"]:
+        reader = PdfReader(pdf_input["source"])
+        writer = PdfWriter()
 
-    return all_rows
+        for p in pages:
+            writer.add_page(reader.pages[p - 1])
 
-# ==============================
-# FILL INV SEQ (aman)
-# ==============================
+        writer.write(out)
 
-def _fill_inv_seq(detail_rows):
-    """
-    Mengisi field inv_seq berdasarkan jumlah kemunculan
-    inv_customer_po_no pada seluruh detail_rows.
+    buffers.written(out)
 
-    - Untuk setiap inv_customer_po_no baru → inv_seq = 1
-    - Jika sudah pernah muncul → increment
-    - Jika inv_customer_po_no null/kosong → inv_seq = "null"
-    """
+    return out
 
-    counter = {}
 
-    for row in detail_rows:
+def _slice_input_for_window(pdf_input, page_map, first_index, last_index):
+    """
+    Return (pdf_input, page_hint) untuk 1 window detail.
+    Kalau ada index yang halamannya tidak diketahui, atau potongan hampir
+    sebesar PDF asli, pakai PDF penuh (page_hint None).
+    """
+    if not page_map:
+        return pdf_input, None
 
-        if not isinstance(row, dict):
-            continue
+    pages = set(page_map["header_pages"])
 
-        po_no = row.get("inv_customer_po_no")
+    for idx in range(first_index, last_index + 1):
+        item_pages = page_map["item_pages"].get(idx)
+        if not item_pages:
+            return pdf_input, None
+        pages |= item_pages
 
-        # jika PO null → seq juga null
-        if po_no in (None, "", "null"):
-            row["inv_seq"] = "null"
-            continue
+    if len(pages) >= page_map["total_pages"] * PAGE_SLICE_MAX_RATIO:
+        return pdf_input, None
 
-        # normalisasi sederhana (trim)
-        po_no = str(po_no).strip()
+    pages = sorted(pages)
 
-        # hitung counter
-        if po_no not in counter:
-            counter[po_no] = 1
-        else:
-            counter[po_no] += 1
+    # digest turunan dari PDF asli + daftar halaman (deterministik untuk cache)
+    digest = hashlib.sha256(
+        f"{pdf_input['sha256']}:{','.join(map(str, pages))}".encode("utf-8")
+    ).hexdigest()
 
-        row["inv_seq"] = counter[po_no]
+    with span("slice_pdf", pages=len(pages), total_pages=page_map["total_pages"]):
+        sub_buf = _build_sub_pdf(pdf_input, pages)
+        try:
+            sub_input = _upload_temp_pdf_to_gcs(
+                sub_buf, pdf_input["buffers"], digest=digest
+            )
+        finally:
+            # potongan hanya perlu sampai ter-upload
+            pdf_input["buffers"].close(sub_buf)
+        sub_input["source"] = None
+
+    page_hint = {
+        "pages": pages,
+        "first_item_pages": sorted(page_map["item_pages"][first_index]),
+    }
 
-    return detail_rows
+    return sub_input, page_hint
 
 # ==============================
-# HELPER VALIDATION (aman)
+# TOTAL / CONTAINER (DOCUMENT LEVEL)
 # ==============================
 
-def _init_match_fields(detail_rows):
-    for row in detail_rows:
-        row["match_score"] = "true"
-        row["match_description"] = "null"
-    return detail_rows
-
-
-def _add_error(row, message):
-    row["match_score"] = "false"
-
-    if row.get("match_description") in (None, "", "null"):
-        row["match_description"] = message
-    else:
-        row["match_description"] += "; " + message
+def _extract_document_level(pdf_input, system_instruction, use_cache=True, label="document", response_schema=None):
+    """
+    OCR TOTAL / CONTAINER: 1 call untuk seluruh dokumen, hasil selalu list.
+    """
+    raw = _call_gemini(
+        pdf_input, system_instruction, use_cache=use_cache, label=label,
+        response_schema=response_schema,
+    )
 
+    data = _parse_json(raw, label=label)
+    if isinstance(data, dict):
+        data = [data]
 
-def _to_float(x):
-    try:
-        return float(str(x).replace(",", "").strip())
-    except:
-        return None
+    return data
 
 # ==============================
-# INVOICE VALIDATION 
+# SAVE BATCH TMP
 # ==============================
 
-def _validate_invoice(detail_rows): #aman
-
-    mandatory_fields = [
-        "inv_invoice_no",
-        "inv_invoice_date",
-        "inv_customer_po_no",
-        "inv_vendor_name",
-        "inv_vendor_address",
-        "inv_spart_item_no",
-        "inv_description",
-        "inv_quantity",
-        "inv_quantity_unit",
-        "inv_unit_price",
-        "inv_price_unit",
-        "inv_amount",
-        "inv_amount_unit",
-    ]
-
-    for row in detail_rows:
-
-        for f in mandatory_fields:
-            if row.get(f) in (None, "", "null"):
-                _add_error(row, f"{f} tidak boleh null")
+def _save_batch_tmp(job_prefix, invoice_name, batch_no, json_array):
+    """
+    Checkpoint 1 batch ke GCS (JSON compact). Hanya untuk crash recovery,
+    hasil batch sendiri langsung dipakai dari memory.
+    """
 
-        qty = _to_float(row.get("inv_quantity"))
-        price = _to_float(row.get("inv_unit_price"))
-        amount = _to_float(row.get("inv_amount"))
+    if not isinstance(json_array, list):
+        raise Exception("Batch result bukan array")
 
-        if qty is not None and price is not None and amount is not None:
-            calc = round(qty * price, 2)
-            if round(amount, 2) != calc:
-                _add_error(
-                    row,
-                    f"inv_amount ({amount}) tidak sesuai dengan perhitungan ({qty} x {price} = {calc})"
-                )
+    bucket = storage_client.bucket(BUCKET_NAME)
 
-    return detail_rows
+    blob_path = f"{job_prefix}/{invoice_name}_batch_{batch_no}.json"
 
-def _validate_invoice_totals(detail_rows): #stengah aman
+    with span("checkpoint_write", bytes=None) as attrs:
+        payload = json.dumps(json_array, separators=(",", ":"), ensure_ascii=False)
+        attrs["bytes"] = len(payload.encode("utf-8"))
 
-    invoice_total_map = {
-        "inv_total_quantity": "inv_quantity",
-        "inv_total_amount": "inv_amount",
-    }
+        bucket.blob(blob_path).upload_from_string(
+            payload,
+            content_type="application/json"
+        )
 
-    cross_doc_total_map = {
-        "inv_total_nw": "pl_nw",
-        "inv_total_gw": "pl_gw",
-        "inv_total_volume": "pl_volume",
-        "inv_total_package": "pl_package_count",
-    }
 
-    # HITUNG TOTAL INTERNAL INVOICE
-    calculated = {}
-
-    for total_field, detail_field in invoice_total_map.items():
-        total = 0.0
-        for row in detail_rows:
-            val = _to_float(row.get(detail_field))
-            if val is not None:
-                total += val
-        calculated[total_field] = round(total, 2)
-
-    # HITUNG TOTAL CROSS DOC (PL)
-    pl_available = any(
-        row.get("pl_invoice_no") not in (None, "", "null")
-        for row in detail_rows
-    )
+def _write_checkpoint(job_prefix, invoice_name, manifest, first_index, last_index, json_array):
+    """
+    Dijalankan di background writer: gagal checkpoint tidak boleh
+    menggagalkan job (data tetap ada di memory).
+    Window baru dicatat di manifest SETELAH checkpoint-nya tersimpan.
+    """
+    try:
+        _save_batch_tmp(job_prefix, invoice_name, first_index, json_array)
+        _mark_window_done(job_prefix, manifest, first_index, last_index)
+    except Exception as e:
+        print(f"Checkpoint batch {first_index}-{last_index} gagal: {e}")
 
-    if pl_available:
-        for total_field, detail_field in cross_doc_total_map.items():
-            total = 0.0
-            for row in detail_rows:
-                val = _to_float(row.get(detail_field))
-                if val is not None:
-                    total += val
-            calculated[total_field] = round(total, 2)
 
-    # VALIDASI PER LINE
-    for row in detail_rows:
+def _load_batch_checkpoints(job_prefix, invoice_name, windows):
+    """
+    Resume: download checkpoint untuk window yang tercatat selesai di manifest.
+    Window yang checkpoint-nya hilang dianggap belum dikerjakan.
+    Return {first_index: (last_index, rows)}.
+    """
+    bucket = storage_client.bucket(BUCKET_NAME)
 
-        for total_field, calc_value in calculated.items():
+    def load(window):
+        first_index, last_index = window
+        blob = bucket.get_blob(f"{job_prefix}/{invoice_name}_batch_{first_index}.json")
+        if blob is None:
+            return None
+        data = json.loads(blob.download_as_text())
+        if not isinstance(data, list):
+            return None
+        return first_index, last_index, data
 
-            extracted = _to_float(row.get(total_field))
-            if extracted is None:
-                continue
+    loaded = {}
 
-            if round(extracted, 2) != calc_value:
-                _add_error(
-                    row,
-                    f"{total_field} ({extracted}) tidak sesuai dengan total hasil perhitungan ({calc_value})"
-                )
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for item in executor.map(load, windows):
+            if item is not None:
+                first_index, last_index, rows = item
+                loaded[first_index] = (last_index, rows)
 
-    return detail_rows
+    return loaded
 
 # ==============================
-# PACKING LIST VALIDATION (aman)
+# JOB MANIFEST (RESUME)
 # ==============================
 
-def _validate_pl(detail_rows): #aman
-
-    mandatory = [
-        "pl_invoice_no",
-        "pl_invoice_date",
-        "pl_messrs",
-        "pl_messrs_address",
-        "pl_item_no",
-        "pl_description",
-        "pl_quantity",
-        "pl_package_unit",
-        "pl_package_count",
-        "pl_weight_unit",
-        "pl_nw",
-        "pl_gw",
-        "pl_volume_unit",
-        "pl_volume",
-    ]
+_manifest_lock = threading.Lock()
 
-    for row in detail_rows:
 
-        for f in mandatory:
-            if row.get(f) in (None, "", "null"):
-                _add_error(row, f"{f} tidak boleh null")
+def _manifest_blob_path(job_prefix):
+    return f"{job_prefix}/manifest.json"
 
-        if row.get("pl_invoice_no") != row.get("inv_invoice_no"):
-            _add_error(row, "pl_invoice_no tidak sama dengan inv_invoice_no")
 
-        if row.get("pl_invoice_date") != row.get("inv_invoice_date"):
-            _add_error(row, "pl_invoice_date tidak sama dengan inv_invoice_date")
+def _load_manifest(job_prefix):
+    blob = storage_client.bucket(BUCKET_NAME).get_blob(_manifest_blob_path(job_prefix))
+    if blob is None:
+        return None
 
-        if row.get("pl_messrs") != row.get("inv_messrs"):
-            _add_error(row, "pl_messrs tidak sama dengan inv_messrs")
+    try:
+        return json.loads(blob.download_as_text())
+    except Exception as e:
+        print(f"Manifest {job_prefix} rusak, mulai dari awal: {e}")
+        return None
 
-        if row.get("pl_messrs_address") != row.get("inv_messrs_address"):
-            _add_error(row, "pl_messrs_address tidak sama dengan inv_messrs_address")
 
-    return detail_rows
+def _save_manifest(job_prefix, manifest):
+    # dipanggil dengan _manifest_lock supaya upload tidak saling menimpa
+    storage_client.bucket(BUCKET_NAME).blob(_manifest_blob_path(job_prefix)).upload_from_string(
+        json.dumps(manifest, separators=(",", ":")),
+        content_type="application/json"
+    )
 
-def _validate_pl_totals(detail_rows):
 
-    total_map = {
-        "pl_total_quantity": "pl_quantity",
-        "pl_total_amount": "pl_amount",
-        "pl_total_nw": "pl_nw",
-        "pl_total_gw": "pl_gw",
-        "pl_total_volume": "pl_volume",
-        "pl_total_package": "pl_package_count",
+def _init_manifest(job_prefix, pdf_sha256):
+    """
+    Manifest job: hash merged PDF, total_row dan window first..last yang
+    sudah selesai. Kalau manifest lama cocok dengan PDF yang sama → resume.
+    """
+    manifest = _load_manifest(job_prefix)
+
+    if manifest and manifest.get("pdf_sha256") == pdf_sha256:
+        manifest.setdefault("windows", [])
+        return manifest, True
+
+    manifest = {
+        "pdf_sha256": pdf_sha256,
+        "total_row": None,
+        "windows": [],
     }
 
-    calculated = {}
+    with _manifest_lock:
+        _save_manifest(job_prefix, manifest)
 
-    for total_field, detail_field in total_map.items():
-        total = 0.0
-        for row in detail_rows:
-            val = _to_float(row.get(detail_field))
-            if val is not None:
-                total += val
-        calculated[total_field] = round(total, 2)
+    return manifest, False
 
-    for row in detail_rows:
-        for total_field in total_map.keys():
-            extracted = _to_float(row.get(total_field))
-            if extracted is None:
-                continue
 
-            if round(extracted, 2) != calculated[total_field]:
-                _add_error(
-                    row,
-                    f"{total_field} ({extracted}) tidak sesuai dengan total hasil perhitungan ({calculated[total_field]})"
-                )
+def _set_manifest_total_row(job_prefix, manifest, total_row):
+    with _manifest_lock:
+        manifest["total_row"] = total_row
+        _save_manifest(job_prefix, manifest)
 
-    return detail_rows
+
+def _mark_window_done(job_prefix, manifest, first_index, last_index):
+    with _manifest_lock:
+        manifest["windows"].append([first_index, last_index])
+        _save_manifest(job_prefix, manifest)
 
 # ==============================
-# BILL OF LADING VALIDATION (aman)
+# DETAIL WINDOW PLAN (CACHE)
 # ==============================
-def _validate_bl(detail_rows):
+#
+# Window detail (first..last) ikut menentukan prompt → cache key Gemini.
+# Rencana window disimpan di cache per (PDF, total_row, parameter batcher)
+# supaya run ulang PDF yang sama memakai window yang persis sama.
+
+def _window_plan_key(pdf_sha256, total_row):
+    return make_cache_key(
+        pdf_sha256,
+        f"detail_window_plan:{total_row}",
+        MODEL_NAME,
+        {
+            "initial_size": DETAIL_BATCH_INITIAL_SIZE,
+            "min_size": DETAIL_BATCH_MIN_SIZE,
+            "max_size": DETAIL_BATCH_MAX_SIZE,
+            "target_output_tokens": DETAIL_BATCH_TARGET_OUTPUT_TOKENS,
+            "page_slicing": PAGE_SLICING,
+        },
+    )
 
-    for row in detail_rows:
 
-        if row.get("bl_no") in (None, "", "null"):
-            continue
+def _load_window_plan(pdf_sha256, total_row):
+    if cache_bypassed():
+        return None
+
+    entry = cache_get(_window_plan_key(pdf_sha256, total_row))
+    if not entry or not entry.get("windows"):
+        return None
 
-        if row.get("bl_seller_name") in (None, "", "null"):
-            row["bl_seller_name"] = row.get("bl_shipper_name")
-
-        if row.get("bl_seller_address") in (None, "", "null"):
-            row["bl_seller_address"] = row.get("bl_shipper_address")
-
-        mandatory = [
-            "bl_shipper_name",
-            "bl_shipper_address",
-            "bl_no",
-            "bl_date",
-            "bl_consignee_name",
-            "bl_consignee_address",
-            "bl_vessel",
-            "bl_voyage_no",
-            "bl_port_of_loading",
-            "bl_port_of_destination",
-        ]
-
-        for f in mandatory:
-            if row.get(f) in (None, "", "null"):
-                _add_error(row, f"{f} tidak boleh null (BL tersedia)")
-
-        if str(row.get("bl_seller_name","")).strip().lower() != \
-            str(row.get("inv_vendor_name","")).strip().lower():
-            _add_error(row, "bl_seller_name tidak sama dengan inv_vendor_name")
+    return [tuple(w) for w in entry["windows"]]
 
-    return detail_rows
+
+def _save_window_plan(pdf_sha256, total_row, windows):
+    if cache_bypassed() or not windows:
+        return
+
+    cache_put(_window_plan_key(pdf_sha256, total_row), {"windows": [list(w) for w in windows]}, MODEL_NAME)
 
 # ==============================
-# COO VALIDATION
+# DETAIL BATCH EXECUTOR
 # ==============================
 
-def _validate_coo(detail_rows):
+class _DetailOutputError(Exception):
+    """
+    Output detail Gemini tidak bisa dipakai (rusak / bentuk salah).
+    Hanya error ini yang di-retry di level batch; error transient
+    (429 / 5xx / timeout) sudah di-retry scheduler.
+    """
 
-    for row in detail_rows:
 
-        if row.get("coo_no") in (None, "", "null"):
-            continue
-        
-        # FIELD WAJIB
-        mandatory = [
-            "coo_no",
-            "coo_form_type",
-            "coo_invoice_no",
-            "coo_invoice_date",
-            "coo_shipper_name",
-            "coo_shipper_address",
-            "coo_consignee_name",
-            "coo_consignee_address",
-            "coo_seq",
-            "coo_description",
-            "coo_hs_code",
-            "coo_quantity",
-            "coo_unit",
-            "coo_criteria",
-            "coo_origin_country",
-        ]
-
-        for f in mandatory:
-            if row.get(f) in (None, "", "null"):
-                _add_error(row, f"{f} tidak boleh null (COO tersedia)")
-
-        # CONDITIONAL WAJIB
-        criteria = str(row.get("coo_criteria", "")).strip().upper()
-
-        if criteria == "RVC":
-            if row.get("coo_amount") in (None, "", "null"):
-                _add_error(row, "coo_amount wajib jika criteria = RVC")
-            if row.get("coo_amount_unit") in (None, "", "null"):
-                _add_error(row, "coo_amount_unit wajib jika criteria = RVC")
-
-        if criteria == "PE":
-            if row.get("coo_gw") in (None, "", "null"):
-                _add_error(row, "coo_gw wajib jika criteria = PE")
-            if row.get("coo_gw_unit") in (None, "", "null"):
-                _add_error(row, "coo_gw_unit wajib jika criteria = PE")
-
-        # VALIDASI TERHADAP INVOICE
-        # -------- numeric compare --------
-        coo_qty = _to_float(row.get("coo_quantity"))
-        inv_qty = _to_float(row.get("inv_quantity"))
-
-        if coo_qty is not None and inv_qty is not None:
-            if round(coo_qty, 2) != round(inv_qty, 2):
-                _add_error(
-                    row,
-                    f"coo_quantity ({coo_qty}) tidak sama dengan inv_quantity ({inv_qty})"
-                )
+def _run_detail_batch(pdf_input, job_prefix, invoice_name, total_row, first_index, last_index, use_cache=True, page_map=None):
+    """
+    Proses 1 window detail dengan retry per window untuk output yang
+    rusak, supaya 1 batch gagal tidak mengulang seluruh invoice.
+    Error Gemini transient di-retry scheduler (GEMINI_MAX_RETRY), tidak
+    diulang lagi di sini.
+
+    Return dict:
+    - rows: hasil parse (None kalau window perlu dipecah)
+    - split_reason: "truncated" / "parse_failed" kalau window perlu dipecah
+    - tail: (first, last) index yang belum ada kalau output terpotong
+      tapi sebagian row sudah lengkap → hanya tail yang diminta ulang
+    - output_tokens: token output Gemini (untuk estimasi ukuran batch)
+    """
 
-        coo_amount = _to_float(row.get("coo_amount"))
-        inv_amount = _to_float(row.get("inv_amount"))
+    # kirim hanya halaman yang relevan untuk window ini (kalau page map tersedia).
+    # Slicing hanya optimasi: kalau potong / upload gagal, pakai PDF penuh
+    # daripada menggagalkan batch (dan job).
+    try:
+        pdf_input, page_hint = _slice_input_for_window(pdf_input, page_map, first_index, last_index)
+    except Exception as e:
+        print(f"Slice batch {first_index}-{last_index} gagal, pakai PDF penuh: {e}")
+        record_event("slice_fallback", first_index=first_index, last_index=last_index, error=str(e)[:500])
+        page_hint = None
+
+    prompt = build_detail_prompt(
+        total_row=total_row,
+        first_index=first_index,
+        last_index=last_index,
+        page_hint=page_hint,
+    )
 
-        if coo_amount is not None and inv_amount is not None:
-            if round(coo_amount, 2) != round(inv_amount, 2):
-                _add_error(
-                    row,
-                    f"coo_amount ({coo_amount}) tidak sama dengan inv_amount ({inv_amount})"
+    with span(
+        "detail_batch",
+        first_index=first_index,
+        last_index=last_index,
+        sliced=page_hint is not None,
+    ) as attrs:
+
+        last_error = None
+
+        for attempt in range(1, DETAIL_BATCH_MAX_RETRY + 1):
+            attrs["attempts"] = attempt
+            try:
+                # retry tidak boleh mengambil response (rusak) yang sama dari cache
+                response = _call_gemini_full(
+                    pdf_input,
+                    prompt,
+                    use_cache=use_cache,
+                    refresh=attempt > 1,
+                    label="detail",
+                    stream=GEMINI_STREAMING,
+                    # row streaming → progress live (dedup per posisi, aman untuk retry)
+                    on_item=lambda index, item: report_item_streamed(first_index, index + 1),
+                    response_schema=DETAIL_RESPONSE_SCHEMA,
                 )
+                raw = response["text"]
+
+                print(f"========== RAW GEMINI DETAIL ({first_index}-{last_index}) ==========")
+                print(raw)
+                print("========================================")
+
+                output_tokens = response.get("output_tokens") or len(raw) // 4
+                truncated = response.get("finish_reason") == "MAX_TOKENS"
+
+                json_array = None
+                if not truncated:
+                    try:
+                        json_array = _parse_json(raw, label="detail")
+                    except Exception:
+                        json_array = None
+
+                if json_array is None:
+                    # output terpotong / rusak: pakai object yang sudah lengkap,
+                    # minta ulang hanya index sisanya
+                    items = response.get("items")
+                    if items is None:
+                        items = _json_array_prefix(raw)
+                    items = normalize_nulls(items)
+
+                    window_size = last_index - first_index + 1
+                    reason = "truncated" if truncated else "parse_failed"
+
+                    if 0 < len(items) < window_size:
+                        attrs["tail_from"] = first_index + len(items)
+                        return {
+                            "rows": items,
+                            "split_reason": None,
+                            "tail": (first_index + len(items), last_index),
+                            "output_tokens": output_tokens,
+                        }
+
+                    if last_index > first_index:
+                        attrs["split_reason"] = reason
+                        return {"rows": None, "split_reason": reason, "output_tokens": output_tokens}
+
+                    if items:
+                        json_array = items
+                    else:
+                        raise _DetailOutputError(f"Output detail {reason}")
+
+                if isinstance(json_array, dict):
+                    json_array = [json_array]
+
+                if not isinstance(json_array, list) or not all(isinstance(r, dict) for r in json_array):
+                    raise _DetailOutputError("Output detail bukan array object")
+
+                return {"rows": json_array, "split_reason": None, "output_tokens": output_tokens}
+
+            except _DetailOutputError as e:
+                last_error = e
+                print(f"Batch {first_index}-{last_index} gagal (percobaan {attempt}): {e}")
+
+                if attempt < DETAIL_BATCH_MAX_RETRY:
+                    time.sleep(DETAIL_BATCH_RETRY_DELAY * attempt)
+
+            except Exception as e:
+                # retry scheduler sudah habis / error permanen: tidak diulang
+                raise Exception(f"Batch {first_index}-{last_index} gagal: {e}") from e
+
+        raise Exception(
+            f"Batch {first_index}-{last_index} gagal setelah "
+            f"{DETAIL_BATCH_MAX_RETRY} percobaan: {last_error}"
+        )
 
-        coo_gw = _to_float(row.get("coo_gw"))
-        inv_gw = _to_float(row.get("inv_gw"))
 
-        if coo_gw is not None and inv_gw is not None:
-            if round(coo_gw, 2) != round(inv_gw, 2):
-                _add_error(
-                    row,
-                    f"coo_gw ({coo_gw}) tidak sama dengan inv_gw ({inv_gw})"
-                )
+def _run_detail_batches(pdf_input, job_prefix, invoice_name, total_row, max_workers=DETAIL_CONCURRENCY, use_cache=True, page_map=None, manifest=None, done_results=None):
+    """
+    Jalankan seluruh window detail secara paralel (dibatasi max_workers).
+    Ukuran window diatur AdaptiveBatcher berdasarkan token/row batch
+    sebelumnya. Hasil dikembalikan per first_index supaya urutan merge
+    tetap deterministik.
 
-        # -------- string compare --------
-        coo_amount_unit = str(row.get("coo_amount_unit") or "").strip()
-        inv_amount_unit = str(row.get("inv_amount_unit") or "").strip()
+    Checkpoint ke GCS ditulis di background (checkpoint_writer), tidak
+    menahan batch berikutnya.
 
-        if coo_amount_unit and inv_amount_unit:
-            if coo_amount_unit != inv_amount_unit:
-                _add_error(
-                    row,
-                    f"coo_amount_unit ({coo_amount_unit}) tidak sama dengan inv_amount_unit ({inv_amount_unit})"
-                )
+    done_results = {first_index: (last_index, rows)} dari checkpoint job
+    sebelumnya (resume); window tersebut tidak dikirim ke Gemini lagi.
+    """
 
-        coo_gw_unit = str(row.get("coo_gw_unit") or "").strip()
-        inv_gw_unit = str(row.get("inv_gw_unit") or "").strip()
+    done_results = done_results or {}
+    manifest = manifest if manifest is not None else {"windows": []}
 
-        if coo_gw_unit and inv_gw_unit:
-            if coo_gw_unit != inv_gw_unit:
-                _add_error(
-                    row,
-                    f"coo_gw_unit ({coo_gw_unit}) tidak sama dengan inv_gw_unit ({inv_gw_unit})"
-                )
+    # rencana window run sebelumnya (PDF sama) → prompt sama → cache hit
+    planned_windows = _load_window_plan(pdf_input["sha256"], total_row) if use_cache else None
 
-    return detail_rows
+    max_workers = max(1, max_workers)
+    batcher = AdaptiveBatcher(
+        total_row,
+        done_windows=[(f, last) for f, (last, _) in done_results.items()],
+        planned_windows=planned_windows,
+    )
+    results = {f: rows for f, (_, rows) in done_results.items()}
+    pending = {}
+    started_at = {}
+    rows_done = sum(len(rows or []) for rows in results.values())
+
+    progress = current_progress()
+    if progress is not None:
+        progress.set_workers(max_workers)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    checkpoint_writer = ThreadPoolExecutor(
+        max_workers=CHECKPOINT_WRITER_THREADS,
+        thread_name_prefix="checkpoint",
+    )
 
-# ===================================
-# GET PO JSON URI (DIRECT FROM GCS)
-# ===================================
+    def submit_next():
+        while len(pending) < max_workers:
+            window = batcher.next_window()
+            if window is None:
+                break
+
+            first_index, last_index = window
+            future = submit_with_context(
+                executor,
+                _run_detail_batch,
+                pdf_input,
+                job_prefix,
+                invoice_name,
+                total_row,
+                first_index,
+                last_index,
+                use_cache,
+                page_map,
+            )
+            pending[future] = window
+            started_at[future] = time.perf_counter()
+
+    def accept(future):
+        """
+        Catat hasil 1 batch selesai + submit checkpoint-nya.
+        Return (first_index, rows, latency, rows_done), None kalau window dipecah.
+        """
+        nonlocal rows_done
+
+        first_index, last_index = pending.pop(future)
+        latency = time.perf_counter() - started_at.pop(future)
+        outcome = future.result()
+
+        if outcome["split_reason"]:
+            print(f"Batch {first_index}-{last_index} dipecah ({outcome['split_reason']})")
+            batcher.split(first_index, last_index, outcome["split_reason"])
+            report_window_dropped(first_index)
+            return None
+
+        if outcome.get("tail"):
+            # sebagian row sudah lengkap, sisanya diminta ulang
+            tail_first, tail_last = outcome["tail"]
+            print(f"Batch {first_index}-{last_index} terpotong, minta ulang {tail_first}-{tail_last}")
+            last_index = tail_first - 1
+            batcher.requeue(tail_first, tail_last)
+
+        batcher.record(first_index, last_index, outcome["output_tokens"])
+        results[first_index] = outcome["rows"]
+        rows_done += len(outcome["rows"])
+
+        # checkpoint diberi nomor first_index supaya urutan = urutan line item
+        submit_with_context(
+            checkpoint_writer,
+            _write_checkpoint,
+            job_prefix,
+            invoice_name,
+            manifest,
+            first_index,
+            last_index,
+            outcome["rows"],
+        )
 
-def _get_po_json_uri():
+        return first_index, outcome["rows"], latency, rows_done
 
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blobs = list(bucket.list_blobs(prefix=f"{PO_PREFIX}/"))
+    try:
+        submit_next()
 
-    json_files = [
-        b for b in blobs
-        if b.name.endswith(".json") and not b.name.endswith("/")
-    ]
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            # semua batch selesai di-checkpoint dulu: report_batch_done
+            # bisa raise JobCancelled
+            accepted = [accept(future) for future in done]
 
-    if not json_files:
-        raise Exception("PO JSON tidak ditemukan di folder po/")
+            for item in accepted:
+                if item is not None:
+                    first_index, rows, latency, rows_done_at = item
+                    report_batch_done(first_index, len(rows), latency, rows_done_at, total_row)
 
-    if len(json_files) > 1:
-        raise Exception("Lebih dari 1 PO JSON ditemukan. Harus hanya 1 file.")
+            submit_next()
 
-    po_blob = json_files[0]
+    except Exception:
+        # batch yang belum jalan tidak perlu dikerjakan lagi
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    # 🔥 LANGSUNG RETURN URI ASLI
-    return f"gs://{BUCKET_NAME}/{po_blob.name}"
+        # batch yang sempat selesai (cancel / batch lain gagal) tetap
+        # di-checkpoint supaya retry tidak memanggil Gemini ulang
+        for future in list(pending):
+            if future.cancelled() or future.exception() is not None:
+                continue
+            try:
+                accept(future)
+            except Exception as e:
+                print(f"Checkpoint batch selesai gagal: {e}")
+
+        checkpoint_writer.shutdown(wait=True)
+        raise
+
+    executor.shutdown(wait=True)
+
+    # pastikan checkpoint selesai sebelum cleanup tmp job
+    checkpoint_writer.shutdown(wait=True)
+
+    # rencana hanya lengkap kalau semua window dibagikan di run ini (bukan resume)
+    if not done_results and batcher.planned != planned_windows:
+        _save_window_plan(pdf_input["sha256"], total_row, batcher.planned)
+
+    summary = batcher.summary()
+    print(f"BATCH SIZES {invoice_name}: {json.dumps(summary)}")
+
+    record_event(
+        "detail_batch_plan",
+        total_row=total_row,
+        tokens_per_row=summary["tokens_per_row"],
+        batch_sizes=[w["size"] for w in summary["windows"] if w["status"] == "ok"],
+        splits=sum(1 for w in summary["windows"] if w["status"] != "ok"),
+        resumed_windows=len(done_results),
+        planned=planned_windows is not None,
+    )
+
+    return results
 
 # ==============================
-# Nomalize PO NO
+# MERGE ALL BATCHES
 # ==============================
 
-def _norm_po_number(x):
-    if x is None:
-        return ""
-    s = str(x).strip()
-    s = re.sub(r"\D", "", s)  # ambil angka saja
-    return s.lstrip("0")      # buang leading zero untuk compare
+def _merge_batch_results(results):
+    """
+    Gabungkan hasil batch (in-memory) urut berdasarkan first_index.
+    """
+    all_rows = []
+
+    for first_index in sorted(results):
+        rows = results[first_index]
+        if isinstance(rows, list):
+            all_rows.extend(rows)
+
+    return all_rows
 
 # ==============================
-# FILTER PO JSON
+# FILL INV SEQ (aman)
 # ==============================
 
-def _stream_filter_po_lines(target_po_numbers):
+def _fill_inv_seq(detail_rows):
+    """
+    Mengisi field inv_seq berdasarkan jumlah kemunculan
+    inv_customer_po_no pada seluruh detail_rows.
 
-    target_po_numbers = {
-        _norm_po_number(x)
-        for x in (target_po_numbers or set())
-        if x is not None
-    }
+    - Untuk setiap inv_customer_po_no baru → inv_seq = 1
+    - Jika sudah pernah muncul → increment
+    - Jika inv_customer_po_no null/kosong → inv_seq = "null"
+    """
 
-    po_uri = _get_po_json_uri()
-    parsed = urlparse(po_uri)
+    counter = {}
 
-    bucket = storage_client.bucket(parsed.netloc)
-    blob = bucket.blob(parsed.path.lstrip("/"))
+    for row in detail_rows:
 
-    matched = []
+        if not isinstance(row, dict):
+            continue
 
-    with blob.open("rb") as f:
-        for item in ijson.items(f, "item"):
-            po_no = item.get("po_no")
-            if po_no is None:
-                continue
+        po_no = row.get("inv_customer_po_no")
+
+        # jika PO null → seq juga null
+        if po_no in (None, "", "null"):
+            row["inv_seq"] = "null"
+            continue
+
+        # normalisasi sederhana (trim)
+        po_no = str(po_no).strip()
+
+        # hitung counter
+        if po_no not in counter:
+            counter[po_no] = 1
+        else:
+            counter[po_no] += 1
 
-            if _norm_po_number(po_no) in target_po_numbers:
-                matched.append(item)
+        row["inv_seq"] = counter[po_no]
 
-    return matched
+    return detail_rows
 
 # ==============================
-# PO MAPPING
+# FILTER PO JSON
 # ==============================
 
-def _norm_key(x):
-    if x is None:
-        return ""
-    s = str(x).strip().upper()
-    s = re.sub(r"\s+", "", s)          # hapus spasi
-    s = re.sub(r"[^A-Z0-9]", "", s)    # hapus dash, slash, dll
-    return s
+def _stream_filter_po_lines(target_po_numbers):
+    """
+    Lookup PO line lewat cache per proses / index SQLite (lihat po_store.py).
+    Cache & index di-refresh otomatis kalau generation blob PO berubah.
+    """
+    return get_po_lines(target_po_numbers)
+
+# ==============================
+# PO MAPPING
+# ==============================
 
 def _map_po_to_details(po_lines, detail_rows):
     """
@@ -939,7 +1740,10 @@ def _map_po_to_total(total_data, po_lines, po_numbers_from_detail):
 # ==============================
 # (NEW) CONVERT TO CSV -> CUSTOM FOLDER/PATH
 # ==============================
-def _convert_to_csv_path(blob_path, rows):
+def _csv_payload(rows):
+    """
+    rows (list dict / 1 dict) → CSV bytes, kolom = union key semua row.
+    """
     if rows is None:
         raise Exception("Tidak ada data untuk CSV")
 
@@ -963,17 +1767,74 @@ def _convert_to_csv_path(blob_path, rows):
     if not keys:
         raise Exception("Row CSV tidak memiliki kolom")
 
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-    with open(tmp_file.name, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=keys)
-        writer.writeheader()
-        for r in rows:
-            writer.writerow(r if isinstance(r, dict) else {})
+    out = io.StringIO(newline="")
+    writer = csv.DictWriter(out, fieldnames=keys)
+    writer.writeheader()
+    for r in rows:
+        writer.writerow(r if isinstance(r, dict) else {})
 
-    bucket = storage_client.bucket(BUCKET_NAME)
-    bucket.blob(blob_path).upload_from_filename(tmp_file.name)
+    return out.getvalue().encode("utf-8"), len(rows)
 
-    return f"gs://{BUCKET_NAME}/{blob_path}"
+
+def _convert_to_csv_path(blob_path, rows, bucket_name=BUCKET_NAME):
+    """
+    Tulis rows sebagai CSV ke blob_path. Return (gs:// URI, ukuran bytes).
+    """
+    payload, row_count = _csv_payload(rows)
+
+    with span("csv_upload", path=blob_path, rows=row_count, bytes=len(payload)):
+        bucket = storage_client.bucket(bucket_name)
+        bucket.blob(blob_path).upload_from_string(payload, content_type="text/csv")
+
+    return f"gs://{bucket_name}/{blob_path}", len(payload)
+
+
+def _write_csv_local(path, rows):
+    """
+    Tulis rows sebagai CSV ke file lokal. Return (path absolut, ukuran bytes).
+    """
+    payload, row_count = _csv_payload(rows)
+    path = os.path.abspath(path)
+
+    with span("csv_write_local", path=path, rows=row_count, bytes=len(payload)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(payload)
+
+    return path, len(payload)
+
+
+def _write_report_csv(job_id, invoice_name, report_type, rows, output=None):
+    """
+    {report_type}/{invoice}_{report_type}.csv + catat di result catalog.
+
+    output (sink):
+    - None → gs://BUCKET_NAME/output/ (default, dipakai halaman Report)
+    - "gs://bucket/prefix" → bucket / prefix lain
+    - selain itu → folder lokal (CLI)
+    """
+    relative_path = f"{report_type}/{invoice_name}_{report_type}.csv"
+
+    if not output:
+        path = f"output/{relative_path}"
+        uri, size_bytes = _convert_to_csv_path(path, rows)
+    elif output.startswith("gs://"):
+        bucket_name, _, prefix = output[len("gs://"):].partition("/")
+        blob_path = f"{prefix.strip('/')}/{relative_path}" if prefix.strip("/") else relative_path
+        uri, size_bytes = _convert_to_csv_path(blob_path, rows, bucket_name)
+        # catalog menyimpan blob path hanya untuk bucket utama (signed URL Report)
+        path = blob_path if bucket_name == BUCKET_NAME else uri
+    else:
+        uri, size_bytes = _write_csv_local(os.path.join(output, relative_path), rows)
+        path = uri
+
+    catalog_finished(
+        job_id, report_type, path,
+        rows=len(rows) if isinstance(rows, list) else 1,
+        size_bytes=size_bytes,
+    )
+
+    return uri
 
 
 # =========================================================
@@ -987,121 +1848,269 @@ def _convert_to_csv(invoice_name, rows):
 
     keys = rows[0].keys()
 
-    tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-
-    with open(tmp_file.name, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=keys)
-        writer.writeheader()
-        writer.writerows(rows)
+    out = io.StringIO(newline="")
+    writer = csv.DictWriter(out, fieldnames=keys)
+    writer.writeheader()
+    writer.writerows(rows)
 
     bucket = storage_client.bucket(BUCKET_NAME)
     blob_path = f"output/{invoice_name}.csv"
 
-    bucket.blob(blob_path).upload_from_filename(tmp_file.name)
+    bucket.blob(blob_path).upload_from_string(out.getvalue(), content_type="text/csv")
 
     return f"gs://{BUCKET_NAME}/{blob_path}"
 
 
 # ==============================
-# MAIN RUN OCR
+# CLEANUP TMP (BATCH DELETE)
 # ==============================
 
-def run_ocr(invoice_name, uploaded_pdf_paths, with_total_container):
+GCS_BATCH_LIMIT = 100
+
 
+def _delete_prefix(prefix):
+    """
+    Hapus semua blob di bawah prefix memakai batch API storage
+    (maks 100 request per batch). Return jumlah blob yang dihapus.
+    """
     bucket = storage_client.bucket(BUCKET_NAME)
+    blobs = list(bucket.list_blobs(prefix=prefix))
 
-    # MERGE & COMPRESS PDF
-    merged_pdf = _merge_pdfs(uploaded_pdf_paths)
-    merged_pdf = _compress_pdf_if_needed(merged_pdf)
+    for i in range(0, len(blobs), GCS_BATCH_LIMIT):
+        # raise_exception=False: blob yang sudah terhapus (404) tidak menggagalkan job
+        with storage_client.batch(raise_exception=False):
+            for blob in blobs[i:i + GCS_BATCH_LIMIT]:
+                blob.delete()
 
-    # GET TOTAL ROW FROM GEMINI
-    total_row = _get_total_row(merged_pdf, invoice_name)
+    return len(blobs)
 
-    # BATCH DETAIL EXTRACTION
-    first_index = 1
-    batch_no = 1
+# ==============================
+# MAIN RUN OCR
+# ==============================
 
-    while first_index <= total_row:
+def run_ocr(invoice_name, uploaded_pdf_paths, with_total_container, detail_concurrency=None, use_cache=True, job_id=None, customer=None, on_progress=None, cancel_check=None, output=None, inputs_uploaded=None):
+    """
+    Jalankan pipeline OCR untuk 1 invoice. Setiap stage & Gemini call
+    dicatat sebagai span di trace JSON lines per job (lihat telemetry.py).
+
+    customer: nama customer untuk toggle rule validasi (RULE_OVERRIDES).
+    on_progress: callback(state) untuk setiap event progress (lihat progress.py),
+    selain catalog yang selalu di-update.
+    cancel_check: callable() → True kalau job diminta batal; dicek di setiap
+    event progress (antar batch detail / stage), lalu raise JobCancelled.
+    output: sink CSV (None = bucket default, gs://bucket/prefix, atau folder lokal).
+    inputs_uploaded: threading.Event yang di-set setelah upload input ke
+    tmp/{job_id}/input/ selesai (job jalan dari buffer memory sambil upload);
+    cleanup tmp menunggu event ini supaya blob input tidak dibuat ulang
+    setelah prefix job dihapus.
+    """
 
-        last_index = min(first_index + BATCH_SIZE - 1, total_row)
+    job_id = job_id or uuid.uuid4().hex
+    buffers = _BufferPool()
 
-        prompt = build_detail_prompt(
-            total_row=total_row,
-            first_index=first_index,
-            last_index=last_index
-        )
+    catalog_started(job_id, invoice_name, report_types_for(with_total_container))
 
-        raw = _call_gemini(merged_pdf, prompt, invoice_name)
-        
-        print("========== RAW GEMINI DETAIL ==========")
-        print(raw)
-        print("========================================")
-        
-        json_array = _parse_json_safe(raw)
-        if isinstance(json_array, dict):
-            json_array = [json_array]
-
-        print("========== PARSED TYPE ==========")
-        print(type(json_array))
-        print("==================================")
-
-        _save_batch_tmp(invoice_name, batch_no, json_array)
-
-        first_index = last_index + 1
-        batch_no += 1
-
-    # MERGE ALL GEMINI BATCHES
-    all_rows = _merge_all_batches(invoice_name)
-
-    if not all_rows:
-        raise Exception("Tidak ada data detail hasil Gemini")
-    
-    # 🔥 FILL INV SEQ DULU (SEBELUM PO MAPPING)
-    all_rows = _fill_inv_seq(all_rows)
-
-    # VALIDATION
-    all_rows = _init_match_fields(all_rows)
-
-    all_rows = _validate_invoice(all_rows)
-    all_rows = _validate_invoice_totals(all_rows)
-    all_rows = _validate_pl(all_rows)
-    all_rows = _validate_pl_totals(all_rows)
-    all_rows = _validate_bl(all_rows)
-    all_rows = _validate_coo(all_rows)
-
-   # LOAD RELEVANT PO LINES
-    po_numbers = {
-        row.get("inv_customer_po_no")
-        for row in all_rows
-        if isinstance(row, dict) and row.get("inv_customer_po_no")
-    }
+    listeners = [lambda state: catalog_progress(job_id, **state), on_progress]
+
+    with job_trace(job_id, invoice_name) as trace, job_progress(job_id, listeners, cancel_check) as progress:
+        try:
+            progress.emit("started")
+
+            with span("run_ocr", with_total_container=with_total_container):
+                result = _run_ocr_pipeline(
+                    job_id,
+                    invoice_name,
+                    uploaded_pdf_paths,
+                    with_total_container,
+                    buffers,
+                    detail_concurrency=detail_concurrency,
+                    use_cache=use_cache,
+                    customer=customer,
+                    output=output,
+                    inputs_uploaded=inputs_uploaded,
+                )
+
+            progress.emit("done")
+        except JobCancelled:
+            catalog_cancelled(job_id)
+            raise
+        except Exception as e:
+            catalog_failed(job_id, str(e))
+            raise
+        finally:
+            # semua buffer / file temp job ini ditutup, sukses maupun gagal
+            buffers.close_all()
+            record_event(
+                "pdf_buffers",
+                max_rss_bytes=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                **buffers.stats(),
+            )
+
+            try:
+                trace_uri = trace.write()
+            except Exception as e:
+                trace_uri = None
+                print(f"Gagal menulis trace {job_id}: {e}")
+
+    result["job_id"] = job_id
+    result["trace"] = trace_uri
+    result["stats"] = trace_stats(trace.spans)
+
+    return result
+
+
+def _run_ocr_pipeline(job_id, invoice_name, uploaded_pdf_paths, with_total_container, buffers, detail_concurrency=None, use_cache=True, customer=None, output=None, inputs_uploaded=None):
+
+    job_prefix = _job_tmp_prefix(job_id)
+
+    # INPUT: buffer memory (upload baru) atau gs:// (retry / recovery)
+    pdf_sources = _load_pdf_sources(uploaded_pdf_paths)
+
+    # hanya buffer yang dibuat di sini (bytes / download GCS) yang boleh di-close
+    owned_sources = [
+        src for src, orig in zip(pdf_sources, uploaded_pdf_paths)
+        if src is not orig and isinstance(src, io.BytesIO)
+    ]
+    for src in owned_sources:
+        buffers.track(src, size=len(src.getbuffer()))
 
+    # MERGE & COMPRESS PDF (buffer memory / spooled, tanpa file temp bernama)
+    merged_pdf = _merge_pdfs(pdf_sources, buffers)
+    documents = _document_page_ranges(pdf_sources)
 
-    po_lines = _stream_filter_po_lines(po_numbers)
-    print("PO NUMBERS:", po_numbers)
-    print("PO LINES FOUND:", len(po_lines))
+    # input asli tidak dipakai lagi setelah merge
+    for src in owned_sources:
+        buffers.close(src)
+
+    report_progress("merged", pages=documents[-1]["last_page"] if documents else None)
+
+    # MANIFEST / RESUME (hash sebelum kompresi: Ghostscript tidak deterministik)
+    pdf_sha256 = _sha256_buffer(merged_pdf)
+    manifest, resumed = _init_manifest(job_prefix, pdf_sha256)
+
+    merged_pdf = _compress_pdf_if_needed(merged_pdf, buffers)
+
+    # UPLOAD MERGED PDF SEKALI, DIPAKAI SEMUA PROMPT
+    # digest = hash sebelum kompresi, supaya cache key Gemini tetap sama
+    # walaupun output Ghostscript berbeda antar run
+    pdf_input = _upload_temp_pdf_to_gcs(merged_pdf, buffers, digest=pdf_sha256)
+
+    # ==============================
+    # DEPENDENCY GRAPH
+    #
+    #   pdf_input ─┬─> total_row ─┬─> detail batches ─> validation ─> PO lines ─┬─> PO detail
+    #              ├─> page map ──┘                                             │
+    #              ├─> TOTAL ───────────────────────────────────────────────────┴─> PO total
+    #              └─> CONTAINER
+    #
+    # TOTAL & CONTAINER tidak bergantung pada detail, jadi langsung jalan
+    # begitu merged PDF tersedia. Hanya _map_po_to_total yang menunggu
+    # PO number dari detail.
+    # ==============================
+    stage_executor = ThreadPoolExecutor(max_workers=3)
 
-    total_data = None
-    container_data = None
+    total_future = None
+    container_future = None
+    page_map_future = None
+
+    # PAGE MAP jalan paralel dengan total_row (hanya untuk PDF yang cukup panjang)
+    if PAGE_SLICING:
+        if documents and documents[-1]["last_page"] >= PAGE_SLICE_MIN_PAGES:
+            page_map_future = submit_with_context(
+                stage_executor, _get_page_map, pdf_input, documents, use_cache
+            )
 
     if with_total_container:
-        # OCR TOTAL
-        raw_total = _call_gemini(merged_pdf, TOTAL_SYSTEM_INSTRUCTION, invoice_name)
-        total_data = _parse_json_safe(raw_total)
-        if isinstance(total_data, dict):
-            total_data = [total_data]
+        total_future = submit_with_context(
+            stage_executor, _extract_document_level,
+            pdf_input, TOTAL_SYSTEM_INSTRUCTION, use_cache, "total", TOTAL_RESPONSE_SCHEMA
+        )
+        container_future = submit_with_context(
+            stage_executor, _extract_document_level,
+            pdf_input, CONTAINER_SYSTEM_INSTRUCTION, use_cache, "container", CONTAINER_RESPONSE_SCHEMA
+        )
+
+    try:
+        # GET TOTAL ROW FROM GEMINI (skip kalau resume)
+        total_row = manifest.get("total_row")
+        done_results = {}
+
+        if resumed and total_row:
+            print(f"Resume job {job_id}: total_row={total_row}, {len(manifest['windows'])} window selesai")
+            with span("resume_checkpoints", windows=len(manifest["windows"])):
+                done_results = _load_batch_checkpoints(job_prefix, invoice_name, manifest["windows"])
+        else:
+            total_row = _get_total_row(pdf_input, use_cache=use_cache)
+            _set_manifest_total_row(job_prefix, manifest, total_row)
+
+        report_progress("total_row", total_row=total_row)
+
+        page_map = page_map_future.result() if page_map_future else None
+
+        # BATCH DETAIL EXTRACTION (PARALLEL)
+        with span("detail_batches", total_row=total_row):
+            batch_results = _run_detail_batches(
+                pdf_input,
+                job_prefix,
+                invoice_name,
+                total_row,
+                max_workers=detail_concurrency or DETAIL_CONCURRENCY,
+                use_cache=use_cache,
+                page_map=page_map,
+                manifest=manifest,
+                done_results=done_results,
+            )
+
+        # MERGE ALL GEMINI BATCHES
+        all_rows = _merge_batch_results(batch_results)
+
+        if not all_rows:
+            raise Exception("Tidak ada data detail hasil Gemini")
+
+        report_progress("detail", total_row=total_row, rows_done=len(all_rows))
+
+        # 🔥 FILL INV SEQ DULU (SEBELUM PO MAPPING)
+        all_rows = _fill_inv_seq(all_rows)
+
+        # VALIDATION
+        with span("validation", rows=len(all_rows)):
+            # invoice, PL, BL, COO: rule table rules.py, dikompilasi di validation.py
+            all_rows = validate_detail_rows(all_rows, customer=customer)
 
-        # OCR CONTAINER
-        raw_container = _call_gemini(merged_pdf, CONTAINER_SYSTEM_INSTRUCTION, invoice_name)
-        container_data = _parse_json_safe(raw_container)
-        if isinstance(container_data, dict):
-            container_data = [container_data]
+        report_progress("validation")
 
-    # MAP PO TO DETAIL
-    all_rows = _map_po_to_details(po_lines, all_rows)
+        # LOAD RELEVANT PO LINES
+        po_numbers = {
+            row.get("inv_customer_po_no")
+            for row in all_rows
+            if isinstance(row, dict) and row.get("inv_customer_po_no")
+        }
 
-    # VALIDATE PO
-    all_rows = _validate_po(all_rows)
+        with span("po_lookup", po_numbers=len(po_numbers)) as attrs:
+            po_lines = _stream_filter_po_lines(po_numbers)
+            attrs["po_lines"] = len(po_lines)
+        print("PO NUMBERS:", po_numbers)
+        print("PO LINES FOUND:", len(po_lines))
+
+        with span("po_mapping"):
+            # MAP PO TO DETAIL
+            all_rows = _map_po_to_details(po_lines, all_rows)
+
+            # VALIDATE PO
+            all_rows = _validate_po(all_rows)
+
+        report_progress("po_mapped", po_lines=len(po_lines))
+
+        # TUNGGU TOTAL & CONTAINER (sudah jalan paralel sejak awal)
+        with span("wait_total_container"):
+            total_data = total_future.result() if total_future else None
+            container_data = container_future.result() if container_future else None
+
+    except Exception:
+        stage_executor.shutdown(wait=True, cancel_futures=True)
+        raise
+
+    stage_executor.shutdown(wait=True)
 
     # ==============================
     # (NEW) MAP PO TO TOTAL (DETAIL tetap batch, TOTAL tidak batch)
@@ -1113,26 +2122,36 @@ def run_ocr(invoice_name, uploaded_pdf_paths, with_total_container):
     # ==============================
     # (NEW) OUTPUT PER FOLDER
     # ==============================
-    detail_csv_uri = _convert_to_csv_path(
-        f"output/detail/{invoice_name}_detail.csv", all_rows
-    )
+    detail_csv_uri = _write_report_csv(job_id, invoice_name, "detail", all_rows, output)
 
     total_csv_uri = None
     if total_data is not None:
-        total_csv_uri = _convert_to_csv_path(
-            f"output/total/{invoice_name}_total.csv", total_data
-        )
+        total_csv_uri = _write_report_csv(job_id, invoice_name, "total", total_data, output)
 
     container_csv_uri = None
     if container_data is not None:
-        container_csv_uri = _convert_to_csv_path(
-            f"output/container/{invoice_name}_container.csv", container_data
-        )
+        container_csv_uri = _write_report_csv(job_id, invoice_name, "container", container_data, output)
+
+    report_progress("csv_written")
 
+    # upload input masih jalan → tunggu, kalau tidak blob input dibuat
+    # ulang setelah prefix dihapus dan tertinggal di tmp/{job_id}/input/
+    if inputs_uploaded is not None:
+        with span("wait_input_upload") as attrs:
+            attrs["uploaded"] = inputs_uploaded.wait(UPLOAD_WAIT_BEFORE_CLEANUP_SEC)
+        if not attrs["uploaded"]:
+            print(f"Upload input job {job_id} belum selesai setelah {UPLOAD_WAIT_BEFORE_CLEANUP_SEC} detik, cleanup tetap jalan")
 
-    # CLEAN TEMP FILES
-    for blob in bucket.list_blobs(prefix=TMP_PREFIX):
-        blob.delete()
+    # CLEAN TEMP FILES (hanya namespace job ini)
+    with span("cleanup_tmp") as attrs:
+        attrs["deleted"] = _delete_prefix(f"{job_prefix}/")
+
+    # PDF input Gemini bersama: hanya yang sudah lama tidak dipakai job mana pun
+    try:
+        with span("sweep_gemini_inputs") as attrs:
+            attrs["deleted"] = _sweep_gemini_inputs()
+    except Exception as e:
+        print(f"Sweep input Gemini gagal: {e}")
 
     return {
         "detail_csv": detail_csv_uri,
@@ -0,0 +1,513 @@
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from config import *
+from function import run_ocr
+from progress import JobCancelled
+from catalog import init_catalog, report_types_for, catalog_queued, catalog_requeued, catalog_cancelled
+
+_workers = []
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+
+# buffer input per job (hanya di proses ini): worker bisa langsung merge
+# dari memory tanpa menunggu upload GCS / baca ulang file
+_job_buffers = {}
+_job_buffers_lock = threading.Lock()
+
+# job yang masuk antrian sebelum upload input GCS selesai → Event
+# "upload selesai" (di-set mark_inputs_uploaded), ditunggu sebelum cleanup tmp
+_job_inputs_uploaded = {}
+
+STATUS_QUEUED = "QUEUED"
+STATUS_RUNNING = "RUNNING"
+STATUS_DONE = "DONE"
+STATUS_FAILED = "FAILED"
+STATUS_CANCELLED = "CANCELLED"
+
+# ==============================
+# JOB TABLE (SQLITE)
+# ==============================
+
+def _connect():
+    conn = sqlite3.connect(JOB_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def init_job_db():
+    conn = _connect()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                invoice_name TEXT NOT NULL,
+                pdf_paths TEXT NOT NULL,
+                with_total_container INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                result TEXT,
+                error TEXT,
+                progress TEXT,
+                batch_id TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+        # job DB lama (sebelum ada kolom progress / bulk / cancel)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, ddl in [
+            ("progress", "progress TEXT"),
+            ("batch_id", "batch_id TEXT"),
+            ("cancel_requested", "cancel_requested INTEGER NOT NULL DEFAULT 0"),
+        ]:
+            if name not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {ddl}")
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, created_at)"
+        )
+    finally:
+        conn.close()
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["pdf_paths"] = json.loads(job["pdf_paths"])
+    job["with_total_container"] = bool(job["with_total_container"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["progress"] = json.loads(job["progress"]) if job.get("progress") else None
+    return job
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def enqueue_job(invoice_name, pdf_paths, with_total_container, job_id=None, pdf_buffers=None, batch_id=None, inputs_uploading=False):
+    """
+    Simpan job baru dengan status QUEUED dan langsung return job_id.
+    job_id bisa dibuat lebih dulu (new_job_id) supaya file input
+    bisa di-upload ke namespace tmp/{job_id}/ sebelum job masuk antrian.
+
+    pdf_paths disimpan di job table (gs://... supaya retry / recovery
+    setelah restart tetap bisa jalan). pdf_buffers (bytes, urutan sama)
+    opsional: dipakai run pertama supaya tidak perlu download ulang.
+
+    batch_id: id submission bulk (bulk.py), untuk ringkasan throughput.
+
+    inputs_uploading: upload pdf_paths ke GCS masih berjalan setelah
+    enqueue; pemanggil wajib memanggil mark_inputs_uploaded(job_id)
+    setelah upload selesai (berhasil atau gagal).
+    """
+    job_id = job_id or new_job_id()
+
+    with _job_buffers_lock:
+        if pdf_buffers:
+            _job_buffers[job_id] = list(pdf_buffers)
+        if inputs_uploading:
+            _job_inputs_uploaded[job_id] = threading.Event()
+
+    conn = _connect()
+    try:
+        conn.execute(
+            """
+            INSERT INTO jobs (job_id, invoice_name, pdf_paths, with_total_container, status, created_at, batch_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                job_id,
+                invoice_name,
+                json.dumps(pdf_paths),
+                int(bool(with_total_container)),
+                STATUS_QUEUED,
+                time.time(),
+                batch_id,
+            ),
+        )
+    finally:
+        conn.close()
+
+    catalog_queued(job_id, invoice_name, report_types_for(with_total_container))
+
+    _wakeup.set()
+
+    return job_id
+
+
+def mark_inputs_uploaded(job_id):
+    """
+    Upload input job selesai: worker yang menunggu boleh cleanup tmp/{job_id}/.
+    """
+    with _job_buffers_lock:
+        event = _job_inputs_uploaded.pop(job_id, None)
+
+    if event is not None:
+        event.set()
+
+
+def get_job(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return _row_to_job(row)
+    finally:
+        conn.close()
+
+
+def existing_job_ids(job_ids):
+    """
+    Subset job_ids yang punya row di job table. Run CLI (cli.py) hanya
+    tercatat di catalog, tidak bisa di-requeue dari sini.
+    """
+    job_ids = [j for j in job_ids if j]
+    if not job_ids:
+        return set()
+
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT job_id FROM jobs WHERE job_id IN ({','.join('?' * len(job_ids))})",
+            job_ids,
+        ).fetchall()
+        return {row["job_id"] for row in rows}
+    finally:
+        conn.close()
+
+
+def list_batch_jobs(batch_id):
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE batch_id = ? ORDER BY created_at", (batch_id,)
+        ).fetchall()
+        return [_row_to_job(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def list_batches(limit=20):
+    """
+    Submission bulk terakhir: [{"batch_id", "created_at", "jobs"}].
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            """
+            SELECT batch_id, MIN(created_at) AS created_at, COUNT(*) AS jobs
+            FROM jobs WHERE batch_id IS NOT NULL
+            GROUP BY batch_id ORDER BY created_at DESC LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def batch_summary(batch_id):
+    """
+    Ringkasan 1 submission bulk: jumlah job per status dan throughput
+    (invoice DONE per jam sejak job pertama mulai jalan).
+    """
+    conn = _connect()
+    try:
+        counts = {
+            row["status"]: row["n"] for row in conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs WHERE batch_id = ? GROUP BY status",
+                (batch_id,),
+            )
+        }
+        span_row = conn.execute(
+            "SELECT MIN(started_at) AS first_started, MAX(finished_at) AS last_finished "
+            "FROM jobs WHERE batch_id = ?",
+            (batch_id,),
+        ).fetchone()
+    finally:
+        conn.close()
+
+    total = sum(counts.values())
+    done = counts.get(STATUS_DONE, 0)
+    active = counts.get(STATUS_QUEUED, 0) + counts.get(STATUS_RUNNING, 0)
+
+    invoices_per_hour = None
+    if span_row["first_started"]:
+        end = time.time() if active else (span_row["last_finished"] or time.time())
+        elapsed = max(1.0, end - span_row["first_started"])
+        invoices_per_hour = round(done / elapsed * 3600, 1)
+
+    return {
+        "total": total,
+        "counts": counts,
+        "done": done,
+        "active": active,
+        "invoices_per_hour": invoices_per_hour,
+    }
+
+
+def list_jobs(statuses=None, limit=500):
+    conn = _connect()
+    try:
+        if statuses:
+            placeholders = ",".join("?" for _ in statuses)
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT ?",
+                (*statuses, limit),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [_row_to_job(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def _claim_next_job():
+    """
+    Ambil 1 job QUEUED paling lama dan tandai RUNNING secara atomik
+    (BEGIN IMMEDIATE supaya 2 worker tidak mengambil job yang sama).
+    """
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+            (STATUS_QUEUED,),
+        ).fetchone()
+
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET status = ?, started_at = ? WHERE job_id = ?",
+            (STATUS_RUNNING, time.time(), row["job_id"]),
+        )
+        conn.execute("COMMIT")
+
+        job = _row_to_job(row)
+        job["status"] = STATUS_RUNNING
+        return job
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def _finish_job(job_id, status, result=None, error=None):
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE job_id = ?",
+            (
+                status,
+                time.time(),
+                json.dumps(result) if result is not None else None,
+                error,
+                job_id,
+            ),
+        )
+    finally:
+        conn.close()
+
+
+def _set_job_progress(job_id, state):
+    """
+    Listener progress run_ocr: simpan state terakhir di job table
+    supaya halaman Upload / Report bisa polling tanpa akses ke worker.
+    """
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET progress = ? WHERE job_id = ?",
+            (json.dumps(state, default=str), job_id),
+        )
+    finally:
+        conn.close()
+
+
+def cancel_job(job_id):
+    """
+    Batalkan job. QUEUED langsung jadi CANCELLED; RUNNING ditandai
+    cancel_requested dan berhenti di event progress berikutnya
+    (antar batch detail / stage), lalu _run_job set CANCELLED.
+    Return True kalau job ditemukan dalam status yang bisa dibatalkan.
+    """
+    conn = _connect()
+    try:
+        cur = conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+            (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED),
+        )
+        cancelled_queued = cur.rowcount > 0
+
+        cur = conn.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = ?",
+            (job_id, STATUS_RUNNING),
+        )
+        cancel_running = cur.rowcount > 0
+    finally:
+        conn.close()
+
+    if cancelled_queued:
+        with _job_buffers_lock:
+            _job_buffers.pop(job_id, None)
+        catalog_cancelled(job_id)
+
+    return cancelled_queued or cancel_running
+
+
+def _is_cancel_requested(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute(
+            "SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row["cancel_requested"])
+    finally:
+        conn.close()
+
+
+def requeue_job(job_id):
+    """
+    Jalankan ulang job FAILED / CANCELLED dengan job_id yang sama, sehingga
+    run_ocr resume dari checkpoint terakhir di tmp/{job_id}/.
+    """
+    conn = _connect()
+    try:
+        cur = conn.execute(
+            """
+            UPDATE jobs SET status = ?, started_at = NULL, finished_at = NULL, error = NULL,
+                progress = NULL, cancel_requested = 0
+            WHERE job_id = ? AND status IN (?, ?)
+            """,
+            (STATUS_QUEUED, job_id, STATUS_FAILED, STATUS_CANCELLED),
+        )
+        requeued = cur.rowcount > 0
+    finally:
+        conn.close()
+
+    if requeued:
+        catalog_requeued(job_id)
+        _wakeup.set()
+
+    return requeued
+
+
+def _requeue_interrupted_jobs():
+    """
+    Job RUNNING saat proses mati tidak akan pernah selesai,
+    jadi dikembalikan ke antrian saat worker start
+    (job_id sama → resume dari checkpoint). Job yang sudah diminta
+    batal langsung jadi CANCELLED.
+    """
+    conn = _connect()
+    try:
+        cancelled = [
+            row["job_id"] for row in conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? AND cancel_requested = 1", (STATUS_RUNNING,)
+            )
+        ]
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND cancel_requested = 1",
+            (STATUS_CANCELLED, time.time(), STATUS_RUNNING),
+        )
+
+        interrupted = [
+            row["job_id"] for row in conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ?", (STATUS_RUNNING,)
+            )
+        ]
+        conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+            (STATUS_QUEUED, STATUS_RUNNING),
+        )
+    finally:
+        conn.close()
+
+    for job_id in cancelled:
+        catalog_cancelled(job_id)
+
+    for job_id in interrupted:
+        catalog_requeued(job_id)
+
+# ==============================
+# WORKER POOL
+# ==============================
+
+def _run_job(job):
+    with _job_buffers_lock:
+        buffers = _job_buffers.pop(job["job_id"], None)
+        inputs_uploaded = _job_inputs_uploaded.get(job["job_id"])
+
+    try:
+        result = run_ocr(
+            invoice_name=job["invoice_name"],
+            uploaded_pdf_paths=buffers or job["pdf_paths"],
+            with_total_container=job["with_total_container"],
+            job_id=job["job_id"],
+            on_progress=lambda state: _set_job_progress(job["job_id"], state),
+            cancel_check=lambda: _is_cancel_requested(job["job_id"]),
+            inputs_uploaded=inputs_uploaded,
+        )
+        _finish_job(job["job_id"], STATUS_DONE, result=result)
+    except JobCancelled as e:
+        print(str(e))
+        _finish_job(job["job_id"], STATUS_CANCELLED)
+    except Exception as e:
+        traceback.print_exc()
+        _finish_job(job["job_id"], STATUS_FAILED, error=str(e))
+
+
+def _worker_loop():
+    while True:
+        try:
+            job = _claim_next_job()
+        except Exception:
+            traceback.print_exc()
+            job = None
+
+        if job is None:
+            _wakeup.wait(JOB_POLL_INTERVAL_SEC)
+            _wakeup.clear()
+            continue
+
+        _run_job(job)
+
+
+def start_workers(concurrency=JOB_WORKERS):
+    """
+    Start worker thread (daemon) sekali per proses.
+    Aman dipanggil berulang (misal dari setiap rerun Streamlit).
+    """
+    with _workers_lock:
+        if _workers:
+            return len(_workers)
+
+        init_job_db()
+        init_catalog()
+        _requeue_interrupted_jobs()
+
+        for i in range(max(1, concurrency)):
+            t = threading.Thread(
+                target=_worker_loop,
+                name=f"ocr-worker-{i + 1}",
+                daemon=True,
+            )
+            t.start()
+            _workers.append(t)
+
+        return len(_workers)
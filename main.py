@@ -1,11 +1,19 @@
 import streamlit as st
-import tempfile
-from function import run_ocr
+from jobs import (
+    start_workers, enqueue_job, list_jobs, new_job_id, requeue_job, get_job,
+    cancel_job, mark_inputs_uploaded, existing_job_ids, list_batch_jobs, list_batches, batch_summary,
+)
+from bulk import scan_zip, scan_gcs_prefix, submit_bulk
+from function import job_input_uri, upload_job_inputs
+from telemetry import load_trace, summarize_trace
+from catalog import query_results, catalog_is_empty, backfill_from_bucket
+from progress import STAGE_LABELS, format_eta
 from google.cloud import storage
-from config import BUCKET_NAME, TMP_PREFIX
+from config import BUCKET_NAME, REPORT_SIGNED_URL, SIGNED_URL_EXPIRE_MIN, PROGRESS_POLL_SEC
 import os
-import re
-from datetime import timezone, timedelta
+import google.auth
+import google.auth.transport.requests
+from datetime import datetime, timezone, timedelta
 
 st.set_page_config(layout="wide")
 
@@ -30,11 +38,104 @@ with col1:
 with col2:
     st.markdown('<div class="main-title">OCR Gemini</div>', unsafe_allow_html=True)
 
-menu = st.sidebar.radio("Menu", ["Upload", "Report"])
+menu = st.sidebar.radio("Menu", ["Upload", "Bulk", "Report"])
 
 storage_client = storage.Client()
 bucket = storage_client.bucket(BUCKET_NAME)
 
+
+@st.cache_resource
+def _start_job_workers():
+    # worker pool dibuat sekali per proses Streamlit, bukan per rerun
+    return start_workers()
+
+
+_start_job_workers()
+
+
+@st.cache_resource
+def _init_result_catalog():
+    # hasil lama (sebelum ada catalog) dimasukkan sekali, bukan setiap render
+    if catalog_is_empty():
+        return backfill_from_bucket(storage_client)
+    return 0
+
+
+_init_result_catalog()
+
+
+@st.cache_data(ttl=SIGNED_URL_EXPIRE_MIN * 60 // 2, show_spinner=False)
+def _signed_download_url(path):
+    """
+    Signed URL (V4) supaya browser download langsung dari GCS.
+    Credential tanpa private key (Cloud Run / GCE) ditandatangani lewat
+    IAM signBlob memakai access token. Return None kalau tidak bisa
+    → fallback ambil file saat tombol diklik.
+    """
+    if not REPORT_SIGNED_URL:
+        return None
+
+    blob = bucket.blob(path)
+    expiration = timedelta(minutes=SIGNED_URL_EXPIRE_MIN)
+
+    try:
+        return blob.generate_signed_url(version="v4", expiration=expiration, method="GET")
+    except Exception:
+        pass
+
+    try:
+        credentials, _ = google.auth.default()
+        credentials.refresh(google.auth.transport.requests.Request())
+        return blob.generate_signed_url(
+            version="v4",
+            expiration=expiration,
+            method="GET",
+            service_account_email=credentials.service_account_email,
+            access_token=credentials.token,
+        )
+    except Exception as e:
+        print(f"Signed URL gagal untuk {path}: {e}")
+        return None
+
+def _render_progress(progress):
+    """
+    Progress bar + ETA dari state progress job (progress.py).
+    """
+    if not progress:
+        st.progress(0, text=STAGE_LABELS["queued"])
+        return
+
+    text = STAGE_LABELS.get(progress["stage"], progress["stage"])
+    if progress.get("batches_done"):
+        text += f" (batch {progress['batches_done']}/{progress.get('batches_total') or '?'})"
+    if progress["stage"] == "detail_batch" and progress.get("total_row"):
+        text += f" · {progress.get('rows_streamed') or progress.get('rows_done', 0)}/{progress['total_row']} row"
+
+    st.progress(min(100, progress.get("percent", 0)) / 100, text=text)
+
+    if progress.get("eta_sec") is not None:
+        st.caption(
+            f"ETA {format_eta(progress['eta_sec'])} · "
+            f"rata-rata batch {progress.get('avg_batch_sec')} detik"
+        )
+
+
+@st.fragment(run_every=PROGRESS_POLL_SEC)
+def _job_progress_panel(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return
+
+    st.write(f"**{job['invoice_name']}** ({job_id[:8]})")
+
+    if job["status"] == "DONE":
+        st.progress(1.0, text=STAGE_LABELS["done"])
+        st.success("Selesai. File bisa di-download di menu Report.")
+    elif job["status"] == "FAILED":
+        st.error(f"Gagal: {job['error']}")
+    else:
+        _render_progress(job["progress"])
+
 if menu == "Upload":
 
     st.subheader("Upload Documents")
@@ -52,117 +153,377 @@ if menu == "Upload":
             st.warning("Invoice dan Packing List wajib diupload")
 
         else:
-            pdf_paths = []
-
-            for f in [invoice, packing, bl, coo]:
-                if f:
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-                    tmp.write(f.read())
-                    tmp.close()
-                    pdf_paths.append(tmp.name)
-
-                    # upload ke GCS tmp
-                    bucket.blob(f"{TMP_PREFIX}/{f.name}") \
-                        .upload_from_filename(tmp.name)
-
-            run_ocr(
+            job_id = new_job_id()
+            files = [f for f in [invoice, packing, bl, coo] if f]
+
+            # buffer memory: tanpa temp file, worker langsung merge dari sini
+            buffers = [f.getvalue() for f in files]
+            input_uris = [
+                job_input_uri(job_id, i, f.name)
+                for i, f in enumerate(files, start=1)
+            ]
+
+            # masuk antrian dulu → merge jalan paralel dengan upload GCS
+            enqueue_job(
                 invoice_name=output_name or invoice.name.replace('.pdf',''),
-                uploaded_pdf_paths=pdf_paths,
-                with_total_container=bool(bl and coo)
+                pdf_paths=input_uris,
+                with_total_container=bool(bl and coo),
+                job_id=job_id,
+                pdf_buffers=buffers,
+                inputs_uploading=True,
             )
 
-            st.success("OCR selesai diproses")
+            # upload input ke GCS tmp (paralel) untuk retry / recovery;
+            # worker menunggu tanda ini sebelum cleanup tmp/{job_id}/
+            try:
+                with st.spinner("Upload dokumen ke GCS..."):
+                    failed_uploads = upload_job_inputs(list(zip(input_uris, buffers)))
+            finally:
+                mark_inputs_uploaded(job_id)
+
+            if failed_uploads:
+                st.warning(
+                    "Sebagian dokumen gagal di-upload ke GCS, "
+                    "job tetap berjalan tapi tidak bisa di-retry: "
+                    + ", ".join(os.path.basename(u) for u in failed_uploads)
+                )
+
+            st.success(f"Job {job_id} masuk antrian. Cek status di menu Report.")
+            st.session_state["active_job_id"] = job_id
+
+    # progress job terakhir, di-refresh otomatis tanpa rerun seluruh halaman
+    if st.session_state.get("active_job_id"):
+        st.divider()
+        _job_progress_panel(st.session_state["active_job_id"])
+
+@st.fragment(run_every=PROGRESS_POLL_SEC)
+def _batch_panel(batch_id):
+    summary = batch_summary(batch_id)
+    counts = summary["counts"]
+
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("Shipment", summary["total"])
+    m2.metric("DONE", summary["done"])
+    m3.metric("Berjalan / antri", summary["active"])
+    m4.metric("FAILED / CANCELLED", counts.get("FAILED", 0) + counts.get("CANCELLED", 0))
+    m5.metric("Invoice / jam", summary["invoices_per_hour"] if summary["invoices_per_hour"] is not None else "-")
+
+    if summary["total"]:
+        st.progress(
+            (summary["total"] - summary["active"]) / summary["total"],
+            text=f"{summary['total'] - summary['active']} dari {summary['total']} job selesai",
+        )
 
-if menu == "Report":
+    jobs = list_batch_jobs(batch_id)
+
+    table = []
+    for job in jobs:
+        progress = job["progress"] or {}
+        result = job["result"] or {}
+        table.append({
+            "shipment": job["invoice_name"],
+            "status": job["status"],
+            "progress %": progress.get("percent") if job["status"] == "RUNNING" else None,
+            "ETA": format_eta(progress.get("eta_sec")) if job["status"] == "RUNNING" else None,
+            "detail CSV": result.get("detail_csv"),
+            "total CSV": result.get("total_csv"),
+            "container CSV": result.get("container_csv"),
+            "error": job["error"],
+            "job_id": job["job_id"],
+        })
 
-    st.subheader("Download OCR Result")
+    st.dataframe(table, use_container_width=True, hide_index=True)
 
-    report_type = st.selectbox(
-        "Pilih Report",
-        ["detail", "total", "container"]
+    active = {
+        f"{j['invoice_name']} ({j['job_id'][:8]})": j["job_id"]
+        for j in jobs if j["status"] in ("QUEUED", "RUNNING")
+    }
+    retryable = {
+        f"{j['invoice_name']} ({j['job_id'][:8]})": j["job_id"]
+        for j in jobs if j["status"] in ("FAILED", "CANCELLED")
+    }
+
+    c1, c2 = st.columns(2)
+
+    with c1:
+        to_cancel = st.multiselect("Batalkan job", list(active.keys()), key=f"cancel_{batch_id}")
+        if to_cancel and st.button("Batalkan", key=f"cancel_btn_{batch_id}"):
+            for label in to_cancel:
+                cancel_job(active[label])
+            st.rerun(scope="fragment")
+
+    with c2:
+        to_retry = st.multiselect("Retry job", list(retryable.keys()), key=f"retry_{batch_id}")
+        if to_retry and st.button("Retry", key=f"retry_btn_{batch_id}"):
+            for label in to_retry:
+                requeue_job(retryable[label])
+            st.rerun(scope="fragment")
+
+if menu == "Bulk":
+
+    st.subheader("Bulk Upload")
+    st.caption(
+        "1 folder per shipment (SHP001/invoice.pdf, SHP001/packing list.pdf, ...) "
+        "atau flat SHP001_invoice.pdf, SHP001_packing_list.pdf, SHP001_bl.pdf, SHP001_coo.pdf. "
+        "Invoice dan Packing List wajib."
     )
 
-    result_prefix = f"output/{report_type}/"
-    tmp_prefix = f"{TMP_PREFIX}/"
+    source = st.radio("Sumber", ["ZIP", "GCS prefix"], horizontal=True)
 
-    result_blobs = list(storage_client.list_blobs(BUCKET_NAME, prefix=result_prefix))
-    tmp_blobs = list(storage_client.list_blobs(BUCKET_NAME, prefix=tmp_prefix))
+    shipments, skipped, zip_file = None, [], None
 
-    files_data = []
+    if source == "ZIP":
+        zip_file = st.file_uploader("ZIP shipment", type="zip")
+        if zip_file:
+            shipments, skipped = scan_zip(zip_file)
+    else:
+        gs_prefix = st.text_input("GCS prefix", placeholder=f"gs://{BUCKET_NAME}/bulk/2024-06/")
+        if st.button("Scan") and gs_prefix:
+            try:
+                st.session_state["bulk_scan"] = (gs_prefix, *scan_gcs_prefix(gs_prefix))
+            except Exception as e:
+                st.error(str(e))
+
+        scanned = st.session_state.get("bulk_scan")
+        if scanned and scanned[0] == gs_prefix:
+            _, shipments, skipped = scanned
+
+    if shipments is not None:
+        valid = [s for s in shipments if not s["error"]]
+
+        st.write(f"{len(valid)} shipment siap diproses, {len(shipments) - len(valid)} tidak lengkap")
+        st.dataframe(
+            [
+                {
+                    "shipment": s["name"],
+                    "dokumen": ", ".join(s["documents"]),
+                    "error": s["error"],
+                }
+                for s in shipments
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
 
-    for blob in result_blobs:
-        if blob.name.endswith("/"):
-            continue
+        if skipped:
+            with st.expander(f"{len(skipped)} file dilewati"):
+                st.dataframe(
+                    [{"file": path, "alasan": reason} for path, reason in skipped],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+        if valid and st.button("Submit Bulk"):
+            with st.spinner("Memasukkan shipment ke antrian..."):
+                try:
+                    batch_id, outcomes = submit_bulk(shipments, zip_file=zip_file)
+                except Exception as e:
+                    st.error(str(e))
+                else:
+                    queued = sum(1 for o in outcomes if o["job_id"])
+                    st.success(f"{queued} job masuk antrian (batch {batch_id[:8]}).")
+                    st.session_state["active_batch_id"] = batch_id
+
+    # ==============================
+    # STATUS BULK (throughput, cancel, hasil per job)
+    # ==============================
+    batches = list_batches()
+
+    if batches:
+        st.divider()
+
+        labels = {
+            f"{datetime.fromtimestamp(b['created_at'], timezone(timedelta(hours=7))).strftime('%Y-%m-%d %H:%M')}"
+            f" · {b['jobs']} shipment ({b['batch_id'][:8]})": b["batch_id"]
+            for b in batches
+        }
+        ids = list(labels.values())
+        active_batch = st.session_state.get("active_batch_id")
+
+        selected = st.selectbox(
+            "Batch",
+            list(labels.keys()),
+            index=ids.index(active_batch) if active_batch in ids else 0,
+        )
 
-        files_data.append({
-            "invoice": os.path.basename(blob.name),
-            "status": "DONE",
-            "updated": blob.updated,
-            "path": blob.name
-        })
+        _batch_panel(labels[selected])
 
-    running_invoices = set()
+if menu == "Report":
 
-    batch_re = re.compile(r"^(?P<inv>.+)_batch_\d+\.json$")
+    st.subheader("Download OCR Result")
 
-    for blob in tmp_blobs:
-        name = os.path.basename(blob.name)
-        m = batch_re.match(name)
-        if m:
-            running_invoices.add(m.group("inv"))
+    f1, f2, f3 = st.columns([2, 3, 3])
 
+    with f1:
+        report_type = st.selectbox(
+            "Pilih Report",
+            ["detail", "total", "container"]
+        )
 
-    for invoice in running_invoices:
-        # check if already marked done
-        already_done = any(f["invoice"] == f"{invoice}_{report_type}.csv" for f in files_data)
+    with f2:
+        name_filter = st.text_input("Cari invoice")
 
-        if not already_done:
-            files_data.append({
-                "invoice": invoice,
-                "status": "RUNNING",
-                "updated": None,
-                "path": None
-            })
+    with f3:
+        status_filter = st.multiselect(
+            "Status",
+            ["DONE", "RUNNING", "QUEUED", "FAILED", "CANCELLED"],
+            default=["DONE", "RUNNING", "QUEUED", "FAILED"],
+        )
+
+    s1, s2, s3 = st.columns([3, 2, 2])
+
+    with s1:
+        sort_label = st.selectbox(
+            "Urutkan",
+            ["Terbaru", "Terlama", "Nama A-Z", "Nama Z-A"],
+        )
+
+    with s2:
+        page_size = st.selectbox("Per halaman", [20, 50, 100], index=0)
+
+    sort_by = {
+        "Terbaru": "newest",
+        "Terlama": "oldest",
+        "Nama A-Z": "name_asc",
+        "Nama Z-A": "name_desc",
+    }[sort_label]
+
+    # page number dibaca dari session_state dulu supaya query hanya 1x per rerun
+    page = st.session_state.get("report_page", 1)
+
+    # status, filter, sort & pagination langsung dari result catalog (tanpa list bucket)
+    files_data, total_files = query_results(
+        report_type,
+        statuses=status_filter,
+        name_filter=name_filter,
+        sort=sort_by,
+        limit=page_size,
+        offset=(page - 1) * page_size,
+    )
+
+    total_pages = max(1, -(-total_files // page_size))
+
+    # filter berubah → halaman lama bisa di luar jangkauan
+    if page > total_pages:
+        st.session_state["report_page"] = total_pages
+        st.rerun()
+
+    with s3:
+        st.number_input(
+            "Halaman", min_value=1, max_value=total_pages, step=1, key="report_page"
+        )
 
     if not files_data:
         st.warning("Belum ada file result.")
     else:
-        # Sort by updated time (DONE first newest)
-        files_data = sorted(
-            files_data,
-            key=lambda x: (x["status"], x["updated"] or 0),
-            reverse=True
-        )
+        st.caption(f"{total_files} file, halaman {page} dari {total_pages}")
 
-        for f in files_data:
+        page_items = files_data
+
+        # Retry hanya untuk job yang ada di job table (bukan run CLI)
+        requeueable = existing_job_ids([
+            f["job_id"] for f in page_items if f["status"] in ("FAILED", "CANCELLED")
+        ])
+
+        for f in page_items:
 
             col1, col2, col3, col4 = st.columns([3, 2, 3, 2])
 
             with col1:
-                st.write(f["invoice"])
+                st.write(os.path.basename(f["path"]) if f["path"] else f["invoice_name"])
+                if f["status"] == "DONE" and f["rows"] is not None:
+                    st.caption(f"{f['rows']} row, {round((f['size_bytes'] or 0) / 1024, 1)} KB")
 
             with col2:
                 if f["status"] == "DONE":
                     st.success("DONE")
+                elif f["status"] == "FAILED":
+                    st.error("FAILED")
+                    if f.get("error"):
+                        st.caption(f["error"])
+                elif f["status"] == "RUNNING":
+                    _render_progress(f["progress"])
+                elif f["status"] == "CANCELLED":
+                    st.info("CANCELLED")
                 else:
-                    st.warning("RUNNING")
+                    st.warning(f["status"])
 
             with col3:
-                if f["updated"]:
-                    wib_time = f["updated"].astimezone(timezone(timedelta(hours=7)))
+                if f["finished_at"]:
+                    wib_time = datetime.fromtimestamp(f["finished_at"], timezone(timedelta(hours=7)))
                     st.write(wib_time.strftime("%Y-%m-%d %H:%M:%S"))
+                    if f["duration_sec"]:
+                        st.caption(f"{round(f['duration_sec'])} detik")
                 else:
                     st.write("-")
 
             with col4:
-                if f["status"] == "DONE":
-                    blob = bucket.blob(f["path"])
-                    file_bytes = blob.download_as_bytes()
-
-                    st.download_button(
-                        label="Download",
-                        data=file_bytes,
-                        file_name=f["invoice"],
-                        mime="application/octet-stream"
-                    )
-
+                if f["status"] == "DONE" and f["path"].startswith(("gs://", "/")):
+                    # hasil CLI ke bucket lain / folder lokal: tidak bisa di-download dari sini
+                    st.caption(f["path"])
+                elif f["status"] == "DONE":
+                    # lazy: file tidak di-download sebelum user klik
+                    url = _signed_download_url(f["path"])
+
+                    if url:
+                        st.link_button("Download", url)
+                    elif st.button("Ambil File", key=f"fetch_{f['path']}"):
+                        st.download_button(
+                            label="Download",
+                            data=bucket.blob(f["path"]).download_as_bytes(),
+                            file_name=os.path.basename(f["path"]),
+                            mime="application/octet-stream",
+                            key=f"download_{f['path']}",
+                        )
+                elif f["status"] in ("FAILED", "CANCELLED") and f["job_id"] not in requeueable:
+                    st.caption("Run CLI, jalankan ulang lewat cli.py")
+                elif f["status"] in ("FAILED", "CANCELLED"):
+                    # job_id sama → lanjut dari batch terakhir yang selesai
+                    if st.button("Retry", key=f"retry_{f['job_id']}"):
+                        requeue_job(f["job_id"])
+                        st.rerun()
+
+
+    # ==============================
+    # TRACE SUMMARY (waktu & token per stage)
+    # ==============================
+    st.divider()
+    st.subheader("Job Trace")
+
+    finished_jobs = list_jobs(statuses=["DONE", "FAILED"], limit=100)
+
+    if not finished_jobs:
+        st.info("Belum ada job yang selesai.")
+    else:
+        job_labels = {
+            f"{j['invoice_name']} ({j['status']}, {j['job_id'][:8]})": j["job_id"]
+            for j in finished_jobs
+        }
+
+        selected = st.selectbox("Pilih Job", list(job_labels.keys()))
+
+        if st.button("Tampilkan Trace"):
+            spans = load_trace(job_labels[selected])
+
+            if not spans:
+                st.warning("Trace tidak ditemukan.")
+            else:
+                summary = summarize_trace(spans)
+
+                total_sec = next((s["total_sec"] for s in summary if s["span"] == "run_ocr"), None)
+                gemini = [s for s in summary if s["span"].startswith("gemini.")]
+
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Total waktu (s)", total_sec if total_sec is not None else "-")
+                m2.metric("Prompt tokens", sum(s["prompt_tokens"] for s in gemini))
+                m3.metric("Output tokens", sum(s["output_tokens"] for s in gemini))
+
+                # peak buffer PDF job (merge / compress / slice)
+                usage = next((s for s in spans if s["span"] == "pdf_buffers"), None)
+                if usage:
+                    u1, u2, u3 = st.columns(3)
+                    u1.metric("Peak memory PDF (MB)", round(usage.get("peak_memory_bytes", 0) / 1024 / 1024, 1))
+                    u2.metric("Peak disk PDF (MB)", round(usage.get("peak_disk_bytes", 0) / 1024 / 1024, 1))
+                    u3.metric("Max RSS proses (MB)", round(usage.get("max_rss_bytes", 0) / 1024 / 1024, 1))
+
+                st.dataframe(summary, use_container_width=True)
@@ -0,0 +1,70 @@
+from schema import array_schema
+
+
+def build_page_map_prompt(documents):
+
+    doc_lines = "\n".join(
+        f"- Dokumen {d['document']}: halaman {d['first_page']} sampai {d['last_page']}"
+        for d in documents
+    )
+
+    return f"""
+ROLE:
+Anda adalah AI OCR analyzer yang fokus memetakan LINE ITEM ke HALAMAN.
+
+TUGAS:
+1. PDF ini adalah gabungan beberapa dokumen dengan urutan halaman berikut:
+{doc_lines}
+2. Identifikasi jenis tiap dokumen:
+   invoice | packing_list | bill_of_lading | coo | other
+3. Untuk setiap dokumen, tentukan header_pages:
+   halaman yang berisi data header (nomor invoice, tanggal, vendor,
+   messrs, shipper, consignee, total, dsb).
+4. Untuk setiap line item pada tabel utama Invoice (index mulai dari 1,
+   urut sesuai Invoice), tentukan SEMUA halaman tempat item tersebut muncul
+   di SELURUH dokumen (Invoice, Packing List, Bill of Lading, COO).
+
+ATURAN:
+- Nomor halaman adalah nomor halaman PDF gabungan ini (mulai dari 1).
+- Hitung hanya baris item barang (bukan header, bukan subtotal, bukan total).
+- Jangan mengarang. Jika tidak yakin halaman suatu item, jangan masukkan item tersebut.
+- Jangan menjelaskan apapun.
+
+OUTPUT:
+Hanya 1 JSON:
+
+{{
+  "documents": [
+    {{"document": <number>, "type": "<string>", "header_pages": [<number>]}}
+  ],
+  "items": [
+    {{"index": <number>, "pages": [<number>]}}
+  ]
+}}
+
+HANYA RETURN SATU JSON VALID SAJA JANGAN TAMBAHKAN KATA-KATA LAIN
+"""
+
+PAGE_MAP_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "documents": array_schema({
+            "type": "OBJECT",
+            "properties": {
+                "document": {"type": "INTEGER"},
+                "type": {"type": "STRING"},
+                "header_pages": array_schema({"type": "INTEGER"}),
+            },
+            "required": ["document", "type", "header_pages"],
+        }),
+        "items": array_schema({
+            "type": "OBJECT",
+            "properties": {
+                "index": {"type": "INTEGER"},
+                "pages": array_schema({"type": "INTEGER"}),
+            },
+            "required": ["index", "pages"],
+        }),
+    },
+    "required": ["documents", "items"],
+}
@@ -0,0 +1,344 @@
+import os
+import re
+import json
+import sqlite3
+import time
+import threading
+import ijson
+from google.cloud import storage
+from config import *
+
+storage_client = storage.Client()
+
+_rebuild_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_refresher = None
+
+# cache PO line per proses: {"source": (blob_name, generation), "lines": {po_no_norm: [compact, ...]}}
+# "lines" = None kalau master terlalu besar → lookup lewat index SQLite
+_po_cache = None
+
+# hanya field yang dibaca _map_po_to_details, _validate_po dan _map_po_to_total
+PO_FIELDS = (
+    "po_no",
+    "vendor_article_no",
+    "po_vendor_article_no",
+    "sap_article_no",
+    "po_sap_article_no",
+    "po_text",
+    "po_line",
+    "po_quantity",
+    "po_unit",
+    "po_price",
+    "po_currency",
+    "po_info_record_price",
+    "po_info_record_currency",
+)
+
+# penanda field yang tidak ada di PO line (beda dengan value None)
+_MISSING = object()
+
+INSERT_BATCH = 5000
+
+# ==============================
+# Nomalize PO NO / ARTICLE
+# ==============================
+
+def _norm_po_number(x):
+    if x is None:
+        return ""
+    s = str(x).strip()
+    s = re.sub(r"\D", "", s)  # ambil angka saja
+    return s.lstrip("0")      # buang leading zero untuk compare
+
+
+def _norm_key(x):
+    if x is None:
+        return ""
+    s = str(x).strip().upper()
+    s = re.sub(r"\s+", "", s)          # hapus spasi
+    s = re.sub(r"[^A-Z0-9]", "", s)    # hapus dash, slash, dll
+    return s
+
+# ===================================
+# PO JSON BLOB (DIRECT FROM GCS)
+# ===================================
+
+def get_po_blob():
+
+    bucket = storage_client.bucket(BUCKET_NAME)
+    blobs = list(bucket.list_blobs(prefix=f"{PO_PREFIX}/"))
+
+    json_files = [
+        b for b in blobs
+        if b.name.endswith(".json") and not b.name.endswith("/")
+    ]
+
+    if not json_files:
+        raise Exception("PO JSON tidak ditemukan di folder po/")
+
+    if len(json_files) > 1:
+        raise Exception("Lebih dari 1 PO JSON ditemukan. Harus hanya 1 file.")
+
+    return json_files[0]
+
+# ==============================
+# PO INDEX (SQLITE)
+# ==============================
+
+def _connect(path=PO_INDEX_PATH):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _index_source(path=PO_INDEX_PATH):
+    """
+    Return (blob_name, generation) yang dipakai untuk build index,
+    atau None kalau index belum ada.
+    """
+    if not os.path.exists(path):
+        return None
+
+    conn = _connect(path)
+    try:
+        rows = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        return rows.get("blob_name"), rows.get("generation")
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+
+def _index_rows(po_blob):
+    with po_blob.open("rb") as f:
+        for item in ijson.items(f, "item"):
+            po_no = item.get("po_no")
+            if po_no is None:
+                continue
+
+            po_no_norm = _norm_po_number(po_no)
+            if not po_no_norm:
+                continue
+
+            vendor_norm = _norm_key(item.get("vendor_article_no") or item.get("po_vendor_article_no"))
+            sap_norm = _norm_key(item.get("sap_article_no") or item.get("po_sap_article_no"))
+
+            # ijson mengembalikan Decimal → simpan sebagai string apa adanya
+            yield po_no_norm, vendor_norm, sap_norm, json.dumps(item, default=str)
+
+
+def build_po_index(po_blob):
+    """
+    Stream PO JSON sekali dan tulis ke SQLite (file sementara lalu rename,
+    supaya pembaca lain tidak pernah melihat index setengah jadi).
+    """
+    tmp_path = f"{PO_INDEX_PATH}.{os.getpid()}.building"
+
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = _connect(tmp_path)
+    try:
+        conn.execute("""
+            CREATE TABLE po_lines (
+                id INTEGER PRIMARY KEY,
+                po_no_norm TEXT NOT NULL,
+                vendor_norm TEXT,
+                sap_norm TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        batch = []
+        for row in _index_rows(po_blob):
+            batch.append(row)
+            if len(batch) >= INSERT_BATCH:
+                conn.executemany(
+                    "INSERT INTO po_lines (po_no_norm, vendor_norm, sap_norm, data) VALUES (?, ?, ?, ?)",
+                    batch,
+                )
+                batch = []
+
+        if batch:
+            conn.executemany(
+                "INSERT INTO po_lines (po_no_norm, vendor_norm, sap_norm, data) VALUES (?, ?, ?, ?)",
+                batch,
+            )
+
+        # index dibuat setelah insert (lebih cepat daripada maintain per row)
+        conn.execute("CREATE INDEX idx_po_vendor ON po_lines (po_no_norm, vendor_norm)")
+        conn.execute("CREATE INDEX idx_po_sap ON po_lines (po_no_norm, sap_norm)")
+
+        conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [
+                ("blob_name", po_blob.name),
+                ("generation", str(po_blob.generation)),
+            ],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, PO_INDEX_PATH)
+
+
+def ensure_po_index(po_blob=None):
+    """
+    Rebuild index hanya kalau blob PO (nama / generation) berubah.
+    """
+    po_blob = po_blob or get_po_blob()
+    source = (po_blob.name, str(po_blob.generation))
+
+    if _index_source() == source:
+        return po_blob
+
+    with _rebuild_lock:
+        # cek ulang, mungkin thread lain sudah rebuild
+        if _index_source() != source:
+            print(f"Rebuild PO index dari {po_blob.name} (generation {po_blob.generation})")
+            build_po_index(po_blob)
+
+    return po_blob
+
+
+def lookup_po_lines(target_po_numbers):
+    """
+    Ambil PO line untuk PO number yang diminta, urut sesuai master.
+    Biaya O(jumlah match), bukan O(ukuran master).
+    """
+    targets = sorted({
+        _norm_po_number(x)
+        for x in (target_po_numbers or set())
+        if x is not None
+    } - {""})
+
+    if not targets:
+        return []
+
+    placeholders = ",".join("?" for _ in targets)
+
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT data FROM po_lines WHERE po_no_norm IN ({placeholders}) ORDER BY id",
+            targets,
+        ).fetchall()
+    finally:
+        conn.close()
+
+    return [json.loads(r["data"]) for r in rows]
+
+# ==============================
+# IN-PROCESS PO CACHE
+# ==============================
+
+def _compact(line_id, item):
+    return (line_id,) + tuple(item.get(f, _MISSING) for f in PO_FIELDS)
+
+
+def _expand(compact):
+    return {
+        f: v
+        for f, v in zip(PO_FIELDS, compact[1:])
+        if v is not _MISSING
+    }
+
+
+def _load_po_cache(source):
+    """
+    Baca seluruh PO line dari index SQLite ke memory, dikelompokkan per
+    PO number ternormalisasi. Return lines=None kalau melebihi PO_CACHE_MAX_LINES.
+    """
+    by_po = {}
+    count = 0
+
+    conn = _connect()
+    try:
+        for row in conn.execute("SELECT id, po_no_norm, data FROM po_lines ORDER BY id"):
+            count += 1
+            if count > PO_CACHE_MAX_LINES:
+                print(f"PO master > {PO_CACHE_MAX_LINES} line, cache memory dimatikan")
+                return {"source": source, "lines": None}
+
+            by_po.setdefault(row["po_no_norm"], []).append(
+                _compact(row["id"], json.loads(row["data"]))
+            )
+    finally:
+        conn.close()
+
+    return {"source": source, "lines": by_po}
+
+
+def refresh_po_cache():
+    """
+    Cek generation blob PO; rebuild index + reload cache hanya kalau berubah.
+    """
+    global _po_cache
+
+    po_blob = ensure_po_index()
+    source = (po_blob.name, str(po_blob.generation))
+
+    with _cache_lock:
+        if _po_cache is not None and _po_cache["source"] == source:
+            return
+
+        # cache lama tetap dipakai sampai yang baru selesai di-load
+        _po_cache = _load_po_cache(source)
+
+
+def _refresh_loop():
+    while True:
+        time.sleep(PO_CACHE_REFRESH_SEC)
+        try:
+            refresh_po_cache()
+        except Exception as e:
+            print(f"Refresh PO cache gagal: {e}")
+
+
+def _start_refresher():
+    global _refresher
+
+    with _cache_lock:
+        if _refresher is not None:
+            return
+
+        _refresher = threading.Thread(
+            target=_refresh_loop,
+            name="po-cache-refresher",
+            daemon=True,
+        )
+        _refresher.start()
+
+
+def get_po_lines(target_po_numbers):
+    """
+    Entry point lookup PO line. Load pertama sinkron, setelahnya dilayani
+    dari memory dan di-refresh di background (tanpa list/download master
+    setiap invoice).
+    """
+    if _po_cache is None:
+        refresh_po_cache()
+        _start_refresher()
+
+    cache = _po_cache
+
+    if cache["lines"] is None:
+        return lookup_po_lines(target_po_numbers)
+
+    targets = {
+        _norm_po_number(x)
+        for x in (target_po_numbers or set())
+        if x is not None
+    }
+
+    matched = []
+    for po_no_norm in targets:
+        matched.extend(cache["lines"].get(po_no_norm, []))
+
+    # urutan sama seperti di master
+    matched.sort(key=lambda c: c[0])
+
+    return [_expand(c) for c in matched]
@@ -0,0 +1,252 @@
+import math
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from telemetry import record_event
+
+_current_progress = contextvars.ContextVar("ocr_progress", default=None)
+
+# row streaming bisa ratusan event per batch: listener (SQLite) dibatasi
+STREAM_NOTIFY_INTERVAL_SEC = 1.0
+
+# ==============================
+# STAGE
+# ==============================
+
+# urutan stage run_ocr & persen progress saat stage tersebut selesai.
+# detail_batch diisi proporsional antara total_row dan detail.
+STAGE_PERCENT = {
+    "queued": 0,
+    "started": 2,
+    "merged": 5,
+    "total_row": 10,
+    "detail_batch": 10,
+    "detail": 80,
+    "validation": 85,
+    "po_mapped": 90,
+    "csv_written": 95,
+    "done": 100,
+}
+
+# setelah CSV mulai ditulis job tidak dibatalkan lagi (hasil sudah di GCS)
+NON_CANCELLABLE_STAGES = {"csv_written", "done"}
+
+STAGE_LABELS = {
+    "queued": "Menunggu antrian",
+    "started": "Mulai",
+    "merged": "PDF digabung",
+    "total_row": "Jumlah row diketahui",
+    "detail_batch": "Ekstraksi detail",
+    "detail": "Detail selesai",
+    "validation": "Validasi selesai",
+    "po_mapped": "PO mapping selesai",
+    "csv_written": "CSV ditulis",
+    "done": "Selesai",
+}
+
+
+class JobCancelled(Exception):
+    """
+    Job dibatalkan user (dicek di setiap event progress, jadi
+    batch detail yang sedang jalan selesai dulu, batch berikutnya tidak).
+    """
+
+# ==============================
+# JOB PROGRESS
+# ==============================
+
+class JobProgress:
+    """
+    State progress 1 job. Setiap event dikirim ke semua listener
+    (callback(state_dict)), misal catalog / job table / UI.
+
+    ETA dihitung dari rata-rata latency batch detail yang sudah selesai:
+    sisa row / rata-rata row per batch = sisa batch, dibagi jumlah batch
+    yang jalan paralel.
+
+    cancel_check: callable() → True kalau job diminta batal; dicek sebelum
+    setiap event (kecuali NON_CANCELLABLE_STAGES) dan raise JobCancelled.
+    """
+
+    def __init__(self, job_id, listeners=None, cancel_check=None):
+        self.job_id = job_id
+        self.listeners = [fn for fn in (listeners or []) if fn]
+        self.cancel_check = cancel_check
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.state = {
+            "stage": "started",
+            "percent": STAGE_PERCENT["started"],
+            "total_row": None,
+            "rows_done": 0,
+            "rows_streamed": 0,
+            "batches_done": 0,
+            "batches_total": None,
+            "avg_batch_sec": None,
+            "eta_sec": None,
+            "elapsed_sec": 0.0,
+        }
+        self._batch_latencies = []
+        self._workers = 1
+        # first_index window yang sedang streaming → jumlah row terbanyak yang sudah diterima
+        self._streaming = {}
+        self._last_stream_notify = 0.0
+
+    def check_cancelled(self):
+        if self.cancel_check is not None and self.cancel_check():
+            record_event("cancelled", stage=self.state["stage"])
+            raise JobCancelled(f"Job {self.job_id} dibatalkan")
+
+    def emit(self, stage, **data):
+        if stage not in NON_CANCELLABLE_STAGES:
+            self.check_cancelled()
+
+        with self._lock:
+            self.state.update({k: v for k, v in data.items() if v is not None})
+            self.state["stage"] = stage
+            self.state["elapsed_sec"] = round(time.time() - self.started, 1)
+
+            if stage != "detail_batch":
+                self.state["percent"] = max(self.state["percent"], STAGE_PERCENT.get(stage, 0))
+                if STAGE_PERCENT.get(stage, 0) >= STAGE_PERCENT["detail"]:
+                    self.state["eta_sec"] = None
+
+            snapshot = dict(self.state)
+
+        record_event("progress", stage=stage, percent=snapshot["percent"], eta_sec=snapshot["eta_sec"])
+        self._notify(snapshot)
+
+    def set_workers(self, workers):
+        self._workers = max(1, workers)
+
+    def _detail_percent(self, rows, total_row):
+        span = STAGE_PERCENT["detail"] - STAGE_PERCENT["total_row"]
+        ratio = min(1.0, rows / total_row) if total_row else 0.0
+        return max(self.state["percent"], round(STAGE_PERCENT["total_row"] + span * ratio))
+
+    def item_streamed(self, first_index, count):
+        """
+        Row ke-count dari window first_index sudah diterima (streaming).
+        Pakai nilai maksimum per window: retry yang mengirim ulang row
+        yang sama tidak menambah hitungan.
+        """
+        with self._lock:
+            if count <= self._streaming.get(first_index, 0):
+                return
+            self._streaming[first_index] = count
+
+            now = time.time()
+            if now - self._last_stream_notify < STREAM_NOTIFY_INTERVAL_SEC:
+                return
+            self._last_stream_notify = now
+
+            rows_streamed = self.state["rows_done"] + sum(self._streaming.values())
+            self.state["rows_streamed"] = rows_streamed
+            self.state["percent"] = self._detail_percent(rows_streamed, self.state["total_row"])
+            self.state["elapsed_sec"] = round(now - self.started, 1)
+            snapshot = dict(self.state)
+
+        self._notify(snapshot)
+
+    def window_dropped(self, first_index):
+        """
+        Window dipecah ulang: row streaming-nya tidak dihitung lagi.
+        """
+        with self._lock:
+            self._streaming.pop(first_index, None)
+
+    def batch_done(self, first_index, rows, latency_sec, rows_done, total_row):
+        """
+        1 batch detail selesai (rows = jumlah row batch ini).
+        """
+        with self._lock:
+            self._streaming.pop(first_index, None)
+
+        self.check_cancelled()
+
+        with self._lock:
+            self._batch_latencies.append(latency_sec)
+            done = len(self._batch_latencies)
+            avg_latency = sum(self._batch_latencies) / done
+
+            remaining_rows = max(0, (total_row or 0) - rows_done)
+            avg_rows = rows_done / done if done and rows_done else 0
+            remaining_batches = math.ceil(remaining_rows / avg_rows) if avg_rows else 0
+
+            self.state.update({
+                "stage": "detail_batch",
+                "rows_done": rows_done,
+                "rows_streamed": rows_done + sum(self._streaming.values()),
+                "total_row": total_row,
+                "batches_done": done,
+                "batches_total": done + remaining_batches,
+                "avg_batch_sec": round(avg_latency, 1),
+                "eta_sec": round(math.ceil(remaining_batches / self._workers) * avg_latency, 1),
+                "percent": self._detail_percent(rows_done, total_row),
+                "elapsed_sec": round(time.time() - self.started, 1),
+            })
+            snapshot = dict(self.state)
+
+        self._notify(snapshot)
+
+    def _notify(self, snapshot):
+        # progress tidak boleh menggagalkan job
+        for fn in self.listeners:
+            try:
+                fn(snapshot)
+            except Exception as e:
+                print(f"Progress listener gagal ({self.job_id}): {e}")
+
+# ==============================
+# CONTEXT HELPERS
+# ==============================
+
+@contextmanager
+def job_progress(job_id, listeners=None, cancel_check=None):
+    progress = JobProgress(job_id, listeners, cancel_check)
+    token = _current_progress.set(progress)
+    try:
+        yield progress
+    finally:
+        _current_progress.reset(token)
+
+
+def current_progress():
+    return _current_progress.get()
+
+
+def report_progress(stage, **data):
+    """
+    Kirim event progress ke job aktif (no-op kalau tidak ada).
+    """
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.emit(stage, **data)
+
+
+def report_batch_done(first_index, rows, latency_sec, rows_done, total_row):
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.batch_done(first_index, rows, latency_sec, rows_done, total_row)
+
+
+def report_item_streamed(first_index, count):
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.item_streamed(first_index, count)
+
+
+def report_window_dropped(first_index):
+    progress = _current_progress.get()
+    if progress is not None:
+        progress.window_dropped(first_index)
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} detik"
+    return f"{seconds // 60} menit {seconds % 60} detik"
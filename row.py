@@ -1,3 +1,5 @@
+from schema import object_schema
+
 ROW_SYSTEM_INSTRUCTION = """
 ROLE:
 Anda adalah AI OCR analyzer yang fokus menghitung jumlah LINE ITEM.
@@ -27,4 +29,6 @@ Hanya 1 JSON:
 
 HANYA RETURN SATU JSON VALID SAJA JANGAN TAMBAHKAN KATA-KATA LAIN
 
-"""
\ No newline at end of file
+"""
+
+ROW_RESPONSE_SCHEMA = object_schema([("total_row", "integer")])
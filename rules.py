@@ -0,0 +1,138 @@
+# ==============================
+# RULE VALIDASI DETAIL (DEKLARATIF)
+# ==============================
+#
+# Dikompilasi sekali di validation.py menjadi 1 checker per dokumen
+# (setiap row dikunjungi 1x untuk semua rule dokumen tersebut).
+# Menambah rule cukup di tabel ini, hot loop tidak perlu diubah.
+#
+# id rule = "{doc}.{check}.{field}", dipakai untuk toggle per customer
+# (lihat RULE_OVERRIDES di config.py). Rule dengan "enabled": False
+# hanya aktif kalau di-enable lewat override.
+#
+# check:
+# - mandatory     : field tidak boleh null
+# - product       : field == factors[0] x factors[1] (dibulatkan 2 desimal)
+# - column_total  : field == jumlah kolom sum_of di semua row
+#                   (when_any: hanya kalau ada row yang punya field tsb)
+# - equal         : field == other (nilai mentah)
+# - equal_text    : field == other (strip + lowercase)
+# - equal_number  : field == other (numeric, 2 desimal)
+# - equal_unit    : field == other (strip, hanya kalau keduanya terisi)
+# - required_if   : field wajib kalau when_field == equals
+# - fallback      : field kosong → diisi dari source (bukan validasi)
+#
+# Urutan dokumen & rule = urutan pesan di match_description.
+
+RULE_DOCUMENTS = [
+    # scope: dokumen hanya divalidasi untuk row yang field scope-nya terisi
+    {"doc": "invoice", "scope": None, "null_suffix": ""},
+    {"doc": "packing_list", "scope": None, "null_suffix": ""},
+    {"doc": "bl", "scope": "bl_no", "null_suffix": " (BL tersedia)"},
+    {"doc": "coo", "scope": "coo_no", "null_suffix": " (COO tersedia)"},
+]
+
+DETAIL_RULES = [
+
+    # -------- INVOICE --------
+    {"doc": "invoice", "check": "mandatory", "field": "inv_invoice_no"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_invoice_date"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_customer_po_no"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_vendor_name"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_vendor_address"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_spart_item_no"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_description"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_quantity"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_quantity_unit"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_unit_price"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_price_unit"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_amount"},
+    {"doc": "invoice", "check": "mandatory", "field": "inv_amount_unit"},
+
+    {"doc": "invoice", "check": "product", "field": "inv_amount", "factors": ["inv_quantity", "inv_unit_price"]},
+
+    {"doc": "invoice", "check": "column_total", "field": "inv_total_quantity", "sum_of": "inv_quantity"},
+    {"doc": "invoice", "check": "column_total", "field": "inv_total_amount", "sum_of": "inv_amount"},
+    {"doc": "invoice", "check": "column_total", "field": "inv_total_nw", "sum_of": "pl_nw", "when_any": "pl_invoice_no"},
+    {"doc": "invoice", "check": "column_total", "field": "inv_total_gw", "sum_of": "pl_gw", "when_any": "pl_invoice_no"},
+    {"doc": "invoice", "check": "column_total", "field": "inv_total_volume", "sum_of": "pl_volume", "when_any": "pl_invoice_no"},
+    {"doc": "invoice", "check": "column_total", "field": "inv_total_package", "sum_of": "pl_package_count", "when_any": "pl_invoice_no"},
+
+    # -------- PACKING LIST --------
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_invoice_no"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_invoice_date"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_messrs"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_messrs_address"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_item_no"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_description"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_quantity"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_package_unit"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_package_count"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_weight_unit"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_nw"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_gw"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_volume_unit"},
+    {"doc": "packing_list", "check": "mandatory", "field": "pl_volume"},
+
+    {"doc": "packing_list", "check": "equal", "field": "pl_invoice_no", "other": "inv_invoice_no"},
+    {"doc": "packing_list", "check": "equal", "field": "pl_invoice_date", "other": "inv_invoice_date"},
+    {"doc": "packing_list", "check": "equal", "field": "pl_messrs", "other": "inv_messrs"},
+    {"doc": "packing_list", "check": "equal", "field": "pl_messrs_address", "other": "inv_messrs_address"},
+
+    {"doc": "packing_list", "check": "column_total", "field": "pl_total_quantity", "sum_of": "pl_quantity"},
+    {"doc": "packing_list", "check": "column_total", "field": "pl_total_amount", "sum_of": "pl_amount"},
+    {"doc": "packing_list", "check": "column_total", "field": "pl_total_nw", "sum_of": "pl_nw"},
+    {"doc": "packing_list", "check": "column_total", "field": "pl_total_gw", "sum_of": "pl_gw"},
+    {"doc": "packing_list", "check": "column_total", "field": "pl_total_volume", "sum_of": "pl_volume"},
+    {"doc": "packing_list", "check": "column_total", "field": "pl_total_package", "sum_of": "pl_package_count"},
+
+    # -------- BILL OF LADING --------
+    {"doc": "bl", "check": "fallback", "field": "bl_seller_name", "source": "bl_shipper_name"},
+    {"doc": "bl", "check": "fallback", "field": "bl_seller_address", "source": "bl_shipper_address"},
+
+    {"doc": "bl", "check": "mandatory", "field": "bl_shipper_name"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_shipper_address"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_no"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_date"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_consignee_name"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_consignee_address"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_vessel"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_voyage_no"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_port_of_loading"},
+    {"doc": "bl", "check": "mandatory", "field": "bl_port_of_destination"},
+
+    {"doc": "bl", "check": "equal_text", "field": "bl_seller_name", "other": "inv_vendor_name"},
+
+    # -------- COO --------
+    {"doc": "coo", "check": "mandatory", "field": "coo_no"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_form_type"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_invoice_no"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_invoice_date"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_shipper_name"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_shipper_address"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_consignee_name"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_consignee_address"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_seq"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_description"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_hs_code"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_quantity"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_unit"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_criteria"},
+    {"doc": "coo", "check": "mandatory", "field": "coo_origin_country"},
+
+    {"doc": "coo", "check": "required_if", "field": "coo_amount", "when_field": "coo_criteria", "equals": "RVC",
+     "message": "{field} wajib jika criteria = {equals}"},
+    {"doc": "coo", "check": "required_if", "field": "coo_amount_unit", "when_field": "coo_criteria", "equals": "RVC",
+     "message": "{field} wajib jika criteria = {equals}"},
+    {"doc": "coo", "check": "required_if", "field": "coo_gw", "when_field": "coo_criteria", "equals": "PE",
+     "message": "{field} wajib jika criteria = {equals}"},
+    {"doc": "coo", "check": "required_if", "field": "coo_gw_unit", "when_field": "coo_criteria", "equals": "PE",
+     "message": "{field} wajib jika criteria = {equals}"},
+
+    {"doc": "coo", "check": "equal_number", "field": "coo_quantity", "other": "inv_quantity"},
+    {"doc": "coo", "check": "equal_number", "field": "coo_amount", "other": "inv_amount"},
+    {"doc": "coo", "check": "equal_number", "field": "coo_gw", "other": "inv_gw"},
+
+    {"doc": "coo", "check": "equal_unit", "field": "coo_amount_unit", "other": "inv_amount_unit"},
+    {"doc": "coo", "check": "equal_unit", "field": "coo_gw_unit", "other": "inv_gw_unit"},
+]
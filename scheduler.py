@@ -0,0 +1,140 @@
+import time
+import random
+import threading
+import httpx
+from google.genai import errors as genai_errors
+from config import *
+
+# ==============================
+# TOKEN BUCKET
+# ==============================
+
+class TokenBucket:
+    """
+    Token bucket sederhana: kapasitas = limit per menit,
+    diisi ulang rata selama 60 detik.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = float(per_minute) / 60.0
+        self.updated = time.monotonic()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount):
+        # permintaan lebih besar dari kapasitas tetap boleh jalan (saat bucket penuh)
+        amount = min(float(amount), self.capacity)
+
+        with self._cond:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_sec = (amount - self.tokens) / self.rate
+                self._cond.wait(timeout=min(wait_sec, 5))
+
+    def adjust(self, delta):
+        """
+        Koreksi setelah usage asli diketahui (delta negatif = kembalikan token).
+        Saldo boleh minus supaya estimasi yang terlalu kecil tetap "dibayar".
+        """
+        with self._cond:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+            self._cond.notify_all()
+
+# ==============================
+# RETRY CLASSIFICATION
+# ==============================
+
+def is_retryable(error):
+    """
+    429 / 5xx / timeout / network error → retry.
+    _generate_content membungkus error asli, jadi cek seluruh rantai __cause__.
+    """
+    e = error
+    while e is not None:
+        if isinstance(e, genai_errors.APIError):
+            return e.code in GEMINI_RETRYABLE_CODES
+        if isinstance(e, (httpx.TimeoutException, httpx.NetworkError, ConnectionError, TimeoutError)):
+            return True
+        e = e.__cause__
+
+    return False
+
+
+def backoff_delay(attempt):
+    """
+    Exponential backoff dengan full jitter.
+    """
+    cap = min(GEMINI_BACKOFF_MAX_SEC, GEMINI_BACKOFF_BASE_SEC * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+# ==============================
+# GEMINI SCHEDULER (1 PER PROSES)
+# ==============================
+
+class GeminiScheduler:
+    """
+    Dipakai bersama oleh semua job di proses ini:
+    - concurrency cap global (GEMINI_MAX_CONCURRENCY)
+    - rate limit requests/min & tokens/min per model
+    - retry dengan exponential backoff + jitter untuk error retryable
+    """
+
+    def __init__(self, max_concurrency=GEMINI_MAX_CONCURRENCY):
+        self._semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, model):
+        with self._lock:
+            if model not in self._buckets:
+                limits = GEMINI_RATE_LIMITS.get(model, GEMINI_DEFAULT_RATE_LIMIT)
+                self._buckets[model] = (
+                    TokenBucket(limits["rpm"]),
+                    TokenBucket(limits["tpm"]),
+                )
+            return self._buckets[model]
+
+    def call(self, model, fn, estimated_tokens):
+        """
+        Jalankan fn() dengan rate limit + retry.
+        Return (hasil, jumlah percobaan).
+        fn boleh mengembalikan dict dengan prompt_tokens/output_tokens
+        untuk koreksi token bucket.
+        """
+        requests_bucket, tokens_bucket = self._buckets_for(model)
+
+        for attempt in range(1, GEMINI_MAX_RETRY + 1):
+            requests_bucket.acquire(1)
+            tokens_bucket.acquire(estimated_tokens)
+
+            try:
+                with self._semaphore:
+                    result = fn()
+            except Exception as e:
+                if attempt >= GEMINI_MAX_RETRY or not is_retryable(e):
+                    raise
+
+                delay = backoff_delay(attempt)
+                print(f"Gemini retryable error (percobaan {attempt}), retry {delay:.1f}s: {e}")
+                time.sleep(delay)
+                continue
+
+            if isinstance(result, dict):
+                used = (result.get("prompt_tokens") or 0) + (result.get("output_tokens") or 0)
+                if used:
+                    tokens_bucket.adjust(used - estimated_tokens)
+
+            return result, attempt
+
+
+scheduler = GeminiScheduler()
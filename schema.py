@@ -0,0 +1,45 @@
+# ==============================
+# RESPONSE SCHEMA (STRUCTURED OUTPUT)
+# ==============================
+#
+# Schema dikirim ke Gemini lewat response_schema supaya output
+# langsung JSON valid (tanpa markdown / teks tambahan).
+# Field number dibuat nullable: model mengisi null kalau tidak ada,
+# lalu normalize_nulls() mengubahnya ke string "null" sesuai aturan prompt.
+
+def field_schema(kind):
+    if kind == "number":
+        return {"type": "NUMBER", "nullable": True}
+    if kind == "integer":
+        return {"type": "INTEGER"}
+    return {"type": "STRING"}
+
+
+def object_schema(fields):
+    """
+    fields = [(nama, "string" | "number" | "integer"), ...]
+    Urutan field dipertahankan (property_ordering) → urutan kolom CSV sama.
+    """
+    names = [name for name, _ in fields]
+
+    return {
+        "type": "OBJECT",
+        "properties": {name: field_schema(kind) for name, kind in fields},
+        "required": names,
+        "property_ordering": names,
+    }
+
+
+def array_schema(item_schema):
+    return {"type": "ARRAY", "items": item_schema}
+
+
+def normalize_nulls(data):
+    """
+    JSON null → string "null" (rekursif), sama seperti output lama.
+    """
+    if isinstance(data, list):
+        return [normalize_nulls(x) for x in data]
+    if isinstance(data, dict):
+        return {k: ("null" if v is None else normalize_nulls(v)) for k, v in data.items()}
+    return data
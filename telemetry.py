@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from google.cloud import storage
+from config import *
+
+storage_client = storage.Client()
+
+_current_trace = contextvars.ContextVar("ocr_trace", default=None)
+
+# ==============================
+# JOB TRACE
+# ==============================
+
+class JobTrace:
+    """
+    Kumpulan span (stage / Gemini call) untuk 1 job.
+    Ditulis sebagai JSON lines: TRACE_DIR lokal dan gs://.../trace/{job_id}.jsonl
+    """
+
+    def __init__(self, job_id, invoice_name):
+        self.job_id = job_id
+        self.invoice_name = invoice_name
+        self.started = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, **attrs):
+        entry = {
+            "job_id": self.job_id,
+            "invoice": self.invoice_name,
+            "span": name,
+            "start": round(time.time() - duration - self.started, 3),
+            "duration": round(duration, 3),
+        }
+        entry.update({k: v for k, v in attrs.items() if v is not None})
+
+        with self._lock:
+            self.spans.append(entry)
+
+    def write(self):
+        with self._lock:
+            lines = "".join(json.dumps(s, default=str) + "\n" for s in self.spans)
+
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        local_path = os.path.join(TRACE_DIR, f"{self.job_id}.jsonl")
+        with open(local_path, "w", encoding="utf-8") as f:
+            f.write(lines)
+
+        blob_path = f"{TRACE_PREFIX}/{self.job_id}.jsonl"
+        storage_client.bucket(BUCKET_NAME).blob(blob_path).upload_from_string(
+            lines, content_type="application/x-ndjson"
+        )
+
+        return f"gs://{BUCKET_NAME}/{blob_path}"
+
+# ==============================
+# CONTEXT HELPERS
+# ==============================
+
+@contextmanager
+def job_trace(job_id, invoice_name):
+    trace = JobTrace(job_id, invoice_name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Catat durasi blok kode ke trace job yang aktif (no-op kalau tidak ada).
+    attrs yang di-yield bisa ditambah di dalam blok (bytes, token, dll).
+    """
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    error = None
+
+    try:
+        yield attrs
+    except Exception as e:
+        error = str(e)[:500]
+        raise
+    finally:
+        if trace is not None:
+            trace.record(name, time.perf_counter() - start, error=error, **attrs)
+
+
+def record_event(name, **attrs):
+    """
+    Catat event tanpa durasi (misal ringkasan ukuran batch).
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, 0.0, **attrs)
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """
+    executor.submit yang membawa trace job aktif ke thread worker.
+    """
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+# ==============================
+# SUMMARY
+# ==============================
+
+def load_trace(job_id):
+    blob = storage_client.bucket(BUCKET_NAME).get_blob(f"{TRACE_PREFIX}/{job_id}.jsonl")
+    if blob is None:
+        return []
+
+    return [
+        json.loads(line)
+        for line in blob.download_as_text().splitlines()
+        if line.strip()
+    ]
+
+
+def summarize_trace(spans):
+    """
+    Agregasi per nama span: jumlah, total durasi, token dan bytes.
+    """
+    summary = {}
+
+    for s in spans:
+        item = summary.setdefault(s["span"], {
+            "span": s["span"],
+            "count": 0,
+            "total_sec": 0.0,
+            "max_sec": 0.0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "bytes": 0,
+            "retries": 0,
+            "errors": 0,
+        })
+        item["count"] += 1
+        item["total_sec"] = round(item["total_sec"] + s.get("duration", 0), 3)
+        item["max_sec"] = round(max(item["max_sec"], s.get("duration", 0)), 3)
+        item["prompt_tokens"] += s.get("prompt_tokens") or 0
+        item["output_tokens"] += s.get("output_tokens") or 0
+        item["bytes"] += s.get("bytes") or 0
+        item["retries"] += max(0, (s.get("attempts") or 1) - 1)
+        item["errors"] += 1 if s.get("error") else 0
+
+    return sorted(summary.values(), key=lambda x: x["total_sec"], reverse=True)
+
+
+def trace_stats(spans):
+    """
+    Ringkasan 1 job untuk laporan CLI / benchmark: durasi total,
+    token Gemini, jumlah call, cache hit dan retry.
+    """
+    gemini = [s for s in spans if s["span"].startswith("gemini.")]
+    run = next((s for s in spans if s["span"] == "run_ocr"), None)
+
+    return {
+        "total_sec": run["duration"] if run else None,
+        "gemini_calls": len(gemini),
+        "cache_hits": sum(1 for s in gemini if s.get("cache_hit")),
+        "prompt_tokens": sum(s.get("prompt_tokens") or 0 for s in gemini),
+        "output_tokens": sum(s.get("output_tokens") or 0 for s in gemini),
+        "retries": sum(max(0, (s.get("attempts") or 1) - 1) for s in gemini),
+    }
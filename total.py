@@ -1,3 +1,5 @@
+from schema import object_schema, array_schema
+
 TOTAL_SYSTEM_INSTRUCTION = """
 ROLE:
 Anda adalah AI IDP professional
@@ -193,4 +195,57 @@ OUTPUT RESTRICTION
   - Penjelasan tambahan
   - Komentar
   - Field di luar skema
-"""
\ No newline at end of file
+"""
+
+# field & urutan sama dengan TOTAL OUTPUT SCHEMA di prompt
+TOTAL_FIELDS = [
+    ("match_score", "string"),
+    ("match_description", "string"),
+    ("inv_quantity", "number"),
+    ("inv_amount", "number"),
+    ("inv_amount_unit", "string"),
+    ("inv_total_quantity", "number"),
+    ("inv_total_amount", "number"),
+    ("inv_total_nw", "number"),
+    ("inv_total_gw", "number"),
+    ("inv_total_volume", "number"),
+    ("inv_total_package", "number"),
+    ("pl_package_unit", "string"),
+    ("pl_package_count", "number"),
+    ("pl_weight_unit", "string"),
+    ("pl_nw", "number"),
+    ("pl_gw", "number"),
+    ("pl_volume_unit", "string"),
+    ("pl_volume", "number"),
+    ("pl_total_quantity", "number"),
+    ("pl_total_amount", "number"),
+    ("pl_total_nw", "number"),
+    ("pl_total_gw", "number"),
+    ("pl_total_volume", "number"),
+    ("pl_total_package", "number"),
+    ("po_quantity", "number"),
+    ("po_price", "number"),
+    ("bl_shipper_name", "string"),
+    ("bl_shipper_address", "string"),
+    ("bl_no", "string"),
+    ("bl_date", "string"),
+    ("bl_consignee_name", "string"),
+    ("bl_consignee_address", "string"),
+    ("bl_consignee_tax_id", "string"),
+    ("bl_seller_name", "string"),
+    ("bl_seller_address", "string"),
+    ("bl_lc_number", "string"),
+    ("bl_notify_party", "string"),
+    ("bl_vessel", "string"),
+    ("bl_voyage_no", "string"),
+    ("bl_port_of_loading", "string"),
+    ("bl_port_of_destination", "string"),
+    ("bl_gw_unit", "string"),
+    ("bl_gw", "number"),
+    ("bl_volume_unit", "string"),
+    ("bl_volume", "number"),
+    ("bl_package_count", "number"),
+    ("bl_package_unit", "string"),
+]
+
+TOTAL_RESPONSE_SCHEMA = array_schema(object_schema(TOTAL_FIELDS))
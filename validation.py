@@ -0,0 +1,326 @@
+import threading
+from config import *
+from rules import RULE_DOCUMENTS, DETAIL_RULES
+
+# ==============================
+# HELPER VALIDATION (aman)
+# ==============================
+
+def _init_match_fields(detail_rows):
+    for row in detail_rows:
+        row["match_score"] = "true"
+        row["match_description"] = "null"
+    return detail_rows
+
+
+def _add_error(row, message):
+    row["match_score"] = "false"
+
+    if row.get("match_description") in (None, "", "null"):
+        row["match_description"] = message
+    else:
+        row["match_description"] += "; " + message
+
+
+def _to_float(x):
+    try:
+        return float(str(x).replace(",", "").strip())
+    except:
+        return None
+
+# ==============================
+# VALIDATION ENGINE (RULE TABLE → CHECKER PER DOKUMEN)
+# ==============================
+#
+# Pengganti rantai _init_match_fields → _validate_invoice → ... → _validate_coo.
+# Output match_score / match_description SAMA PERSIS dengan versi lama
+# (termasuk urutan pesan error per row), tapi:
+# - rule dideklarasikan di rules.py, dikompilasi 1x menjadi fungsi step
+#   per rule dan 1 checker per dokumen (1 kunjungan row untuk semua rule)
+# - field numeric di-parse sekali per row ke array per kolom
+# - semua total dihitung sekali
+# - error dikumpulkan per row lalu di-join sekali
+# Versi lama ada di bench_validation.py sebagai referensi perilaku.
+
+NULL_VALUES = (None, "", "null")
+
+DEFAULT_MESSAGES = {
+    "mandatory": "{field} tidak boleh null{null_suffix}",
+    "product": "{field} ({value}) tidak sesuai dengan perhitungan ({a} x {b} = {calc})",
+    "column_total": "{field} ({value}) tidak sesuai dengan total hasil perhitungan ({calc})",
+    "equal": "{field} tidak sama dengan {other}",
+    "equal_text": "{field} tidak sama dengan {other}",
+    "equal_number": "{field} ({value}) tidak sama dengan {other} ({other_value})",
+    "equal_unit": "{field} ({value}) tidak sama dengan {other} ({other_value})",
+    "required_if": "{field} wajib jika {when_field} = {equals}",
+}
+
+
+def rule_id(rule):
+    return rule.get("id") or f"{rule['doc']}.{rule['check']}.{rule['field']}"
+
+
+class _KeepPlaceholder(dict):
+    # placeholder runtime ({value}, {calc}, ...) dibiarkan untuk .format() di checker
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def _parse_number(x):
+    """
+    Sama dengan _to_float, tapi tanpa str() + try/except untuk
+    nilai yang paling sering muncul (angka JSON dan "null").
+    """
+    t = type(x)
+    if t is float:
+        return x
+    if t is int:
+        return float(x)
+    if x is None or x == "null" or x == "":
+        return None
+    return _to_float(x)
+
+
+def _column_sum(values):
+    # urutan penjumlahan sama dengan loop lama → hasil float identik
+    total = 0.0
+    for v in values:
+        if v is not None:
+            total += v
+    return round(total, 2)
+
+
+class CompiledRules:
+    """
+    Hasil kompilasi rule table untuk 1 set rule aktif:
+    - checkers: [(doc, fungsi, rule_ids)] urut sesuai RULE_DOCUMENTS
+    - numeric_fields: field yang perlu di-parse ke array numeric
+    - totals: [(field, sum_of, when_any)] untuk rule column_total
+
+    Setiap rule menjadi 1 fungsi step(i, row, get, errors_row) (closure,
+    tanpa code generation), 1 checker per dokumen menjalankan semua step
+    dokumen tersebut dalam 1 kunjungan row.
+    """
+
+    def __init__(self, rules, documents):
+        self.rule_ids = [rule_id(r) for r in rules]
+        self.numeric_fields = []
+        self.totals = []
+        self.checkers = []
+
+        for doc in documents:
+            doc_rules = [r for r in rules if r["doc"] == doc["doc"]]
+            if doc_rules:
+                self.checkers.append(self._compile_doc(doc, doc_rules))
+
+    def _numeric(self, field):
+        if field not in self.numeric_fields:
+            self.numeric_fields.append(field)
+        return field
+
+    def _compile_doc(self, doc, rules):
+        # binder(num, totals) → step; kolom numeric & total baru ada saat validasi
+        binders = []
+
+        for rule in rules:
+            template = rule.get("message") or DEFAULT_MESSAGES.get(rule["check"], "")
+            message = template.format_map(_KeepPlaceholder(rule, null_suffix=doc["null_suffix"]))
+            binders.append(self._compile_rule(rule, message))
+
+        scope = doc["scope"]
+
+        def check(rows, num, totals, errors):
+            steps = [bind(num, totals) for bind in binders]
+
+            for i, row in enumerate(rows):
+                get = row.get
+                if scope and get(scope) in NULL_VALUES:
+                    continue
+                e = errors[i]
+                for step in steps:
+                    step(i, row, get, e)
+
+        check.__name__ = f"check_{doc['doc']}"
+
+        return doc["doc"], check, [rule_id(r) for r in rules]
+
+    def _compile_rule(self, rule, message):
+        check = rule["check"]
+        field = rule["field"]
+
+        if check == "mandatory":
+            def step(i, row, get, e):
+                if get(field) in NULL_VALUES:
+                    e.append(message)
+            return lambda num, totals: step
+
+        if check == "product":
+            fa, fb = (self._numeric(f) for f in rule["factors"])
+            fv = self._numeric(field)
+
+            def bind(num, totals):
+                col_a, col_b, col_v = num[fa], num[fb], num[fv]
+
+                def step(i, row, get, e):
+                    a, b, v = col_a[i], col_b[i], col_v[i]
+                    if a is not None and b is not None and v is not None:
+                        calc = round(a * b, 2)
+                        if round(v, 2) != calc:
+                            e.append(message.format(value=v, a=a, b=b, calc=calc))
+                return step
+            return bind
+
+        if check == "column_total":
+            fv = self._numeric(field)
+            self._numeric(rule["sum_of"])
+            self.totals.append((field, rule["sum_of"], rule.get("when_any")))
+
+            def bind(num, totals):
+                col_v, total = num[fv], totals.get(field)
+
+                def step(i, row, get, e):
+                    v = col_v[i]
+                    if v is not None and total is not None and v != total and round(v, 2) != total:
+                        e.append(message.format(value=v, calc=total))
+                return step
+            return bind
+
+        if check == "equal":
+            other = rule["other"]
+
+            def step(i, row, get, e):
+                if get(field) != get(other):
+                    e.append(message)
+            return lambda num, totals: step
+
+        if check == "equal_text":
+            other = rule["other"]
+
+            def step(i, row, get, e):
+                if str(get(field, "")).strip().lower() != str(get(other, "")).strip().lower():
+                    e.append(message)
+            return lambda num, totals: step
+
+        if check == "equal_number":
+            fv, fo = self._numeric(field), self._numeric(rule["other"])
+
+            def bind(num, totals):
+                col_v, col_o = num[fv], num[fo]
+
+                def step(i, row, get, e):
+                    a, b = col_v[i], col_o[i]
+                    if a is not None and b is not None and round(a, 2) != round(b, 2):
+                        e.append(message.format(value=a, other_value=b))
+                return step
+            return bind
+
+        if check == "equal_unit":
+            other = rule["other"]
+
+            def step(i, row, get, e):
+                a = str(get(field) or "").strip()
+                b = str(get(other) or "").strip()
+                if a and b and a != b:
+                    e.append(message.format(value=a, other_value=b))
+            return lambda num, totals: step
+
+        if check == "required_if":
+            when_field, equals = rule["when_field"], rule["equals"]
+
+            def step(i, row, get, e):
+                if str(get(when_field, "")).strip().upper() == equals and get(field) in NULL_VALUES:
+                    e.append(message)
+            return lambda num, totals: step
+
+        if check == "fallback":
+            source = rule["source"]
+
+            def step(i, row, get, e):
+                if get(field) in NULL_VALUES:
+                    row[field] = get(source)
+            return lambda num, totals: step
+
+        raise Exception(f"Jenis rule tidak dikenal: {check} ({rule_id(rule)})")
+
+
+def _active_rules(customer=None):
+    """
+    Rule aktif = rule default (enabled != False), lalu override customer
+    (RULE_OVERRIDES[customer]: disable / enable berdasarkan id rule).
+    """
+    override = RULE_OVERRIDES.get(customer, {}) if customer else {}
+    disabled = set(override.get("disable", []))
+    enabled = set(override.get("enable", []))
+
+    known = {rule_id(r) for r in DETAIL_RULES}
+    unknown = (disabled | enabled) - known
+    if unknown:
+        raise Exception(f"Rule override customer {customer} tidak dikenal: {sorted(unknown)}")
+
+    return [
+        r for r in DETAIL_RULES
+        if rule_id(r) not in disabled
+        and (r.get("enabled", True) or rule_id(r) in enabled)
+    ]
+
+
+_compiled_lock = threading.Lock()
+_compiled = {}
+
+
+def get_compiled_rules(customer=None):
+    """
+    Checker hasil kompilasi, di-cache per customer
+    (customer tanpa override memakai checker default).
+    """
+    key = customer if customer in RULE_OVERRIDES else None
+
+    with _compiled_lock:
+        if key not in _compiled:
+            _compiled[key] = CompiledRules(_active_rules(key), RULE_DOCUMENTS)
+        return _compiled[key]
+
+
+# kompilasi rule default saat startup (error di rule table langsung ketahuan)
+get_compiled_rules()
+
+
+def validate_detail_rows(detail_rows, customer=None):
+    """
+    Jalankan seluruh validasi dokumen (invoice, PL, BL, COO) sekaligus.
+    Mengisi match_score / match_description dan fallback seller BL,
+    return list yang sama (di-mutate in place).
+    """
+    compiled = get_compiled_rules(customer)
+
+    # urutan key row (→ kolom CSV) sama dengan versi lama
+    _init_match_fields(detail_rows)
+
+    # -------- PASS 1: parse numeric sekali per row → array per kolom --------
+    num = {}
+    for f in compiled.numeric_fields:
+        num[f] = [
+            x if type(x) is float else _parse_number(x)
+            for x in [row.get(f) for row in detail_rows]
+        ]
+
+    # -------- TOTAL (sekali untuk semua rule) --------
+    totals = {}
+    for field, sum_of, when_any in compiled.totals:
+        if when_any and not any(row.get(when_any) not in NULL_VALUES for row in detail_rows):
+            continue
+        totals[field] = _column_sum(num[sum_of])
+
+    # -------- RULE PER DOKUMEN (1 kunjungan row per checker) --------
+    errors = [[] for _ in detail_rows]
+
+    for _, check, _ in compiled.checkers:
+        check(detail_rows, num, totals, errors)
+
+    # -------- TULIS HASIL (1x per row) --------
+    for row, errs in zip(detail_rows, errors):
+        if errs:
+            row["match_score"] = "false"
+            row["match_description"] = "; ".join(errs)
+
+    return detail_rows